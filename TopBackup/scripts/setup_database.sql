@@ -43,6 +43,7 @@ CREATE TABLE IF NOT EXISTS LOG_BACKUPS (
     STATUS            CHAR(1) NOT NULL DEFAULT 'P',             -- P=Pendente, E=Executando, S=Sucesso, F=Falha
     MENSAGEM_ERRO     TEXT,
     TIPO_BACKUP       CHAR(1),                                  -- V=Versionado, S=Semanal, U=Único
+    CODEC             VARCHAR(20),                              -- Codec de compressão (deflate-6, zstd-3, lzma...)
     ENVIADO_FTP       CHAR(1) DEFAULT 'N',
     DATA_ENVIO_FTP    DATETIME,
     FOREIGN KEY (ID_EMPRESA) REFERENCES EMPRESA(ID) ON DELETE CASCADE,
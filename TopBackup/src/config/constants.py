@@ -15,6 +15,21 @@ BACKUP_TIMEOUT = 3600  # 1 hora para backups grandes
 # Tamanhos de buffer
 IPC_BUFFER_SIZE = 65536
 FTP_CHUNK_SIZE = 8192
+FTP_CHECKPOINT_BYTES = 16 * 1024 * 1024  # Intervalo de gravação do checkpoint do upload
+FTP_UPLOAD_ATTEMPTS = 5                  # Tentativas do upload (cada uma retoma de onde parou)
+FTP_KEEPALIVE_INTERVAL = 60              # NOOP nas sessões FTP ociosas
+FTP_IDLE_TIMEOUT = 600                   # Sessão ociosa além disso é fechada
+FTP_CHECK_AFTER = 15                     # Sessão parada há mais tempo é testada antes do uso
+MYSQL_POOL_SIZE = 4                      # Conexões MySQL abertas ao mesmo tempo
+MYSQL_POOL_WAIT = 30                     # Espera máxima por uma conexão livre do pool
+MYSQL_POOL_IDLE_TIMEOUT = 300            # Conexão MySQL ociosa além disso é fechada
+MYSQL_POOL_CHECK_AFTER = 30              # Conexão parada há mais tempo recebe ping antes do uso
+MYSQL_SCHEMA_LOCK_WAIT = 30              # Espera pelo lock das migrações (outro cliente migrando)
+HEARTBEAT_JITTER = 0.1                   # Variação aleatória do intervalo do heartbeat (±10%)
+HEARTBEAT_STARTUP_DELAY = 60             # Primeiro heartbeat em até 60s após iniciar (aleatório)
+HEARTBEAT_PIGGYBACK = 0.5                # Fração do intervalo a partir da qual vai junto de outra gravação
+STREAM_CHUNK_SIZE = 1024 * 1024  # 1MB por leitura do stdout do gbak
+STREAM_QUEUE_SIZE = 16           # Máximo de blocos em memória (buffer limitado)
 
 # Dias da semana (Firebird → Python)
 DIAS_SEMANA = {
@@ -60,6 +75,7 @@ UPDATE_DIR_NAME = "topbackup_update"
 # Extensões de arquivo
 BACKUP_EXTENSION = ".fbk"
 ZIP_EXTENSION = ".zip"
+NBACKUP_EXTENSION = ".nbk"
 
 # Retry configuration
 MAX_RETRIES = 3
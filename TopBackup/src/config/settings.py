@@ -6,7 +6,7 @@ Carrega e salva config.json
 import json
 import os
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from dataclasses import dataclass, asdict, field
 
 
@@ -39,6 +39,9 @@ class FTPConfig:
     password: str = ""
     remote_path: str = "/backups"
     passive_mode: bool = True
+    retencao_remota: bool = False  # Aplica a retenção do backup também aos arquivos no FTP
+    conexoes_paralelas: int = 1  # Máximo de conexões do upload em partes (1 = upload simples)
+    upload_paralelo_min_mb: int = 512  # Tamanho mínimo do arquivo para enviar em partes
 
 
 @dataclass
@@ -50,6 +53,9 @@ class AppConfig:
     auto_update: bool = True
     empresa_id: Optional[int] = None
     empresa_cnpj: str = ""
+    limite_banda_kbps: int = 0  # Limite de banda da rede (FTP, destino 2 em rede, atualizações); 0 = sem limite
+    janelas_banda: List[dict] = field(default_factory=list)  # Limites por horário: {"inicio", "fim", "kbps"}
+    intervalo_heartbeat_minutos: int = 10  # Registro da interação da empresa no MySQL (no máximo um por intervalo)
 
 
 @dataclass
@@ -61,6 +67,24 @@ class BackupConfig:
     prefixo_backup: str = "V"  # V=Versionado, S=Semanal, U=Unico
     compactar_zip: bool = True
     verificar_backup: bool = True
+    streaming_gbak: bool = False  # gbak escreve em stdout direto para o ZIP (sem .fbk temporário)
+    verificar_espaco: bool = True  # Confere o espaço livre (temporário e destinos) antes do gbak
+    compressao_threads: int = 0  # Threads de compressão (0 = automático, 1 = desativa paralelismo)
+    compressao_bloco_kb: int = 1024  # Tamanho do bloco da compressão paralela
+    compressao_codec: str = "deflate-6"  # deflate-1/6/9, lzma, zstd-3/9/19 ou "auto"
+    janela_backup_minutos: int = 120  # Tempo máximo de compressão usado pelo modo "auto"
+    repositorio_dedup: bool = False  # Backups "V" em repositório com deduplicação (chunks + manifestos)
+    modo_incremental: bool = False  # Usa nbackup (físico, níveis 0/1/2) no lugar do gbak
+    nbackup_dia_nivel0: str = "DOM"  # Dia do backup completo (nível 0)
+    nbackup_dia_nivel1: str = ""  # Dia do nível 1 ("" = todos os outros dias são nível 1)
+    backups_simultaneos: int = 2  # Backups de bancos diferentes rodando ao mesmo tempo
+    limite_por_disco_origem: int = 1  # Backups simultâneos lendo do mesmo disco
+    limite_por_volume_destino: int = 2  # Backups simultâneos gravando no mesmo volume
+    hardlink_destino2: bool = False  # Destino 2 no mesmo volume do destino 1 vira hardlink
+    retencao_diarios: int = 0  # Backups versionados mantidos: um por dia dos últimos N dias
+    retencao_semanais: int = 0  # Um por semana das últimas N semanas
+    retencao_mensais: int = 0  # Um por mês dos últimos N meses (0 nos três = mantém tudo)
+    retencao_max_gb: float = 0  # Espaço máximo por destino (0 = sem limite)
 
 
 @dataclass
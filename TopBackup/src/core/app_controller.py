@@ -4,20 +4,35 @@ Orquestra todos os componentes do aplicativo
 """
 
 import threading
+from dataclasses import replace
 from datetime import datetime
-from typing import Optional, Callable, List
+from typing import Optional, Callable, List, Tuple
 from enum import Enum
 
 from .backup_engine import BackupEngine, BackupResult
+from .backup_pool import BackupPool
+from .heartbeat import Heartbeat
+from .job_queue import JobQueue, BackupJob
+from .upload_outbox import UploadOutbox, UploadItem
+from .progress import ProgressEvent
+from .retention import RetentionEngine
 from .scheduler import BackupScheduler
 from ..config.settings import Settings
 from ..database.firebird_client import FirebirdClient
 from ..database.mysql_client import MySQLClient
 from ..database.sync_manager import SyncManager
-from ..database.models import Empresa, AgendaBackup, LogBackup
+from ..database.models import Empresa, AgendaBackup, LogBackup, StatusBackup
+from ..database.catalog import BackupCatalog
+from ..database.write_journal import WriteJournal
+from ..network.bandwidth import configure_bandwidth
 from ..network.ftp_client import FTPClient
 from ..network.update_checker import UpdateChecker
 from ..utils.logger import get_logger
+from ..utils.file_utils import FileUtils
+from ..utils.compression_codecs import CompressionStats
+
+# Tipos de agenda que reaproveitam o nome do arquivo (Único e Semanal)
+TIPOS_NOME_FIXO = ('U', 'S')
 
 
 class AppState(Enum):
@@ -45,17 +60,32 @@ class AppController:
         # Callbacks para UI
         self._state_callback: Optional[Callable[[AppState], None]] = None
         self._backup_progress_callback: Optional[Callable[[str], None]] = None
+        self._progress_event_callback: Optional[Callable[[ProgressEvent], None]] = None
         self._notification_callback: Optional[Callable[[str, str], None]] = None
 
         # Componentes (inicializados posteriormente)
         self._firebird: Optional[FirebirdClient] = None
         self._mysql: Optional[MySQLClient] = None
+        self._journal: Optional[WriteJournal] = None
+        self._heartbeat: Optional[Heartbeat] = None
         self._sync_manager: Optional[SyncManager] = None
-        self._backup_engine: Optional[BackupEngine] = None
+        self._backup_pool: Optional[BackupPool] = None
+        self._job_queue: Optional[JobQueue] = None
+        self._compression_stats: Optional[CompressionStats] = None
+        self._catalog: Optional[BackupCatalog] = None
         self._scheduler: Optional[BackupScheduler] = None
         self._ftp_client: Optional[FTPClient] = None
+        self._upload_outbox: Optional[UploadOutbox] = None
         self._update_checker: Optional[UpdateChecker] = None
 
+        # MySQL fora do ar na inicialização: schema e empresa ficam para a
+        # próxima sincronização agendada
+        self._mysql_pending = False
+
+        # Backups em execução (um BackupEngine por job)
+        self._backups_lock = threading.Lock()
+        self._active_engines: List[BackupEngine] = []
+
         # Dados em cache
         self._empresa: Optional[Empresa] = None
         self._agenda: Optional[AgendaBackup] = None
@@ -70,6 +100,10 @@ class AppController:
         """Define callback para progresso do backup"""
         self._backup_progress_callback = callback
 
+    def set_progress_event_callback(self, callback: Callable[[ProgressEvent], None]):
+        """Define callback para eventos de progresso (bytes, throughput e ETA)"""
+        self._progress_event_callback = callback
+
     def set_notification_callback(self, callback: Callable[[str, str], None]):
         """Define callback para notificações (titulo, mensagem)"""
         self._notification_callback = callback
@@ -107,14 +141,27 @@ class AppController:
             if not success:
                 return False, f"Erro de conexão Firebird: {msg}"
 
-            # Inicializa MySQL
+            # Inicializa MySQL (fora do ar não segura os backups: as gravações
+            # vão para o diário e o flusher envia quando o link voltar)
             self._mysql = MySQLClient(self.settings.mysql)
             success, msg = self._mysql.test_connection()
-            if not success:
-                return False, f"Erro de conexão MySQL: {msg}"
+            if success:
+                # Garante schema atualizado
+                self._mysql.ensure_schema()
+            else:
+                self.logger.warning(f"MySQL indisponível na inicialização: {msg}")
+                self._mysql_pending = True
 
-            # Garante schema atualizado
-            self._mysql.ensure_schema()
+            # Logs de backup e interação passam pelo diário local (enviados em segundo plano)
+            self._journal = WriteJournal(
+                FileUtils.get_data_directory() / "mysql_journal.db", self._mysql
+            )
+            # Interação da empresa: no máximo um registro por intervalo, com jitter
+            self._heartbeat = Heartbeat(
+                self._journal,
+                lambda: self.settings.app.empresa_id,
+                self.settings.app.intervalo_heartbeat_minutos * 60
+            )
 
             # Inicializa SyncManager
             self._sync_manager = SyncManager(
@@ -126,7 +173,13 @@ class AppController:
             # Sincroniza empresa
             success, msg, empresa_id = self._sync_manager.sync_empresa()
             if not success:
-                return False, f"Erro ao sincronizar empresa: {msg}"
+                if not self._has_cached_empresa():
+                    return False, f"Erro ao sincronizar empresa: {msg}"
+                self.logger.warning(
+                    f"Empresa não sincronizada, usando ID salvo "
+                    f"({self.settings.app.empresa_id}): {msg}"
+                )
+                self._mysql_pending = True
 
             # Sincroniza agenda
             success, msg = self._sync_manager.sync_agenda()
@@ -137,9 +190,24 @@ class AppController:
             self._empresa = self._sync_manager.get_empresa_local()
             self._agenda = self._sync_manager.get_agenda()
 
-            # Inicializa BackupEngine
-            self._backup_engine = BackupEngine(self.settings, self._mysql)
-            self._backup_engine.set_progress_callback(self._on_backup_progress)
+            # Inicializa pool de backups (um BackupEngine por job)
+            self._backup_pool = BackupPool(
+                max_workers=self.settings.backup.backups_simultaneos,
+                per_source_disk=self.settings.backup.limite_por_disco_origem,
+                per_destination=self.settings.backup.limite_por_volume_destino
+            )
+            self._compression_stats = CompressionStats(
+                FileUtils.get_data_directory() / "compression_stats.json"
+            )
+            self._catalog = BackupCatalog(FileUtils.get_data_directory() / "catalogo.db")
+
+            # Fila única de backups (agendados, manuais, IPC e tray)
+            self._job_queue = JobQueue(
+                FileUtils.get_data_directory() / "job_queue.db",
+                self._backup_pool,
+                runner=self._run_job,
+                resolver=self._resolve_job
+            )
 
             # Inicializa Scheduler
             self._scheduler = BackupScheduler(self.settings)
@@ -157,9 +225,18 @@ class AppController:
             # Configura jobs do sistema
             self._scheduler.configure_system_jobs()
 
+            # Limite de banda das transferências (FTP, destino 2 em rede, atualizações)
+            self._apply_bandwidth()
+
             # Inicializa FTP (se configurado)
             if self.settings.backup.backup_remoto and self.settings.ftp.host:
                 self._ftp_client = FTPClient(self.settings.ftp)
+                # Envios em segundo plano: o próximo backup não espera o FTP
+                self._upload_outbox = UploadOutbox(
+                    FileUtils.get_data_directory() / "upload_outbox.db",
+                    uploader=self._outbox_upload,
+                    on_done=self._on_upload_done
+                )
 
             # Inicializa Update Checker
             self._update_checker = UpdateChecker(self._mysql, self.settings)
@@ -178,9 +255,21 @@ class AppController:
         if self._scheduler:
             self._scheduler.start()
 
-        # Atualiza interação no início (substitui heartbeat)
-        if self._mysql and self.settings.app.empresa_id:
-            self._mysql.update_empresa_interacao(self.settings.app.empresa_id)
+        # Despacha também os pedidos que ficaram pendentes antes do reinício
+        if self._job_queue:
+            self._job_queue.start()
+
+        # Envios FTP pendentes de antes do reinício continuam de onde pararam
+        if self._upload_outbox:
+            self._upload_outbox.start()
+
+        # Gravações no MySQL de antes do reinício continuam a ser enviadas
+        if self._journal:
+            self._journal.start()
+
+        # Interação no início (primeiro minuto, com jitter) e depois periódica
+        if self._heartbeat:
+            self._heartbeat.start()
 
         self._set_state(AppState.RUNNING)
         self.logger.info("Aplicativo iniciado")
@@ -195,6 +284,27 @@ class AppController:
         if self._scheduler:
             self._scheduler.stop()
 
+        if self._job_queue:
+            self._job_queue.stop()
+
+        if self._upload_outbox:
+            self._upload_outbox.stop()
+
+        if self._heartbeat:
+            self._heartbeat.stop()
+
+        if self._journal:
+            self._journal.stop()
+
+        if self._ftp_client:
+            self._ftp_client.close()
+
+        if self._mysql:
+            self._mysql.close()
+
+        if self._backup_pool:
+            self._backup_pool.shutdown(wait=False)
+
         self._set_state(AppState.STOPPED)
         self.logger.info("Aplicativo parado")
 
@@ -213,41 +323,104 @@ class AppController:
     # ============ BACKUP ============
 
     def execute_backup_manual(self) -> BackupResult:
-        """Executa backup manual"""
-        if self._state == AppState.BACKUP_RUNNING:
-            return BackupResult(
-                success=False,
-                message="Backup já em execução"
-            )
-
+        """Executa backup manual da agenda principal"""
         return self._execute_backup(manual=True)
 
-    def _execute_backup(self, manual: bool = False) -> BackupResult:
-        """Executa backup"""
-        if not self._backup_engine or not self._empresa or not self._agenda:
+    def _execute_backup(
+        self,
+        manual: bool = False,
+        agenda: Optional[AgendaBackup] = None
+    ) -> BackupResult:
+        """Coloca o backup na fila e aguarda o resultado"""
+        job_id = self._enqueue_backup(agenda, manual)
+        if isinstance(job_id, BackupResult):
+            return job_id
+        return self._job_queue.wait(job_id)
+
+    def _enqueue_backup(
+        self,
+        agenda: Optional[AgendaBackup],
+        manual: bool
+    ):
+        """
+        Coloca backup de uma agenda na fila
+
+        Pedidos repetidos para o mesmo banco são mesclados pela fila.
+
+        Returns:
+            ID do job, ou BackupResult com o motivo da recusa
+        """
+        agenda = self._prepare_agenda(agenda)
+        if not self._job_queue or not self._empresa or not agenda:
             return BackupResult(
                 success=False,
                 message="Componentes não inicializados"
             )
 
+        return self._job_queue.enqueue(agenda, manual=manual)
+
+    def _resolve_job(self, agenda: AgendaBackup) -> Tuple[str, str]:
+        """Banco de origem e destino principal de uma agenda (chaves da fila e do pool)"""
+        database_path, _ = BackupEngine.resolve_database(self.settings, agenda)
+        destination = agenda.local_destino1 or self.settings.backup.local_destino1
+        return database_path, destination
+
+    def _run_job(self, job: BackupJob) -> BackupResult:
+        """Executa um job da fila (thread do pool)"""
+        engine = BackupEngine(
+            self.settings, self._mysql, self._compression_stats, self._catalog, self._journal
+        )
+        engine.set_progress_callback(self._on_backup_progress)
+        engine.set_progress_event_callback(self._on_progress_event)
+        return self._run_backup(engine, job.agenda, job.manual)
+
+    def _prepare_agenda(self, agenda: Optional[AgendaBackup]) -> Optional[AgendaBackup]:
+        """
+        Agenda efetiva do backup
+
+        Sem agenda usa a principal. Para o banco principal a config local
+        tem prioridade nos destinos (mesma regra do SyncManager); outros
+        bancos usam os destinos da própria agenda.
+        """
+        if agenda is None:
+            return self._agenda
+
+        banco = agenda.banco_origem or ""
+        if banco and banco.lower() != self.settings.firebird.database_path.lower():
+            return agenda
+
+        return replace(
+            agenda,
+            local_destino1=self.settings.backup.local_destino1 or agenda.local_destino1,
+            local_destino2=self.settings.backup.local_destino2 or agenda.local_destino2
+        )
+
+    def _run_backup(self, engine: BackupEngine, agenda: AgendaBackup, manual: bool) -> BackupResult:
+        """Executa um backup (thread do pool)"""
+        with self._backups_lock:
+            self._active_engines.append(engine)
         self._set_state(AppState.BACKUP_RUNNING)
 
         try:
-            result = self._backup_engine.execute_backup(
+            result = engine.execute_backup(
                 self._empresa,
-                self._agenda,
+                agenda,
                 manual=manual
             )
 
             self._last_backup_result = result
 
-            # Atualiza interação após backup
-            if result.success and self._mysql and self.settings.app.empresa_id:
-                self._mysql.update_empresa_interacao(self.settings.app.empresa_id)
+            # Atualiza interação após backup (se não houve registro dentro do intervalo)
+            if result.success and self._heartbeat:
+                self._heartbeat.beat()
 
-            # Upload FTP se configurado
+            # Upload FTP se configurado (fila em segundo plano)
             if result.success and self.settings.backup.backup_remoto:
-                self._upload_ftp(result)
+                self._enqueue_upload(result, agenda)
+
+            # Retenção logo após o backup: libera espaço antes do próximo
+            if result.success:
+                self._apply_retention(engine.database_path)
 
             # Notificação de backup removida - app silencioso (v1.0.6)
             # O log já registra automaticamente via BackupEngine
@@ -255,37 +428,120 @@ class AppController:
             return result
 
         finally:
-            self._set_state(AppState.RUNNING)
-            # Sinaliza fim do progresso para esconder a barra na UI
-            if self._backup_progress_callback:
-                self._backup_progress_callback("")
+            with self._backups_lock:
+                self._active_engines.remove(engine)
+                remaining = len(self._active_engines)
+
+            if not remaining:
+                self._set_state(AppState.RUNNING)
+                # Sinaliza fim do progresso para esconder a barra na UI
+                if self._backup_progress_callback:
+                    self._backup_progress_callback("")
 
     def cancel_backup(self):
-        """Cancela backup em execução"""
-        if self._backup_engine:
-            self._backup_engine.cancel()
+        """Cancela backups em execução"""
+        with self._backups_lock:
+            engines = list(self._active_engines)
+        for engine in engines:
+            engine.cancel()
+
+    def _enqueue_upload(self, result: BackupResult, agenda: AgendaBackup):
+        """Coloca o backup na fila de envio FTP"""
+        if not self._upload_outbox or not result.caminho:
+            return
 
-    def _upload_ftp(self, result: BackupResult):
-        """Upload para FTP"""
-        if not self._ftp_client or not result.caminho:
+        if result.dedup:
+            # Manifesto sem os chunks não serve como backup remoto
+            self.logger.info("Backup no repositório dedup: envio FTP ignorado")
             return
 
-        success, msg = self._ftp_client.upload(result.caminho)
+        self._upload_outbox.enqueue(
+            result.caminho,
+            sha256=result.hash_sha256,
+            log_id=result.log_id,
+            chave_log=result.log_chave,
+            # Nome fixo: o próximo backup substitui o arquivo durante o envio
+            copiar=agenda.prefixo_backup in TIPOS_NOME_FIXO
+        )
+
+    def _outbox_upload(self, item: UploadItem) -> Tuple[bool, str]:
+        """Envia um item da fila (sessão própria do pool do FTPClient)"""
+        return self._ftp_client.upload(item.origem, item.remoto, sha256=item.sha256)
+
+    def _on_upload_done(self, item: UploadItem, enviado_em: datetime) -> bool:
+        """Registra o envio no catálogo e no LOG_BACKUPS"""
+        if self._catalog:
+            self._catalog.mark_uploaded(item.caminho, item.remoto)
+            self._apply_remote_retention(item.caminho)
+        if self._journal and item.chave_log:
+            self._journal.update_log_ftp(item.chave_log, enviado_em)
+        elif self._mysql and item.log_id:
+            # Envio de antes do diário local
+            return self._mysql.update_log_ftp(item.log_id, enviado_em)
+        return True
+
+    def _apply_retention(self, database_path: str):
+        """Remove backups antigos conforme a política de retenção"""
+        if not self._catalog:
+            return
+        try:
+            # Só local: o FTP fica com a fila de envio (_apply_remote_retention)
+            result = RetentionEngine(self.settings, self._catalog).apply(database_path)
+            for erro in result.erros:
+                self.logger.warning(f"Retenção: {erro}")
+        except Exception as e:
+            self.logger.error(f"Erro na retenção de backups: {e}")
 
-        if success:
-            self.logger.ftp_success(result.arquivo or "")
-        else:
-            self.logger.ftp_error(result.arquivo or "", msg)
+    def _apply_remote_retention(self, caminho: str):
+        """Retenção no FTP depois de cada envio (thread da fila, não segura o backup)"""
+        try:
+            entry = self._catalog.find_by_path(caminho)
+            if not entry:
+                return
+            result = RetentionEngine(
+                self.settings, self._catalog, self._ftp_client
+            ).apply_remote(entry.banco)
+            for erro in result.erros:
+                self.logger.warning(f"Retenção FTP: {erro}")
+        except Exception as e:
+            self.logger.error(f"Erro na retenção do FTP: {e}")
 
     # ============ CALLBACKS DO SCHEDULER ============
 
-    def _on_scheduled_backup(self):
-        """Callback para backup agendado"""
-        self._execute_backup(manual=False)
+    def _on_scheduled_backup(self, agenda: Optional[AgendaBackup] = None):
+        """Callback para backup agendado (não bloqueia a thread do scheduler)"""
+        job_id = self._enqueue_backup(agenda, manual=False)
+        if isinstance(job_id, BackupResult):
+            self.logger.warning(f"Backup agendado não executado: {job_id.message}")
+
+    def _has_cached_empresa(self) -> bool:
+        """ID da empresa já salvo e da mesma empresa do Firebird (mesmo CNPJ)"""
+        empresa = self._sync_manager.get_empresa_local()
+        return bool(
+            self.settings.app.empresa_id
+            and empresa and empresa.cnpj
+            and empresa.cnpj == self.settings.app.empresa_cnpj
+        )
+
+    def _retry_mysql(self):
+        """Completa o que ficou pendente do MySQL na inicialização (schema e empresa)"""
+        success, _ = self._mysql.test_connection()
+        if not success:
+            return
+
+        self._mysql.ensure_schema()
+        success, msg, _ = self._sync_manager.sync_empresa()
+        if success:
+            self._mysql_pending = False
+            self.logger.info("MySQL disponível, schema e empresa sincronizados")
+        else:
+            self.logger.warning(f"Empresa não sincronizada: {msg}")
 
     def _on_sync_schedule(self):
         """Callback para sincronização"""
         if self._sync_manager:
+            if self._mysql_pending:
+                self._retry_mysql()
             self._sync_manager.sync_agenda()
             self._agenda = self._sync_manager.get_agenda()
 
@@ -298,11 +554,6 @@ class AppController:
 
     def _on_update_schedule(self):
         """Callback para verificação de updates"""
-        # Atualiza DATA_ULTIMA_INTERACAO a cada verificação (independente de haver update)
-        if self._mysql and self.settings.app.empresa_id:
-            self._mysql.update_empresa_interacao(self.settings.app.empresa_id)
-            self.logger.debug("DATA_ULTIMA_INTERACAO atualizada na verificação de updates")
-
         # Verifica e aplica atualização automaticamente
         if self._update_checker and self.settings.app.auto_update:
             self._check_and_apply_update()
@@ -312,6 +563,11 @@ class AppController:
         if self._backup_progress_callback:
             self._backup_progress_callback(message)
 
+    def _on_progress_event(self, event: ProgressEvent):
+        """Callback de eventos de progresso do BackupEngine"""
+        if self._progress_event_callback:
+            self._progress_event_callback(event)
+
     def _on_update_available(self, versao: str, changelog: str):
         """Callback para update disponível - apenas log, sem pop-up"""
         self.logger.info(f"Atualização disponível: versão {versao}")
@@ -384,13 +640,44 @@ class AppController:
         return None
 
     def get_backup_logs(self, limit: int = 50) -> List[LogBackup]:
-        """Retorna logs de backup"""
+        """Retorna logs de backup (catálogo local se o MySQL não responde)"""
         if self._mysql and self.settings.app.empresa_id:
-            return self._mysql.get_logs_by_empresa(
+            logs = self._mysql.get_logs_by_empresa(
                 self.settings.app.empresa_id,
                 limit
             )
-        return []
+            if logs:
+                return logs
+
+        if not self._catalog:
+            return []
+        return [
+            LogBackup(
+                id=entry.log_id,
+                id_empresa=entry.id_empresa,
+                data_inicio=entry.data,
+                nome_arquivo=entry.arquivo,
+                caminho_destino=entry.caminho,
+                caminho_destino2=entry.caminho2,
+                tamanho_bytes=entry.tamanho_bytes,
+                tamanho_formatado=FileUtils.format_size(entry.tamanho_bytes),
+                status=StatusBackup.SUCESSO.value,
+                tipo_backup=entry.tipo_backup,
+                manual=entry.manual,
+                codec=entry.codec
+            )
+            for entry in self._catalog.list_entries(limit=limit, status=None)
+        ]
+
+    def get_catalog(self) -> Optional[BackupCatalog]:
+        """Catálogo local de artefatos de backup"""
+        return self._catalog
+
+    def get_progress(self) -> List[dict]:
+        """Último evento de progresso de cada backup em execução"""
+        with self._backups_lock:
+            events = [engine.last_progress for engine in self._active_engines]
+        return [event.to_dict() for event in events if event]
 
     def get_status(self) -> dict:
         """Retorna status completo do aplicativo"""
@@ -404,10 +691,24 @@ class AppController:
             'next_backup': self.get_next_backup_time(),
             'last_backup': self._last_backup_result.arquivo if self._last_backup_result else None,
             'last_backup_success': self._last_backup_result.success if self._last_backup_result else None,
+            'backups_running': self._backup_pool.active_count if self._backup_pool else 0,
+            'backups_pending': self._job_queue.pending_count() if self._job_queue else 0,
+            'uploads_pending': self._upload_outbox.pending_count() if self._upload_outbox else 0,
+            'mysql_pending': self._journal.pending_count() if self._journal else 0,
             'firebird_connected': self._sync_manager.is_connected_firebird() if self._sync_manager else False,
             'mysql_connected': self._sync_manager.is_connected_mysql() if self._sync_manager else False,
+            'mysql_pool': self._mysql.pool_stats() if self._mysql else {},
         }
 
+    def _apply_bandwidth(self):
+        """Aplica o limite de banda do config (vale também para transferências em andamento)"""
+        configure_bandwidth(self.settings.app.limite_banda_kbps, self.settings.app.janelas_banda)
+
+    def _apply_heartbeat(self):
+        """Aplica o intervalo do heartbeat do config"""
+        if self._heartbeat:
+            self._heartbeat.configure(self.settings.app.intervalo_heartbeat_minutos * 60)
+
     def refresh_settings(self):
         """
         Recarrega configurações do arquivo config.json
@@ -418,9 +719,12 @@ class AppController:
         # Atualiza referências em todos os componentes
         if self._sync_manager:
             self._sync_manager.settings = self.settings
+        self._apply_bandwidth()
+        self._apply_heartbeat()
 
-        if self._backup_engine:
-            self._backup_engine.settings = self.settings
+        with self._backups_lock:
+            for engine in self._active_engines:
+                engine.settings = self.settings
 
         # Atualiza agenda com os novos destinos
         if self._agenda:
@@ -437,14 +741,18 @@ class AppController:
             force_from_firebird: Se True, sobrescreve destinos locais com os do Firebird
         """
         self.settings = Settings.load()
+        self._apply_bandwidth()
+        self._apply_heartbeat()
 
         if self._sync_manager:
             # Atualiza referência de settings no sync_manager
             self._sync_manager.settings = self.settings
             self._sync_manager.refresh()
 
-        if self._backup_engine:
-            self._backup_engine.settings = self.settings
+        if self._backup_pool:
+            with self._backups_lock:
+                for engine in self._active_engines:
+                    engine.settings = self.settings
 
             # Força atualização dos destinos do Firebird
             if force_from_firebird and self._firebird:
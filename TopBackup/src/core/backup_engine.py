@@ -4,22 +4,50 @@ Executa gbak, valida, compacta e move backups
 """
 
 import os
+import queue
+import re
 import subprocess
 import tempfile
+import threading
+import time
 from pathlib import Path
 from datetime import datetime
-from typing import Optional, Tuple, Callable
+from typing import Optional, Tuple, Callable, Iterator, List
 from dataclasses import dataclass
 
 from ..config.settings import Settings
 from ..config.constants import (
     BACKUP_TIMEOUT, STATUS_EXECUTANDO, STATUS_SUCESSO, STATUS_FALHA,
-    BACKUP_EXTENSION, ZIP_EXTENSION
+    BACKUP_EXTENSION, ZIP_EXTENSION, STREAM_CHUNK_SIZE, STREAM_QUEUE_SIZE
 )
 from ..database.models import LogBackup, Empresa, AgendaBackup
 from ..database.mysql_client import MySQLClient
+from ..database.catalog import BackupCatalog, CatalogEntry
+from ..database.write_journal import WriteJournal
 from ..utils.logger import get_logger
 from ..utils.file_utils import FileUtils
+from ..utils.fanout import FanoutWriter, FanoutSink, FileSink, HashSink
+from ..utils.compression_codecs import (
+    CompressionCodec, CompressionStats, get_codec, CODEC_AUTO
+)
+from ..network.bandwidth import get_bandwidth_limiter
+from .dedup_store import DedupRepository, DedupError
+from .nbackup_engine import NBackupEngine
+from .fbk_check import FbkStreamCheck, FbkCheckError
+from .preflight import (
+    PreflightCheck, PreflightResult, forecast_sizes,
+    MODO_ARQUIVO, MODO_STREAMING, MODO_DEDUP, MODO_NBACKUP
+)
+from .progress import (
+    ProgressEvent, ProgressReporter, GbakVerboseParser,
+    ETAPA_GBAK, ETAPA_NBACKUP, ETAPA_VALIDACAO, ETAPA_COMPACTACAO, ETAPA_COPIA, ETAPA_REPLICACAO
+)
+
+# Valor gravado em LOG_BACKUPS.CODEC para backups no repositório dedup
+DEDUP_CODEC_NAME = "dedup"
+
+# Intervalo de amostragem do tamanho do .fbk / cancelamento durante o gbak
+GBAK_SAMPLE_INTERVAL = 1.0
 
 
 @dataclass
@@ -32,6 +60,11 @@ class BackupResult:
     tamanho_bytes: int = 0
     tamanho_formatado: str = ""
     duracao_segundos: float = 0
+    codec: Optional[str] = None
+    hash_sha256: Optional[str] = None
+    dedup: bool = False  # Gravado no repositório com deduplicação (caminho = manifesto)
+    log_id: Optional[int] = None  # ID em LOG_BACKUPS (para marcar o envio FTP depois)
+    log_chave: Optional[str] = None  # CHAVE_LOCAL do log (envio FTP registrado pelo diário)
 
 
 class BackupEngine:
@@ -40,23 +73,74 @@ class BackupEngine:
     def __init__(
         self,
         settings: Settings,
-        mysql_client: Optional[MySQLClient] = None
+        mysql_client: Optional[MySQLClient] = None,
+        compression_stats: Optional[CompressionStats] = None,
+        catalog: Optional[BackupCatalog] = None,
+        journal: Optional[WriteJournal] = None
     ):
         self.settings = settings
         self.mysql = mysql_client
+        self.catalog = catalog
+        # Diário local: o log vai para o MySQL em segundo plano (sem esperar a nuvem)
+        self.journal = journal
         self.logger = get_logger()
         self._progress_callback: Optional[Callable[[str], None]] = None
+        self._progress = ProgressReporter()
         self._cancel_requested: bool = False
+        # Compartilhado entre engines que rodam em paralelo
+        self._compression_stats = compression_stats or CompressionStats(
+            FileUtils.get_data_directory() / "compression_stats.json"
+        )
+        self._nbackup = NBackupEngine(settings)
+        # Banco deste backup (agenda.banco_origem) e sufixo dos arquivos gerados
+        self._database_path = settings.firebird.database_path
+        self._name_suffix = ""
+        # Diretório de trabalho no destino quando o temporário não tem espaço
+        self._work_dir: Optional[Path] = None
 
     def set_progress_callback(self, callback: Callable[[str], None]):
         """Define callback para progresso do backup"""
         self._progress_callback = callback
 
-    def _report_progress(self, message: str):
-        """Reporta progresso do backup"""
+    def set_progress_event_callback(self, callback: Callable[[ProgressEvent], None]):
+        """Define callback para eventos de progresso (bytes, throughput e ETA)"""
+        self._progress.callback = callback
+
+    @property
+    def last_progress(self) -> Optional[ProgressEvent]:
+        """Último evento de progresso do backup"""
+        return self._progress.last_event
+
+    @property
+    def database_path(self) -> str:
+        """Banco do backup atual (resolvido da agenda em execute_backup)"""
+        return self._database_path
+
+    def _report_progress(self, message: str, etapa: Optional[str] = None, total: Optional[int] = None):
+        """
+        Reporta progresso do backup
+
+        Args:
+            message: Texto da etapa
+            etapa: Inicia uma nova etapa nos eventos de progresso
+            total: Estimativa de bytes da etapa
+        """
         self.logger.info(message)
         if self._progress_callback:
             self._progress_callback(message)
+        if etapa:
+            self._progress.stage(etapa, message, total)
+
+    def _estimate_backup_size(self) -> int:
+        """Estimativa do .fbk: último backup do banco ou tamanho do banco"""
+        return (
+            self._compression_stats.last_raw_size(self._database_path)
+            or FileUtils.get_file_size(self._database_path)
+        )
+
+    def _temp_directory(self) -> Path:
+        """Diretório onde o .fbk e o ZIP são gerados antes da entrega"""
+        return self._work_dir or FileUtils.get_temp_directory()
 
     def cancel(self):
         """Solicita cancelamento do backup"""
@@ -80,7 +164,10 @@ class BackupEngine:
             BackupResult com o resultado do backup
         """
         self._cancel_requested = False
+        self._work_dir = None
         inicio = datetime.now()
+        self._database_path, self._name_suffix = self.resolve_database(self.settings, agenda)
+        self._progress.reset()
 
         # Verifica se deve executar hoje
         if not manual and not agenda.deve_executar_hoje():
@@ -99,85 +186,63 @@ class BackupEngine:
         )
 
         # Insere log no MySQL
-        if self.mysql:
-            log.id = self.mysql.insert_log_backup(log)
+        self._save_log(log, novo=True)
 
         try:
             # Log do destino configurado
             self.logger.info(f"Destino 1: {agenda.local_destino1 or '(vazio)'}")
             self.logger.info(f"Destino 2: {agenda.local_destino2 or '(vazio)'}")
             self.logger.info(f"Tipo backup: {agenda.prefixo_backup}")
-
-            # 1. Executa gbak
-            self._report_progress("Iniciando backup com gbak...")
-            fbk_path = self._execute_gbak()
-
-            self.logger.info(f"Backup criado em: {fbk_path}")
-            self.logger.info(f"Tamanho do .fbk: {os.path.getsize(fbk_path)} bytes")
-
-            if self._cancel_requested:
-                raise BackupCancelledError("Backup cancelado pelo usuário")
-
-            # 2. Valida backup
-            self._report_progress("Validando backup...")
-            self._validate_backup(fbk_path)
-
-            if self._cancel_requested:
-                raise BackupCancelledError("Backup cancelado pelo usuário")
-
-            # 3. Compacta se configurado
-            if self.settings.backup.compactar_zip:
-                self._report_progress("Compactando arquivo...")
-                final_path = self._compress_backup(fbk_path, empresa, agenda)
-                self.logger.info(f"ZIP criado: {final_path}")
-                self.logger.info(f"Tamanho do ZIP: {os.path.getsize(final_path)} bytes")
-            else:
-                final_path = fbk_path
-
-            if self._cancel_requested:
-                raise BackupCancelledError("Backup cancelado pelo usuário")
-
-            # 4. Move para destinos
-            self.logger.info(f"=== INICIANDO MOVIMENTACAO ===")
-            self.logger.info(f"Arquivo origem: {final_path}")
-            self.logger.info(f"Arquivo existe? {os.path.exists(final_path)}")
-            self.logger.info(f"Destino agenda: {agenda.local_destino1}")
-            self.logger.info(f"Destino config: {self.settings.backup.local_destino1}")
-
-            # Usa o destino da agenda, não da config
-            destino_final = agenda.local_destino1
-            if not destino_final:
-                destino_final = self.settings.backup.local_destino1
-                self.logger.warning(f"Agenda sem destino, usando config: {destino_final}")
-
-            if not destino_final:
-                raise BackupError("Nenhum diretório de destino configurado!")
-
-            self._report_progress(f"Movendo para: {destino_final}")
-
-            try:
-                destino1 = self._move_to_destination(
-                    final_path,
-                    destino_final,
-                    empresa,
-                    agenda
+            self.logger.info(f"Banco: {self._database_path}")
+
+            incremental = self.settings.backup.modo_incremental
+            dedup = not incremental and self._use_dedup_repository(agenda)
+            codec = None
+            if dedup:
+                log.codec = DEDUP_CODEC_NAME
+            elif self.settings.backup.compactar_zip and not incremental:
+                codec = self._select_codec()
+                log.codec = codec.name
+                self.logger.info(f"Codec de compressão: {codec.name}")
+
+            # Espaço em disco antes do gbak: pode trocar para streaming,
+            # gerar o ZIP no destino ou pular o destino 2
+            streaming = bool(codec) and self.settings.backup.streaming_gbak
+            destino2_dir = agenda.local_destino2
+            if self.settings.backup.verificar_espaco:
+                if incremental:
+                    modo = MODO_NBACKUP
+                elif dedup:
+                    modo = MODO_DEDUP
+                else:
+                    modo = MODO_STREAMING if streaming else MODO_ARQUIVO
+                check = self._check_disk_space(empresa, agenda, codec, modo)
+                streaming = check.modo == MODO_STREAMING
+                if check.pular_destino2:
+                    destino2_dir = None
+
+            if incremental:
+                # nbackup físico (nível 0/1/2) direto no destino
+                destino1, destino2, sha256, nivel = self._execute_nbackup(empresa, agenda, destino2_dir)
+                log.codec = f"nbackup-{nivel}"
+                tamanho = FileUtils.get_file_size(destino1)
+            elif dedup:
+                # gbak → stdout → chunks no repositório do destino
+                destino_final = self._get_destination(agenda)
+                self._report_progress(
+                    "Iniciando backup com gbak (repositório dedup)...",
+                    ETAPA_GBAK, self._estimate_backup_size()
                 )
-                self.logger.info(f"Arquivo movido para: {destino1}")
-            except Exception as move_error:
-                self.logger.error(f"ERRO ao mover arquivo: {move_error}")
-                raise
-
-            # 5. Copia para destino secundário
-            destino2 = None
-            if agenda.local_destino2:
-                self._report_progress("Copiando para destino secundário...")
-                destino2 = self._copy_to_destination(
-                    destino1,
-                    agenda.local_destino2
+                destino1, destino2, sha256, tamanho = self._execute_dedup_backup(
+                    empresa, destino_final, destino2_dir
                 )
+            else:
+                destino1, destino2, sha256 = self._execute_file_backup(
+                    empresa, agenda, codec, streaming, destino2_dir
+                )
+                tamanho = FileUtils.get_file_size(destino1)
 
             # Calcula resultado
-            tamanho = FileUtils.get_file_size(destino1)
             tamanho_fmt = FileUtils.format_size(tamanho)
             duracao = (datetime.now() - inicio).total_seconds()
 
@@ -190,8 +255,10 @@ class BackupEngine:
                 caminho2=destino2
             )
 
-            if self.mysql and log.id:
-                self.mysql.update_log_backup(log)
+            self._save_log(log)
+
+            self._progress.close_stage()
+            self._register_catalog(log, agenda, sha256, duracao)
 
             self.logger.backup_success(
                 empresa.fantasia,
@@ -206,35 +273,428 @@ class BackupEngine:
                 caminho=destino1,
                 tamanho_bytes=tamanho,
                 tamanho_formatado=tamanho_fmt,
-                duracao_segundos=duracao
+                duracao_segundos=duracao,
+                codec=log.codec,
+                hash_sha256=sha256,
+                dedup=dedup,
+                log_id=log.id,
+                log_chave=log.chave_local
             )
 
         except BackupCancelledError as e:
             log.set_falha(str(e))
-            if self.mysql and log.id:
-                self.mysql.update_log_backup(log)
+            self._save_log(log)
             return BackupResult(success=False, message=str(e))
 
         except Exception as e:
             self.logger.backup_error(empresa.fantasia, str(e))
             log.set_falha(str(e))
-            if self.mysql and log.id:
-                self.mysql.update_log_backup(log)
+            self._save_log(log)
             return BackupResult(success=False, message=str(e))
 
         finally:
             # Limpa arquivos temporários
             self._cleanup_temp()
 
-    def _execute_gbak(self) -> str:
+    def _save_log(self, log: LogBackup, novo: bool = False):
+        """Grava o log pelo diário local ou, sem ele, direto no MySQL"""
+        if self.journal:
+            if novo:
+                self.journal.insert_log_backup(log)
+            else:
+                self.journal.update_log_backup(log)
+        elif self.mysql:
+            if novo:
+                log.id = self.mysql.insert_log_backup(log)
+            elif log.id:
+                self.mysql.update_log_backup(log)
+
+    def _check_disk_space(
+        self,
+        empresa: Empresa,
+        agenda: AgendaBackup,
+        codec: Optional[CompressionCodec],
+        modo: str
+    ) -> PreflightResult:
         """
-        Executa gbak para criar backup
+        Confere o espaço livre no temporário e nos destinos
+
+        Falta de espaço no temporário ou no destino 1 falha aqui, antes
+        do gbak, em vez de horas depois com o disco cheio.
+        """
+        destino1 = self._get_destination(agenda)
+        forecast = forecast_sizes(
+            self._database_path, self._compression_stats, codec.name if codec else None
+        )
+        nbackup_bytes = None
+        if modo == MODO_NBACKUP:
+            nbackup_bytes = self._nbackup.estimate_size(
+                empresa, destino1, self._database_path, self._name_suffix
+            )
+
+        check = PreflightCheck().check(
+            modo, forecast,
+            str(FileUtils.get_temp_directory()),
+            destino1,
+            agenda.local_destino2,
+            nbackup_bytes
+        )
+        if not check.ok:
+            raise BackupError(check.message)
+
+        self.logger.info(
+            f"Previsão ({forecast.fonte}): .fbk ~{FileUtils.format_size(forecast.fbk_bytes)}, "
+            f"compactado ~{FileUtils.format_size(forecast.comprimido_bytes)}"
+        )
+        for aviso in check.avisos:
+            self.logger.warning(aviso)
+        if check.work_dir:
+            self._work_dir = Path(check.work_dir)
+        return check
+
+    def _register_catalog(self, log: LogBackup, agenda: AgendaBackup, sha256: Optional[str], duracao: float):
+        """Registra o artefato no catálogo local (falha aqui não invalida o backup)"""
+        if not self.catalog:
+            return
+        try:
+            self.catalog.add(CatalogEntry(
+                data=log.data_inicio,
+                id_empresa=log.id_empresa,
+                banco=self._database_path,
+                tipo_backup=agenda.prefixo_backup,
+                arquivo=log.nome_arquivo or "",
+                caminho=log.caminho_destino or "",
+                caminho2=log.caminho_destino2,
+                tamanho_bytes=log.tamanho_bytes or 0,
+                sha256=sha256,
+                codec=log.codec,
+                duracao_segundos=duracao,
+                etapas=dict(self._progress.durations),
+                manual=log.manual,
+                log_id=log.id
+            ))
+        except Exception as e:
+            self.logger.warning(f"Erro ao registrar backup no catálogo: {e}")
+
+    def _execute_file_backup(
+        self,
+        empresa: Empresa,
+        agenda: AgendaBackup,
+        codec: Optional[CompressionCodec],
+        streaming: bool,
+        dest_dir2: Optional[str]
+    ) -> Tuple[str, Optional[str], Optional[str]]:
+        """
+        Gera o arquivo de backup (.fbk ou ZIP) e entrega aos destinos
 
         Returns:
-            Caminho do arquivo .fbk gerado
+            Tuple[str, Optional[str], Optional[str]]: (destino1, destino2, sha256)
+        """
+        if codec and streaming:
+            # 1-3. gbak → stdout → ZIP, sem .fbk temporário
+            self._report_progress(
+                "Iniciando backup com gbak (streaming)...",
+                ETAPA_GBAK, self._estimate_backup_size()
+            )
+            inicio_compressao = time.monotonic()
+            final_path, raw_size = self._execute_gbak_stream(empresa, agenda, codec)
+            self._record_compression(
+                codec, raw_size, final_path, time.monotonic() - inicio_compressao
+            )
+            self.logger.info(f"ZIP criado: {final_path}")
+            self.logger.info(f"Tamanho do ZIP: {os.path.getsize(final_path)} bytes")
+        else:
+            # 1. Executa gbak
+            self._report_progress(
+                "Iniciando backup com gbak...",
+                ETAPA_GBAK, self._estimate_backup_size()
+            )
+            fbk_path = self._execute_gbak()
+
+            self.logger.info(f"Backup criado em: {fbk_path}")
+            self.logger.info(f"Tamanho do .fbk: {os.path.getsize(fbk_path)} bytes")
+
+            if self._cancel_requested:
+                raise BackupCancelledError("Backup cancelado pelo usuário")
+
+            # 2. Valida backup
+            self._report_progress("Validando backup...", ETAPA_VALIDACAO)
+            self._validate_backup(fbk_path)
+
+            if self._cancel_requested:
+                raise BackupCancelledError("Backup cancelado pelo usuário")
+
+            # 3. Compacta se configurado
+            if codec:
+                raw_size = os.path.getsize(fbk_path)
+                self._report_progress(f"Compactando arquivo ({codec.name})...", ETAPA_COMPACTACAO, raw_size)
+                inicio_compressao = time.monotonic()
+                final_path = self._compress_backup(fbk_path, empresa, agenda, codec)
+                self._record_compression(
+                    codec, raw_size, final_path, time.monotonic() - inicio_compressao
+                )
+                self.logger.info(f"ZIP criado: {final_path}")
+                self.logger.info(f"Tamanho do ZIP: {os.path.getsize(final_path)} bytes")
+            else:
+                final_path = fbk_path
+
+        if self._cancel_requested:
+            raise BackupCancelledError("Backup cancelado pelo usuário")
+
+        # 4. Move para destinos
+        self.logger.info(f"=== INICIANDO MOVIMENTACAO ===")
+        self.logger.info(f"Arquivo origem: {final_path}")
+        self.logger.info(f"Arquivo existe? {os.path.exists(final_path)}")
+
+        destino_final = self._get_destination(agenda)
+
+        self._report_progress(
+            f"Movendo para: {destino_final}",
+            ETAPA_COPIA, FileUtils.get_file_size(final_path)
+        )
+
+        # 4-5. Entrega aos destinos com leitura única (destino1, destino2 e hash)
+        try:
+            destino1, destino2, sha256 = self._deliver_to_destinations(
+                final_path,
+                destino_final,
+                dest_dir2,
+                empresa,
+                agenda
+            )
+            self.logger.info(f"Arquivo movido para: {destino1}")
+            self.logger.info(f"SHA-256: {sha256}")
+        except Exception as move_error:
+            self.logger.error(f"ERRO ao mover arquivo: {move_error}")
+            raise
+
+        return destino1, destino2, sha256
+
+    def _execute_nbackup(
+        self,
+        empresa: Empresa,
+        agenda: AgendaBackup,
+        dest_dir2: Optional[str]
+    ) -> Tuple[str, Optional[str], Optional[str], int]:
+        """
+        Executa o próximo backup da cadeia incremental (nbackup)
+
+        O arquivo é gerado direto no destino principal, junto com a
+        cadeia (cadeia.json) usada na restauração.
+
+        Returns:
+            Tuple[str, Optional[str], Optional[str], int]: (destino1, destino2, sha256, nivel)
+        """
+        destino_final = self._get_destination(agenda)
+        self._report_progress("Iniciando backup incremental com nbackup...", ETAPA_NBACKUP)
+
+        entry, destino1 = self._nbackup.backup(
+            empresa, destino_final, self._database_path, self._name_suffix
+        )
+        self.logger.info(
+            f"nbackup nível {entry.nivel} criado: {destino1} "
+            f"({FileUtils.format_size(entry.tamanho)})"
+        )
+
+        destino2 = None
+        if dest_dir2:
+            self._report_progress("Copiando para destino secundário...", ETAPA_REPLICACAO, entry.tamanho)
+            try:
+                destino2 = self._nbackup.replicate(
+                    empresa, entry, destino_final, dest_dir2, self._name_suffix,
+                    throttle=self._network_throttle(dest_dir2)
+                )
+            except Exception as e:
+                self.logger.warning(f"Erro ao copiar para destino secundário: {e}")
+
+        return destino1, destino2, entry.sha256, entry.nivel
+
+    @staticmethod
+    def resolve_database(settings: Settings, agenda: AgendaBackup) -> Tuple[str, str]:
+        """
+        Banco de origem da agenda e sufixo dos arquivos de backup
+
+        Agendas sem BANCO_ORIGEM (ou com o banco principal) mantêm os
+        nomes de sempre; outros bancos ganham o nome do arquivo como
+        sufixo (ex: 12345678000199_VENDAS_20260215_230000.zip). Estático:
+        a fila de jobs resolve o banco sem montar um engine.
+
+        Returns:
+            Tuple[str, str]: (caminho do banco, sufixo)
+        """
+        default = settings.firebird.database_path
+        origem = (agenda.banco_origem or "").strip()
+        if not origem or os.path.normcase(origem) == os.path.normcase(default):
+            return default, ""
+
+        nome = re.sub(r'[^A-Z0-9]+', '', Path(origem).stem.upper())
+        return origem, f"_{nome}" if nome else ""
+
+    def _get_destination(self, agenda: AgendaBackup) -> str:
+        """Retorna o destino principal (agenda, ou config como fallback)"""
+        self.logger.info(f"Destino agenda: {agenda.local_destino1}")
+        self.logger.info(f"Destino config: {self.settings.backup.local_destino1}")
+
+        # Usa o destino da agenda, não da config
+        destino_final = agenda.local_destino1
+        if not destino_final:
+            destino_final = self.settings.backup.local_destino1
+            self.logger.warning(f"Agenda sem destino, usando config: {destino_final}")
+
+        if not destino_final:
+            raise BackupError("Nenhum diretório de destino configurado!")
+
+        return destino_final
+
+    def _use_dedup_repository(self, agenda: AgendaBackup) -> bool:
+        """Repositório com deduplicação só se aplica ao backup versionado"""
+        return self.settings.backup.repositorio_dedup and agenda.prefixo_backup == 'V'
+
+    def _execute_dedup_backup(
+        self,
+        empresa: Empresa,
+        dest_dir: str,
+        dest_dir2: Optional[str]
+    ) -> Tuple[str, Optional[str], str, int]:
+        """
+        Grava o stdout do gbak no repositório com deduplicação
+
+        Só os chunks que ainda não existem no repositório ocupam disco. O
+        destino secundário recebe uma réplica incremental (chunks
+        faltantes + manifesto).
+
+        Returns:
+            Tuple[str, Optional[str], str, int]: (manifesto1, manifesto2, sha256, tamanho_fbk)
+        """
+        cmd = self._build_gbak_command("stdout")
+        repo = DedupRepository.for_destination(dest_dir, empresa.cnpj)
+
+        # Mesmo padrão do versionado: CNPJ_YYYYMMDD_HHMMSS
+        name = FileUtils.generate_backup_filename(empresa.cnpj, 'V', '', self._name_suffix)
+
+        self.logger.debug(f"Executando: {' '.join(cmd)}")
+
+        stream = GbakStream(cmd, lambda: self._cancel_requested)
+        stream.start()
+        check = self._start_check()
+
+        store = None
+        try:
+            chunks = self._progress.count(stream.chunks())
+            if check:
+                chunks = check.tap(chunks)
+            store = repo.store(chunks, name, f"{name}{BACKUP_EXTENSION}")
+        finally:
+            # Sem manifesto o backup está incompleto: interrompe o gbak
+            stream.finish(abort=store is None)
+            if store is None and check:
+                check.finish(abort=True)
+
+        try:
+            stream.raise_for_status()
+
+            if store.total_bytes < 1024:
+                raise BackupError(f"Arquivo de backup muito pequeno: {store.total_bytes} bytes")
+
+            self._finish_check(check)
+        except Exception:
+            if check:
+                check.finish(abort=True)
+            # Chunks órfãos são removidos no próximo gc do repositório
+            repo.delete_manifest(name)
+            raise
+
+        self.logger.info(
+            f"Dedup: {store.new_chunks}/{store.chunk_count} chunks novos, "
+            f"{FileUtils.format_size(store.new_bytes)} de {FileUtils.format_size(store.total_bytes)} "
+            f"({FileUtils.format_size(store.stored_bytes)} gravados)"
+        )
+
+        manifest2 = None
+        if dest_dir2:
+            self._report_progress("Replicando para destino secundário...", ETAPA_REPLICACAO)
+            try:
+                repo2 = DedupRepository.for_destination(dest_dir2, empresa.cnpj)
+                copied = repo.replicate_to(repo2, name, throttle=self._network_throttle(dest_dir2))
+                manifest2 = str(repo2.manifest_path(name))
+                self.logger.debug(f"Réplica: {FileUtils.format_size(copied)} copiados")
+            except Exception as e:
+                self.logger.warning(f"Erro ao replicar para destino secundário: {e}")
+
+        return store.manifest_path, manifest2, store.sha256, store.total_bytes
+
+    def restore_from_repository(self, manifest_path: str, database_path: str) -> Tuple[bool, str]:
+        """
+        Restaura um manifesto do repositório direto para um banco novo
+
+        Os chunks são enviados ao stdin do gbak (gbak -c stdin banco),
+        sem gerar .fbk intermediário.
+
+        Returns:
+            Tuple[bool, str]: (sucesso, mensagem)
+        """
+        gbak_path = self.settings.firebird.gbak_path
+        if not os.path.exists(gbak_path):
+            return False, f"gbak não encontrado: {gbak_path}"
+
+        if os.path.exists(database_path):
+            return False, f"Banco de destino já existe: {database_path}"
+
+        repo = DedupRepository.from_manifest(manifest_path)
+        cmd = [
+            gbak_path,
+            "-c",
+            "-user", self.settings.firebird.user,
+            "-pass", self.settings.firebird.password,
+            "stdin",
+            database_path
+        ]
+
+        process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+        )
+        stderr_data: List[bytes] = []
+        reader = threading.Thread(
+            target=lambda: stderr_data.append(process.stderr.read()),
+            daemon=True
+        )
+        reader.start()
+
+        try:
+            for data in repo.iter_backup(os.path.abspath(manifest_path)):
+                process.stdin.write(data)
+            process.stdin.close()
+        except (DedupError, OSError) as e:
+            process.kill()
+            process.wait()
+            return False, f"Erro na restauração: {e}"
+
+        returncode = process.wait()
+        reader.join(timeout=5)
+
+        if returncode != 0:
+            error_msg = b"".join(stderr_data).decode('utf-8', errors='replace')
+            return False, f"gbak falhou: {error_msg or 'Erro desconhecido'}"
+
+        return True, "Restauração concluída"
+
+    def _build_gbak_command(self, target: str, verbose: bool = False) -> List[str]:
+        """
+        Monta o comando gbak validando executável e banco
+
+        Args:
+            target: Arquivo de destino do backup ou "stdout"
+            verbose: Adiciona -v (andamento por tabela na saída)
+
+        Returns:
+            Lista de argumentos do comando
         """
         gbak_path = self.settings.firebird.gbak_path
-        db_path = self.settings.firebird.database_path
+        db_path = self._database_path
 
         if not os.path.exists(gbak_path):
             raise BackupError(f"gbak não encontrado: {gbak_path}")
@@ -242,51 +702,204 @@ class BackupEngine:
         if not os.path.exists(db_path):
             raise BackupError(f"Banco de dados não encontrado: {db_path}")
 
-        # Cria diretório temporário
-        temp_dir = FileUtils.get_temp_directory()
-        temp_dir.mkdir(parents=True, exist_ok=True)
-
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        fbk_filename = f"backup_{timestamp}{BACKUP_EXTENSION}"
-        fbk_path = temp_dir / fbk_filename
-
         # Comando gbak simples - igual ao batch que funciona
         # gbak -b -user sysdba -pass masterkey banco destino
-        cmd = [
+        return [
             gbak_path,
             "-b",
+            *(["-v"] if verbose else []),
             "-user", self.settings.firebird.user,
             "-pass", self.settings.firebird.password,
             db_path,
-            str(fbk_path)
+            target
         ]
 
+    def _execute_gbak(self) -> str:
+        """
+        Executa gbak para criar backup
+
+        Returns:
+            Caminho do arquivo .fbk gerado
+        """
+        # Cria diretório temporário
+        temp_dir = self._temp_directory()
+        temp_dir.mkdir(parents=True, exist_ok=True)
+
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        fbk_filename = f"backup{self._name_suffix}_{timestamp}{BACKUP_EXTENSION}"
+        fbk_path = temp_dir / fbk_filename
+
+        cmd = self._build_gbak_command(str(fbk_path), verbose=True)
+
         self.logger.debug(f"Executando: {' '.join(cmd)}")
 
+        # Saída do -v lida linha a linha (progresso por tabela), em vez de
+        # acumulada pelo capture_output
+        process = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            errors='replace',
+            creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+        )
+        timed_out = threading.Event()
+
+        def kill_on_timeout():
+            timed_out.set()
+            process.kill()
+
+        timer = threading.Timer(BACKUP_TIMEOUT, kill_on_timeout)
+        timer.daemon = True
+        timer.start()
+
+        parser = GbakVerboseParser()
+        done = threading.Event()
+
+        def sample():
+            # Tamanho do .fbk e cancelamento amostrados por tempo: numa tabela
+            # grande o -v fica minutos sem imprimir nada
+            while not done.wait(GBAK_SAMPLE_INTERVAL):
+                if self._cancel_requested:
+                    process.kill()
+                    return
+                self._progress.update(
+                    FileUtils.get_file_size(str(fbk_path)),
+                    parser.describe()
+                )
+
+        sampler = threading.Thread(target=sample, name="gbak-progress", daemon=True)
+        sampler.start()
         try:
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=BACKUP_TIMEOUT,
-                creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
-            )
+            for line in process.stdout:
+                parser.feed(line)
+            returncode = process.wait()
+        finally:
+            done.set()
+            timer.cancel()
+            process.stdout.close()
+            sampler.join()
+
+        try:
+            if self._cancel_requested:
+                raise BackupCancelledError("Backup cancelado pelo usuário")
 
-            if result.returncode != 0:
-                error_msg = result.stderr or result.stdout or "Erro desconhecido"
-                raise BackupError(f"gbak falhou: {error_msg}")
+            if timed_out.is_set():
+                raise BackupError(f"Timeout após {BACKUP_TIMEOUT}s")
+
+            if returncode != 0:
+                raise BackupError(f"gbak falhou: {parser.error_message() or 'Erro desconhecido'}")
 
             if not fbk_path.exists():
                 raise BackupError("Arquivo de backup não foi criado")
+        except Exception:
+            FileUtils.safe_delete(str(fbk_path))
+            raise
+
+        if parser.tabelas:
+            self.logger.debug(f"gbak: {parser.tabelas} tabelas, {parser.registros} registros")
+
+        return str(fbk_path)
+
+    def _execute_gbak_stream(
+        self,
+        empresa: Empresa,
+        agenda: AgendaBackup,
+        codec: CompressionCodec
+    ) -> Tuple[str, int]:
+        """
+        Executa gbak com saída em stdout, compactando direto para ZIP
+
+        O stdout do gbak é lido em blocos por uma thread e entregue ao
+        compactador através de uma fila limitada (STREAM_QUEUE_SIZE), de
+        forma que o banco é lido uma vez e o ZIP escrito uma vez.
 
-            return str(fbk_path)
+        Returns:
+            Tuple[str, int]: (caminho do ZIP, bytes gerados pelo gbak)
+        """
+        cmd = self._build_gbak_command("stdout")
+
+        temp_dir = self._temp_directory()
+        temp_dir.mkdir(parents=True, exist_ok=True)
+
+        zip_filename = FileUtils.generate_backup_filename(
+            empresa.cnpj,
+            agenda.prefixo_backup,
+            ZIP_EXTENSION,
+            self._name_suffix
+        )
+        zip_path = temp_dir / zip_filename
+
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        arcname = f"backup_{timestamp}{BACKUP_EXTENSION}"
+
+        self.logger.debug(f"Executando: {' '.join(cmd)}")
+
+        stream = GbakStream(cmd, lambda: self._cancel_requested)
+        stream.start()
+        check = self._start_check()
+
+        success, message = False, ""
+        try:
+            workers, block_size = self._get_compression_params()
+            chunks = self._progress.count(stream.chunks())
+            if check:
+                chunks = check.tap(chunks)
+            success, message = FileUtils.compress_stream_to_zip(
+                chunks, str(zip_path), arcname,
+                workers=workers, block_size=block_size, codec=codec.name
+            )
+        finally:
+            # Sem sucesso o ZIP está incompleto: interrompe o gbak
+            stream.finish(abort=not success)
+            if not success and check:
+                check.finish(abort=True)
 
-        except subprocess.TimeoutExpired:
-            raise BackupError(f"Timeout após {BACKUP_TIMEOUT}s")
+        try:
+            stream.raise_for_status()
+
+            if not success:
+                raise BackupError(f"Erro na compactação: {message}")
+
+            self.logger.info(f"gbak (streaming) gerou {stream.total_bytes} bytes")
+
+            # Mesma validação de tamanho do modo com arquivo .fbk
+            if stream.total_bytes < 1024:
+                raise BackupError(f"Arquivo de backup muito pequeno: {stream.total_bytes} bytes")
+
+            self._finish_check(check)
+        except Exception:
+            if check:
+                check.finish(abort=True)
+            FileUtils.safe_delete(str(zip_path))
+            raise
+
+        return str(zip_path), stream.total_bytes
+
+    def _start_check(self) -> Optional[FbkStreamCheck]:
+        """Inicia a checagem estrutural do stream, se configurada"""
+        if not self.settings.backup.verificar_backup:
+            return None
+        check = FbkStreamCheck()
+        check.start()
+        return check
+
+    def _finish_check(self, check: Optional[FbkStreamCheck]):
+        """Confere o resultado da checagem estrutural do stream"""
+        if not check:
+            return
+        try:
+            check.finish()
+        except FbkCheckError as e:
+            raise BackupError(f"Backup inválido: {e}")
+        self.logger.debug(
+            f"Estrutura do backup conferida: {check.tables} tabelas, "
+            f"{check.records} linhas, {check.total_bytes} bytes"
+        )
 
     def _validate_backup(self, fbk_path: str) -> bool:
         """
-        Valida integridade do backup verificando apenas tamanho
+        Valida integridade do backup (tamanho e, se configurado, estrutura)
 
         Args:
             fbk_path: Caminho do arquivo .fbk
@@ -302,6 +915,13 @@ class BackupEngine:
         if file_size < 1024:  # Menos de 1KB é suspeito
             raise BackupError(f"Arquivo de backup muito pequeno: {file_size} bytes")
 
+        if self.settings.backup.verificar_backup:
+            # Lê o .fbk uma vez (no streaming a checagem vai junto com o stream)
+            try:
+                FbkStreamCheck.check_file(fbk_path)
+            except FbkCheckError as e:
+                raise BackupError(f"Backup inválido: {e}")
+
         self.logger.debug(f"Backup validado: {file_size} bytes")
         return True
 
@@ -309,10 +929,11 @@ class BackupEngine:
         self,
         fbk_path: str,
         empresa: Empresa,
-        agenda: AgendaBackup
+        agenda: AgendaBackup,
+        codec: CompressionCodec
     ) -> str:
         """
-        Compacta backup em ZIP
+        Compacta backup em ZIP com o codec escolhido
 
         Returns:
             Caminho do arquivo ZIP
@@ -321,13 +942,19 @@ class BackupEngine:
         zip_filename = FileUtils.generate_backup_filename(
             empresa.cnpj,
             agenda.prefixo_backup,
-            ZIP_EXTENSION
+            ZIP_EXTENSION,
+            self._name_suffix
         )
 
-        temp_dir = FileUtils.get_temp_directory()
+        temp_dir = self._temp_directory()
         zip_path = temp_dir / zip_filename
 
-        success, message = FileUtils.compress_to_zip(fbk_path, str(zip_path))
+        workers, block_size = self._get_compression_params()
+        success, message = FileUtils.compress_to_zip(
+            fbk_path, str(zip_path),
+            workers=workers, block_size=block_size, codec=codec.name,
+            progress=self._progress.add
+        )
 
         if not success:
             raise BackupError(f"Erro na compactação: {message}")
@@ -337,18 +964,78 @@ class BackupEngine:
 
         return str(zip_path)
 
-    def _move_to_destination(
+    def _select_codec(self) -> CompressionCodec:
+        """
+        Seleciona o codec de compressão do backup
+
+        No modo "auto" usa o histórico do banco para escolher o codec com
+        melhor taxa que caiba na janela de backup configurada.
+        """
+        configured = self.settings.backup.compressao_codec
+        if configured != CODEC_AUTO:
+            return get_codec(configured)
+
+        db_path = self._database_path
+        window = self.settings.backup.janela_backup_minutos * 60
+        return self._compression_stats.choose_codec(
+            db_path,
+            FileUtils.get_file_size(db_path),
+            window
+        )
+
+    def _record_compression(
+        self,
+        codec: CompressionCodec,
+        raw_size: int,
+        zip_path: str,
+        seconds: float
+    ):
+        """Registra throughput e taxa de compressão no histórico"""
+        compressed_size = FileUtils.get_file_size(zip_path)
+        self._compression_stats.record(
+            self._database_path,
+            codec.name,
+            raw_size,
+            compressed_size,
+            seconds
+        )
+        if raw_size and seconds > 0:
+            self.logger.info(
+                f"Compressão {codec.name}: {raw_size / seconds / 1024 / 1024:.1f} MB/s, "
+                f"taxa {compressed_size / raw_size:.1%}"
+            )
+
+    def _get_compression_params(self) -> Tuple[int, int]:
+        """
+        Retorna parâmetros da compressão paralela
+
+        Returns:
+            Tuple[int, int]: (threads, tamanho_bloco_bytes)
+        """
+        workers = self.settings.backup.compressao_threads
+        if workers <= 0:
+            workers = os.cpu_count() or 1
+        block_size = max(self.settings.backup.compressao_bloco_kb, 64) * 1024
+        return workers, block_size
+
+    def _deliver_to_destinations(
         self,
         source_path: str,
         dest_dir: str,
+        dest_dir2: Optional[str],
         empresa: Empresa,
         agenda: AgendaBackup
-    ) -> str:
+    ) -> Tuple[str, Optional[str], Optional[str]]:
         """
-        Move arquivo para diretório de destino
+        Entrega o artefato aos destinos lendo o arquivo uma única vez
+
+        Se o temporário está no mesmo volume do destino principal, ele é
+        apenas renomeado e o fan-out lê do destino principal. Caso
+        contrário o fan-out grava destino1, destino2 e calcula o SHA-256
+        na mesma passada.
 
         Returns:
-            Caminho final do arquivo
+            Tuple[str, Optional[str], Optional[str]]: (destino1, destino2, sha256)
         """
         if not dest_dir:
             raise BackupError("Diretório de destino não configurado")
@@ -361,41 +1048,80 @@ class BackupEngine:
             filename = FileUtils.generate_backup_filename(
                 empresa.cnpj,
                 agenda.prefixo_backup,
-                BACKUP_EXTENSION
+                BACKUP_EXTENSION,
+                self._name_suffix
             )
         else:
             filename = os.path.basename(source_path)
 
         dest_path = os.path.join(dest_dir, filename)
+        dest_path2 = os.path.join(dest_dir2, filename) if dest_dir2 else None
+
+        sinks: List[FanoutSink] = []
+        if FileUtils.same_volume(source_path, dest_dir):
+            # Rename no mesmo volume não lê nem escreve dados
+            success, message = FileUtils.safe_move(source_path, dest_path)
+            if not success:
+                raise BackupError(f"Erro ao mover arquivo: {message}")
+            fanout_source = dest_path
+        else:
+            sinks.append(FileSink(dest_path, required=True))
+            fanout_source = source_path
+
+        copy_sink = None
+        link_dest2 = False
+        if dest_path2:
+            self._report_progress("Copiando para destino secundário...")
+            FileUtils.ensure_directory(dest_dir2)
+            link_dest2 = (
+                self.settings.backup.hardlink_destino2
+                and FileUtils.same_volume(dest_dir, dest_dir2)
+            )
+            if not link_dest2:
+                copy_sink = FileSink(
+                    dest_path2, required=False, throttle=self._network_throttle(dest_dir2)
+                )
+                sinks.append(copy_sink)
 
-        success, message = FileUtils.safe_move(source_path, dest_path)
-
-        if not success:
-            raise BackupError(f"Erro ao mover arquivo: {message}")
+        hash_sink = HashSink()
+        sinks.append(hash_sink)
 
-        return dest_path
+        result = FanoutWriter(sinks).run(fanout_source, progress=self._progress.add)
 
-    def _copy_to_destination(self, source_path: str, dest_dir: str) -> str:
-        """
-        Copia arquivo para diretório secundário
+        if not result.success:
+            raise BackupError(f"Erro ao mover arquivo: {result.errors.get(dest_path, result.errors)}")
 
-        Returns:
-            Caminho da cópia
-        """
-        if not dest_dir:
-            return source_path
+        if fanout_source != dest_path:
+            FileUtils.safe_delete(source_path)
 
-        FileUtils.ensure_directory(dest_dir)
+        if copy_sink and copy_sink.failed:
+            self.logger.warning(f"Erro ao copiar para destino secundário: {copy_sink.error}")
+            dest_path2 = None
 
-        filename = os.path.basename(source_path)
-        dest_path = os.path.join(dest_dir, filename)
+        if link_dest2:
+            # Mesmo volume: hardlink (ou clone) em vez de regravar os dados
+            success, message = FileUtils.safe_copy(dest_path, dest_path2, allow_hardlink=True)
+            if success:
+                self.logger.debug(f"Destino secundário: {message}")
+            else:
+                self.logger.warning(f"Erro ao copiar para destino secundário: {message}")
+                dest_path2 = None
 
-        success, message = FileUtils.safe_copy(source_path, dest_path)
+        if result.seconds > 0:
+            self.logger.debug(
+                f"Fan-out: {result.bytes_read} bytes lidos uma vez para "
+                f"{len(sinks)} destinos em {result.seconds:.1f}s"
+            )
 
-        if not success:
-            self.logger.warning(f"Erro ao copiar para destino secundário: {message}")
+        return dest_path, dest_path2, hash_sink.hexdigest
 
-        return dest_path
+    @staticmethod
+    def _network_throttle(dest_dir: str) -> Optional[Callable[[int], None]]:
+        """Limite de banda para a cópia ao destino, se ele está em rede"""
+        limiter = get_bandwidth_limiter()
+        if limiter.enabled and FileUtils.is_network_path(dest_dir):
+            return limiter.consume
+        return None
 
     def _cleanup_temp(self):
         """Limpa arquivos temporários"""
@@ -404,6 +1130,126 @@ class BackupEngine:
         except Exception as e:
             self.logger.warning(f"Erro na limpeza de temporários: {e}")
 
+        if self._work_dir:
+            # Só remove se vazio: outro backup pode estar usando o mesmo destino
+            try:
+                self._work_dir.rmdir()
+            except OSError:
+                pass
+
+
+class GbakStream:
+    """
+    Processo gbak com backup em stdout, lido em blocos
+
+    Uma thread lê o stdout do gbak e alimenta uma fila limitada
+    (STREAM_QUEUE_SIZE); o consumidor itera chunks() no seu próprio
+    ritmo. Se o consumidor atrasa, a fila enche e o gbak é segurado
+    pelo próprio pipe, sem acumular o backup em memória.
+    """
+
+    def __init__(self, cmd: List[str], is_cancelled: Callable[[], bool], timeout: int = BACKUP_TIMEOUT):
+        self.cmd = cmd
+        self.is_cancelled = is_cancelled
+        self.timeout = timeout
+        self.total_bytes = 0
+        self.timed_out = False
+        self.returncode: Optional[int] = None
+
+        self._process: Optional[subprocess.Popen] = None
+        self._buffer: "queue.Queue" = queue.Queue(maxsize=STREAM_QUEUE_SIZE)
+        self._stop_event = threading.Event()
+        self._stderr_data: List[bytes] = []
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        """Inicia o gbak e as threads de leitura"""
+        self._process = subprocess.Popen(
+            self.cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+        )
+        self._threads = [
+            threading.Thread(target=self._read_stdout, daemon=True),
+            threading.Thread(target=self._read_stderr, daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _put(self, item) -> bool:
+        """Coloca item na fila, desistindo se o stream for encerrado"""
+        while not self._stop_event.is_set():
+            try:
+                self._buffer.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _read_stdout(self):
+        """Lê stdout do gbak e alimenta a fila (bloqueia se cheia)"""
+        try:
+            while not self._stop_event.is_set():
+                chunk = self._process.stdout.read(STREAM_CHUNK_SIZE)
+                if not chunk or not self._put(chunk):
+                    break
+        finally:
+            # Sentinela de fim de fluxo
+            self._put(None)
+
+    def _read_stderr(self):
+        """Drena stderr para evitar bloqueio do gbak"""
+        self._stderr_data.append(self._process.stderr.read())
+
+    def chunks(self) -> Iterator[bytes]:
+        """Entrega os blocos gerados pelo gbak ao consumidor"""
+        inicio = time.monotonic()
+        while True:
+            if self.is_cancelled():
+                return
+            if time.monotonic() - inicio > self.timeout:
+                self.timed_out = True
+                return
+            try:
+                chunk = self._buffer.get(timeout=1)
+            except queue.Empty:
+                continue
+            if chunk is None:
+                return
+            self.total_bytes += len(chunk)
+            yield chunk
+
+    def finish(self, abort: bool = False):
+        """Aguarda o fim do gbak (ou o interrompe) e encerra as threads"""
+        try:
+            if abort or self.is_cancelled() or self.timed_out:
+                self._process.kill()
+            try:
+                self.returncode = self._process.wait(timeout=60)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+                self.returncode = self._process.wait()
+        finally:
+            self._stop_event.set()
+            for thread in self._threads:
+                thread.join(timeout=5)
+
+    @property
+    def stderr_text(self) -> str:
+        return b"".join(self._stderr_data).decode('utf-8', errors='replace')
+
+    def raise_for_status(self):
+        """Converte o resultado do gbak em exceção de backup"""
+        if self.is_cancelled():
+            raise BackupCancelledError("Backup cancelado pelo usuário")
+
+        if self.timed_out:
+            raise BackupError(f"Timeout após {self.timeout}s")
+
+        if self.returncode != 0:
+            raise BackupError(f"gbak falhou: {self.stderr_text or 'Erro desconhecido'}")
+
 
 class BackupError(Exception):
     """Exceção para erros de backup"""
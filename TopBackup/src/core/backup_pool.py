@@ -0,0 +1,130 @@
+"""
+TopBackup - Pool de Execução de Backups
+Executa backups de vários bancos em paralelo com limites por disco
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from pathlib import Path
+from typing import Callable, Dict, Optional, Set
+
+from ..utils.logger import get_logger
+
+
+def volume_key(path: str) -> str:
+    """
+    Identifica o volume de um caminho
+
+    No Windows usa a letra da unidade ou o compartilhamento UNC
+    (\\\\servidor\\pasta). Nos demais sistemas usa o st_dev do diretório
+    existente mais próximo.
+    """
+    if not path:
+        return ""
+
+    drive, _ = os.path.splitdrive(os.path.abspath(path))
+    if drive:
+        return drive.upper()
+
+    current = Path(path).resolve()
+    while not current.exists() and current != current.parent:
+        current = current.parent
+    try:
+        return f"dev:{current.stat().st_dev}"
+    except OSError:
+        return str(current)
+
+
+class BackupPool:
+    """
+    Pool limitado de backups simultâneos
+
+    Além do número total de workers, cada job adquire um semáforo do
+    disco de origem (banco) e um do volume de destino, sempre nessa
+    ordem. Assim dois bancos no mesmo disco não disputam leitura e
+    vários backups não saturam o mesmo destino, enquanto bancos em
+    discos diferentes rodam em paralelo.
+
+    Usage:
+        pool = BackupPool(max_workers=4, per_source_disk=1, per_destination=2)
+        future = pool.submit(db_path, destino, lambda: engine.execute_backup(...))
+    """
+
+    def __init__(self, max_workers: int = 2, per_source_disk: int = 1, per_destination: int = 2):
+        self.max_workers = max(max_workers, 1)
+        self.per_source_disk = max(per_source_disk, 1)
+        self.per_destination = max(per_destination, 1)
+        self.logger = get_logger()
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix="backup"
+        )
+        self._lock = threading.Lock()
+        self._source_limits: Dict[str, threading.Semaphore] = {}
+        self._destination_limits: Dict[str, threading.Semaphore] = {}
+        self._active: Set[str] = set()
+
+    @staticmethod
+    def job_key(database_path: str) -> str:
+        """Chave de um backup: um job por banco na fila ou em execução"""
+        return os.path.normcase(os.path.abspath(database_path))
+
+    def _semaphore(self, limits: Dict[str, threading.Semaphore], key: str, value: int) -> threading.Semaphore:
+        with self._lock:
+            if key not in limits:
+                limits[key] = threading.Semaphore(value)
+            return limits[key]
+
+    def submit(
+        self,
+        database_path: str,
+        destination: str,
+        job: Callable[[], object]
+    ) -> Optional[Future]:
+        """
+        Agenda a execução de um backup
+
+        Returns:
+            Future com o retorno do job, ou None se já existe backup do
+            mesmo banco na fila ou em execução
+        """
+        key = self.job_key(database_path)
+        with self._lock:
+            if key in self._active:
+                return None
+            self._active.add(key)
+
+        source_limit = self._semaphore(
+            self._source_limits, volume_key(database_path), self.per_source_disk
+        )
+        destination_limit = self._semaphore(
+            self._destination_limits, volume_key(destination), self.per_destination
+        )
+
+        def run():
+            try:
+                with source_limit, destination_limit:
+                    return job()
+            finally:
+                with self._lock:
+                    self._active.discard(key)
+
+        try:
+            return self._executor.submit(run)
+        except RuntimeError:
+            # Pool encerrado
+            with self._lock:
+                self._active.discard(key)
+            return None
+
+    @property
+    def active_count(self) -> int:
+        """Backups na fila ou em execução"""
+        with self._lock:
+            return len(self._active)
+
+    def shutdown(self, wait: bool = False):
+        """Encerra o pool (jobs em execução terminam normalmente)"""
+        self._executor.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,593 @@
+"""
+TopBackup - Repositório com Deduplicação
+Armazena backups versionados em chunks definidos por conteúdo (FastCDC)
+"""
+
+import hashlib
+import json
+import os
+import random
+import shutil
+import time
+import uuid
+import zlib
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Set
+
+from ..utils.logger import get_logger
+
+try:
+    import numpy
+except ImportError:  # numpy é opcional (sem ele o chunking roda em Python puro)
+    numpy = None
+
+REPO_DIR_SUFFIX = "_repo"
+MANIFEST_EXTENSION = ".json"
+MANIFEST_FORMAT = 1
+
+# Tamanhos de chunk (média ~1MB, como no FastCDC com chunking normalizado).
+# O mínimo alto pula o hash na primeira metade de cada chunk (Python puro).
+CDC_MIN_SIZE = 512 * 1024
+CDC_AVG_SIZE = 1024 * 1024
+CDC_MAX_SIZE = 4 * 1024 * 1024
+
+# Bytes de hash calculados por vez no chunking com numpy
+CDC_SCAN_BLOCK = 256 * 1024
+
+CHUNK_COMPRESS_LEVEL = 3
+
+# Travas do repositório (arquivos em <repo>/locks): gravação em andamento e gc
+GC_LOCK_NAME = "gc.lock"
+STORE_MARKER_PREFIX = "store-"
+STORE_MARKER_STALE = 24 * 3600  # Marca de gravação mais antiga que isso é de processo que caiu
+GC_LOCK_STALE = 6 * 3600
+LOCK_POLL_INTERVAL = 1.0
+
+
+def _build_gear_table() -> List[int]:
+    """Tabela gear fixa (semente constante: chunks iguais entre execuções)"""
+    rng = random.Random(0x70FBAC)
+    return [rng.getrandbits(32) for _ in range(256)]
+
+
+_GEAR = _build_gear_table()
+_GEAR_ARRAY = numpy.array(_GEAR, dtype=numpy.uint32) if numpy is not None else None
+
+
+class FastCDCChunker:
+    """
+    Divisão de fluxo em chunks definidos por conteúdo (FastCDC)
+
+    Usa hash gear rolante com chunking normalizado: antes do tamanho médio
+    a máscara é mais restritiva e depois mais permissiva, concentrando os
+    tamanhos perto da média. Como o corte depende só do conteúdo, uma
+    alteração no meio do backup desloca apenas os chunks vizinhos.
+
+    Com numpy o hash é calculado em blocos vetorizados (centenas de MB/s);
+    sem ele, byte a byte em Python (~10 MB/s), o que limita o backup no
+    repositório. Os dois caminhos dão exatamente os mesmos cortes.
+    """
+
+    def __init__(
+        self,
+        min_size: int = CDC_MIN_SIZE,
+        avg_size: int = CDC_AVG_SIZE,
+        max_size: int = CDC_MAX_SIZE
+    ):
+        self.min_size = min_size
+        self.avg_size = avg_size
+        self.max_size = max_size
+
+        bits = avg_size.bit_length() - 1
+        # Máscaras com bits contíguos no topo do hash (os bits altos dependem
+        # dos 32 últimos bytes; os baixos, só dos mais recentes)
+        self._mask_small = ((1 << (bits + 2)) - 1) << (32 - bits - 2)
+        self._mask_large = ((1 << (bits - 2)) - 1) << (32 - bits + 2)
+
+        self._buffer = bytearray()
+
+    def _cut_point(self, data: bytearray) -> int:
+        """Retorna o tamanho do próximo chunk a partir do início de data"""
+        size = len(data)
+        if size <= self.min_size:
+            return size
+
+        if numpy is not None:
+            return self._cut_point_numpy(data, size)
+
+        gear = _GEAR
+        fingerprint = 0
+
+        # Laços separados por máscara; iterar a fatia é bem mais rápido que indexar
+        barrier = min(self.avg_size, size)
+        mask = self._mask_small
+        for index, byte in enumerate(data[self.min_size:barrier], self.min_size + 1):
+            fingerprint = (fingerprint + fingerprint + gear[byte]) & 0xFFFFFFFF
+            if not fingerprint & mask:
+                return index
+
+        start = barrier
+        barrier = min(self.max_size, size)
+        mask = self._mask_large
+        for index, byte in enumerate(data[start:barrier], start + 1):
+            fingerprint = (fingerprint + fingerprint + gear[byte]) & 0xFFFFFFFF
+            if not fingerprint & mask:
+                return index
+
+        return barrier
+
+    def _cut_point_numpy(self, data: bytearray, size: int) -> int:
+        """
+        Mesmo corte de _cut_point, com o hash calculado em blocos
+
+        O hash gear dobra a cada byte, então em 32 bits ele é a soma de
+        gear[b] << k dos 32 últimos bytes (k = distância). Cada bloco pega
+        os 31 bytes anteriores (nunca antes de min_size, onde o hash começa
+        zerado) e soma as parcelas por dobramento: 5 passadas em vez de 32.
+        """
+        regions = (
+            (self.min_size, min(self.avg_size, size), self._mask_small),
+            (min(self.avg_size, size), min(self.max_size, size), self._mask_large),
+        )
+        for start, barrier, mask in regions:
+            for pos in range(start, barrier, CDC_SCAN_BLOCK):
+                end = min(pos + CDC_SCAN_BLOCK, barrier)
+                history = max(self.min_size, pos - 31)
+                fingerprint = _GEAR_ARRAY[
+                    numpy.frombuffer(data, dtype=numpy.uint8, count=end - history, offset=history)
+                ]
+                shift = 1
+                while shift < 32:
+                    fingerprint[shift:] += fingerprint[:-shift] << shift
+                    shift *= 2
+                hits = numpy.flatnonzero((fingerprint[pos - history:] & mask) == 0)
+                if hits.size:
+                    return pos + int(hits[0]) + 1
+
+        return min(self.max_size, size)
+
+    def feed(self, data: bytes) -> Iterator[bytes]:
+        """Adiciona dados e retorna os chunks já delimitados"""
+        self._buffer += data
+        # Só corta com max_size disponível: o ponto de corte não muda depois
+        while len(self._buffer) >= self.max_size:
+            cut = self._cut_point(self._buffer)
+            yield bytes(self._buffer[:cut])
+            del self._buffer[:cut]
+
+    def flush(self) -> Iterator[bytes]:
+        """Retorna os chunks restantes no fim do fluxo"""
+        while self._buffer:
+            cut = self._cut_point(self._buffer)
+            yield bytes(self._buffer[:cut])
+            del self._buffer[:cut]
+
+
+@dataclass
+class StoreResult:
+    """Resultado do armazenamento de um backup no repositório"""
+    manifest_path: str
+    total_bytes: int
+    new_bytes: int
+    stored_bytes: int
+    chunk_count: int
+    new_chunks: int
+    sha256: str
+
+
+class DedupError(Exception):
+    """Exceção para erros do repositório de deduplicação"""
+    pass
+
+
+class DedupRepository:
+    """
+    Repositório de backups deduplicados
+
+    Estrutura em disco:
+        <destino>/<CNPJ>_repo/chunks/ab/abcdef...   chunk comprimido (zlib)
+        <destino>/<CNPJ>_repo/manifests/<nome>.json lista de chunks do backup
+
+    Cada chunk é endereçado pelo SHA-256 do conteúdo original, então só
+    chunks novos ocupam espaço a cada backup.
+
+    Os bancos da empresa dividem o repositório e podem gravar ao mesmo
+    tempo. Cada gravação (store, réplica) deixa uma marca em locks/ e o
+    gc só roda sem nenhuma marca, segurando locks/gc.lock; uma gravação
+    que encontra o gc.lock espera. Assim o gc nunca apaga um chunk que
+    uma gravação em andamento deu como existente (cache _known_chunks)
+    ou acabou de gravar sem manifesto ainda.
+    """
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+        self.chunks_dir = self.root / "chunks"
+        self.manifests_dir = self.root / "manifests"
+        self.locks_dir = self.root / "locks"
+        self.logger = get_logger()
+        self._known_chunks: Optional[Set[str]] = None
+
+    @classmethod
+    def for_destination(cls, dest_dir: str, cnpj: str) -> "DedupRepository":
+        """Repositório de uma empresa dentro de um diretório de destino"""
+        cnpj_limpo = ''.join(filter(str.isdigit, cnpj))
+        return cls(os.path.join(dest_dir, f"{cnpj_limpo}{REPO_DIR_SUFFIX}"))
+
+    @classmethod
+    def from_manifest(cls, manifest_path: str) -> "DedupRepository":
+        """Repositório que contém o manifesto informado (.../manifests/x.json)"""
+        return cls(str(Path(manifest_path).resolve().parent.parent))
+
+    # ============ TRAVAS ============
+
+    @staticmethod
+    def _file_age(path: Path) -> Optional[float]:
+        """Idade do arquivo em segundos (None se não existe)"""
+        try:
+            return time.time() - path.stat().st_mtime
+        except OSError:
+            return None
+
+    def _active_stores(self) -> List[Path]:
+        """Marcas de gravação em andamento (as abandonadas são removidas)"""
+        if not self.locks_dir.exists():
+            return []
+        active = []
+        for path in self.locks_dir.glob(f"{STORE_MARKER_PREFIX}*"):
+            age = self._file_age(path)
+            if age is None:
+                continue
+            if age > STORE_MARKER_STALE:
+                self.logger.warning(f"Marca de gravação abandonada removida: {path.name}")
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+                continue
+            active.append(path)
+        return active
+
+    @contextmanager
+    def _storing(self):
+        """Marca uma gravação em andamento (espera o gc terminar)"""
+        self.locks_dir.mkdir(parents=True, exist_ok=True)
+        marker = self.locks_dir / f"{STORE_MARKER_PREFIX}{uuid.uuid4().hex}"
+        gc_lock = self.locks_dir / GC_LOCK_NAME
+        while True:
+            # Marca antes de olhar o gc.lock: o gc confere as marcas depois de criar o dele
+            marker.touch()
+            age = self._file_age(gc_lock)
+            if age is None or age > GC_LOCK_STALE:
+                break
+            marker.unlink()
+            time.sleep(LOCK_POLL_INTERVAL)
+
+        # Índice relido com a marca: o que ele lista não sai mais no gc
+        self._known_chunks = None
+        try:
+            yield
+        finally:
+            try:
+                marker.unlink()
+            except OSError:
+                pass
+
+    def _acquire_gc_lock(self) -> bool:
+        self.locks_dir.mkdir(parents=True, exist_ok=True)
+        gc_lock = self.locks_dir / GC_LOCK_NAME
+        for _ in range(2):
+            try:
+                os.close(os.open(str(gc_lock), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return True
+            except FileExistsError:
+                age = self._file_age(gc_lock)
+                if age is not None and age <= GC_LOCK_STALE:
+                    return False
+                # gc de um processo que caiu
+                try:
+                    gc_lock.unlink()
+                except OSError:
+                    return False
+        return False
+
+    # ============ CHUNKS ============
+
+    def _chunk_path(self, digest: str) -> Path:
+        return self.chunks_dir / digest[:2] / digest
+
+    def _load_known_chunks(self) -> Set[str]:
+        """Carrega índice dos chunks existentes (uma listagem por execução)"""
+        if self._known_chunks is None:
+            known = set()
+            if self.chunks_dir.exists():
+                for prefix_dir in self.chunks_dir.iterdir():
+                    if prefix_dir.is_dir():
+                        known.update(p.name for p in prefix_dir.iterdir() if not p.name.endswith('.tmp'))
+            self._known_chunks = known
+        return self._known_chunks
+
+    def has_chunk(self, digest: str) -> bool:
+        return digest in self._load_known_chunks()
+
+    def _write_chunk(self, digest: str, data: bytes) -> int:
+        """Grava chunk comprimido de forma atômica, retorna bytes em disco"""
+        path = self._chunk_path(digest)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        payload = zlib.compress(data, CHUNK_COMPRESS_LEVEL)
+        temp_path = path.with_name(path.name + ".tmp")
+        with open(temp_path, 'wb') as f:
+            f.write(payload)
+        os.replace(temp_path, path)
+        self._load_known_chunks().add(digest)
+        return len(payload)
+
+    def read_chunk(self, digest: str) -> bytes:
+        """Lê e valida um chunk"""
+        try:
+            with open(self._chunk_path(digest), 'rb') as f:
+                data = zlib.decompress(f.read())
+        except (OSError, zlib.error) as e:
+            raise DedupError(f"Chunk ilegível {digest}: {e}")
+
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise DedupError(f"Chunk corrompido: {digest}")
+        return data
+
+    # ============ MANIFESTOS ============
+
+    def manifest_path(self, name: str) -> Path:
+        """Caminho do manifesto do backup (existindo ou não)"""
+        if not name.endswith(MANIFEST_EXTENSION):
+            name += MANIFEST_EXTENSION
+        return self.manifests_dir / name
+
+    def list_manifests(self) -> List[str]:
+        """Lista nomes dos manifestos (mais antigo primeiro)"""
+        if not self.manifests_dir.exists():
+            return []
+        return sorted(
+            p.name for p in self.manifests_dir.iterdir()
+            if p.name.endswith(MANIFEST_EXTENSION)
+        )
+
+    def load_manifest(self, name: str) -> dict:
+        """Carrega manifesto pelo nome ou caminho"""
+        path = Path(name) if os.path.isabs(name) else self.manifest_path(name)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            raise DedupError(f"Manifesto inválido {name}: {e}")
+
+        if manifest.get('formato') != MANIFEST_FORMAT:
+            raise DedupError(f"Formato de manifesto não suportado: {manifest.get('formato')}")
+        return manifest
+
+    def store(self, chunks: Iterable[bytes], name: str, arcname: str) -> StoreResult:
+        """
+        Armazena um fluxo (ex: stdout do gbak) no repositório
+
+        Args:
+            chunks: Blocos do backup
+            name: Nome do manifesto (sem extensão)
+            arcname: Nome do .fbk reconstruído no export
+
+        Returns:
+            StoreResult com estatísticas de deduplicação
+        """
+        with self._storing():
+            return self._store(chunks, name, arcname)
+
+    def _store(self, chunks: Iterable[bytes], name: str, arcname: str) -> StoreResult:
+        chunker = FastCDCChunker()
+        file_hash = hashlib.sha256()
+        entries: List[list] = []
+        total_bytes = new_bytes = stored_bytes = new_chunks = 0
+
+        def add(chunk: bytes):
+            nonlocal total_bytes, new_bytes, stored_bytes, new_chunks
+            digest = hashlib.sha256(chunk).hexdigest()
+            entries.append([digest, len(chunk)])
+            total_bytes += len(chunk)
+            if not self.has_chunk(digest):
+                stored_bytes += self._write_chunk(digest, chunk)
+                new_bytes += len(chunk)
+                new_chunks += 1
+
+        for data in chunks:
+            file_hash.update(data)
+            for chunk in chunker.feed(data):
+                add(chunk)
+        for chunk in chunker.flush():
+            add(chunk)
+
+        manifest = {
+            'formato': MANIFEST_FORMAT,
+            'nome': name,
+            'arquivo': arcname,
+            'criado_em': datetime.now().isoformat(timespec='seconds'),
+            'tamanho': total_bytes,
+            'sha256': file_hash.hexdigest(),
+            'chunks': entries,
+        }
+
+        # Manifesto só é gravado após todos os chunks estarem no disco
+        manifest_path = self.manifest_path(name)
+        manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = manifest_path.with_name(manifest_path.name + ".tmp")
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(temp_path, manifest_path)
+
+        return StoreResult(
+            manifest_path=str(manifest_path),
+            total_bytes=total_bytes,
+            new_bytes=new_bytes,
+            stored_bytes=stored_bytes,
+            chunk_count=len(entries),
+            new_chunks=new_chunks,
+            sha256=manifest['sha256'],
+        )
+
+    def iter_backup(self, name: str) -> Iterator[bytes]:
+        """Reconstrói o .fbk de um manifesto em blocos, validando o hash final"""
+        manifest = self.load_manifest(name)
+        file_hash = hashlib.sha256()
+        for digest, size in manifest['chunks']:
+            data = self.read_chunk(digest)
+            if len(data) != size:
+                raise DedupError(f"Tamanho inesperado no chunk {digest}")
+            file_hash.update(data)
+            yield data
+
+        if file_hash.hexdigest() != manifest['sha256']:
+            raise DedupError("Hash do backup reconstruído não confere com o manifesto")
+
+    def export(self, name: str, output: BinaryIO) -> int:
+        """
+        Exporta um manifesto como .fbk padrão
+
+        Returns:
+            Bytes escritos
+        """
+        written = 0
+        for data in self.iter_backup(name):
+            output.write(data)
+            written += len(data)
+        return written
+
+    def replicate_to(
+        self,
+        other: "DedupRepository",
+        name: str,
+        throttle: Optional[Callable[[int], None]] = None
+    ) -> int:
+        """
+        Copia para outro repositório os chunks que faltam e o manifesto
+
+        Args:
+            throttle: Limite de banda da cópia (repositório em rede)
+
+        Returns:
+            Bytes copiados
+        """
+        with other._storing():
+            return self._replicate_to(other, name, throttle)
+
+    def _replicate_to(
+        self,
+        other: "DedupRepository",
+        name: str,
+        throttle: Optional[Callable[[int], None]]
+    ) -> int:
+        manifest = self.load_manifest(name)
+        copied = 0
+        for digest, _ in manifest['chunks']:
+            if other.has_chunk(digest):
+                continue
+            target = other._chunk_path(digest)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = target.with_name(target.name + ".tmp")
+            if throttle:
+                throttle(self._chunk_path(digest).stat().st_size)
+            shutil.copyfile(self._chunk_path(digest), temp_path)
+            os.replace(temp_path, target)
+            other._load_known_chunks().add(digest)
+            copied += target.stat().st_size
+
+        target_manifest = other.manifest_path(name)
+        target_manifest.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(self.manifest_path(name), target_manifest)
+        return copied
+
+    def delete_manifest(self, name: str) -> bool:
+        """Remove um manifesto (os chunks saem no próximo gc)"""
+        try:
+            self.manifest_path(name).unlink()
+            return True
+        except OSError:
+            return False
+
+    def gc(self) -> int:
+        """
+        Remove chunks não referenciados por nenhum manifesto
+
+        Com gravação em andamento no repositório (outro banco da empresa)
+        o gc é adiado para a próxima retenção.
+
+        Returns:
+            Bytes liberados
+        """
+        if not self._acquire_gc_lock():
+            self.logger.info("GC do repositório adiado: outro gc em andamento")
+            return 0
+        try:
+            if self._active_stores():
+                self.logger.info("GC do repositório adiado: backup gravando no repositório")
+                return 0
+            # Índice atual (o cache pode ser de antes de outra gravação)
+            self._known_chunks = None
+            return self._collect()
+        finally:
+            try:
+                (self.locks_dir / GC_LOCK_NAME).unlink()
+            except OSError:
+                pass
+
+    def usage_by_manifest(self) -> Dict[str, int]:
+        """
+        Bytes em disco de cada manifesto
+
+        Cada chunk conta para o manifesto mais novo que o usa: a soma dos
+        N mais novos é o espaço ocupado mantendo só eles, e o de um
+        manifesto antigo é o que o gc libera depois de removê-lo.
+        """
+        usage: Dict[str, int] = {}
+        counted: Set[str] = set()
+        # Ordem de gravação (os nomes dos bancos da empresa diferem no sufixo)
+        by_age = sorted(
+            self.list_manifests(),
+            key=lambda name: self._file_age(self.manifest_path(name)) or 0
+        )
+        for name in by_age:
+            total = 0
+            try:
+                chunks = self.load_manifest(name)['chunks']
+            except DedupError:
+                chunks = []
+            for digest, _ in chunks:
+                if digest in counted:
+                    continue
+                counted.add(digest)
+                try:
+                    total += self._chunk_path(digest).stat().st_size
+                except OSError:
+                    pass
+            usage[name] = total
+        return usage
+
+    def _collect(self) -> int:
+        referenced: Set[str] = set()
+        for name in self.list_manifests():
+            try:
+                referenced.update(digest for digest, _ in self.load_manifest(name)['chunks'])
+            except DedupError as e:
+                # Manifesto ilegível: não arrisca remover nada
+                self.logger.warning(f"GC cancelado: {e}")
+                return 0
+
+        freed = 0
+        for digest in list(self._load_known_chunks()):
+            if digest in referenced:
+                continue
+            path = self._chunk_path(digest)
+            try:
+                freed += path.stat().st_size
+                path.unlink()
+                self._known_chunks.discard(digest)
+            except OSError:
+                continue
+        return freed
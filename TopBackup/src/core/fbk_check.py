@@ -0,0 +1,482 @@
+"""
+TopBackup - Checagem do Backup
+Percorre os registros do .fbk enquanto o stream do gbak passa pelo pipeline
+"""
+
+import queue
+import threading
+from typing import Dict, Iterable, Iterator, Optional
+
+from ..config.constants import STREAM_QUEUE_SIZE
+from ..utils.logger import get_logger
+
+# Tipos de registro do formato gbak (burp.h)
+REC_BURP = 0            # Atributos do programa de backup (cabeçalho)
+REC_DATABASE = 1        # Parâmetros lógicos do banco (primeiro registro após o cabeçalho)
+REC_DATA = 6            # Linha de uma tabela
+REC_BLOB = 7            # Blob da linha anterior
+REC_RELATION_DATA = 8   # Início dos dados de uma tabela
+REC_RELATION_END = 9    # Fim dos dados da tabela
+REC_END = 10            # Fim do backup
+REC_ARRAY = 23          # Array da linha anterior
+
+# Atributos (a numeração recomeça em cada tipo de registro)
+ATT_END = 0
+ATT_BACKUP_DATE = 1
+ATT_BACKUP_FORMAT = 2
+ATT_BACKUP_COMPRESS = 4     # Linhas com compressão RLE (padrão do gbak; -e desliga)
+ATT_RELATION_NAME = 1
+ATT_DATA_LENGTH = 1
+ATT_DATA_DATA = 2           # Sem tamanho próprio: o conteúdo da linha vem logo depois
+ATT_XDR_LENGTH = 3          # Tamanho da linha em XDR (backup transportável)
+ATT_BLOB_NUMBER_SEGMENTS = 3
+ATT_BLOB_DATA = 5           # Segmentos do blob, cada um com tamanho de 2 bytes
+
+# Versões conhecidas do formato vão de 1 a 11 (Firebird 4)
+MAX_BACKUP_FORMAT = 32
+
+# Limites de sanidade: linha do Firebird tem no máximo 64KB (um pouco mais em XDR)
+MAX_RECORD_LENGTH = 1024 * 1024
+MAX_RECORD_ATTRIBUTES = 16
+
+# Nomes de tabela: até 63 caracteres UTF-8 (Firebird 4)
+MAX_NAME_LENGTH = 252
+
+# Leitura do .fbk em disco (modo sem streaming)
+FILE_READ_SIZE = 1024 * 1024
+
+_END = object()
+
+
+class _EndOfStream(Exception):
+    """Stream acabou no meio de um registro"""
+    pass
+
+
+class _Reader:
+    """Leitura sequencial sobre os blocos do stream (o estado atravessa os blocos)"""
+
+    def __init__(self, chunks: Iterator[bytes]):
+        self._chunks = chunks
+        self._data = b""
+        self._pos = 0
+        self._base = 0  # Posição no stream do início de _data
+
+    @property
+    def position(self) -> int:
+        return self._base + self._pos
+
+    def _next_chunk(self) -> Optional[bytes]:
+        for chunk in self._chunks:
+            if chunk:
+                return chunk
+        return None
+
+    def _fill(self) -> bool:
+        """Passa para o próximo bloco quando o atual acabou"""
+        while self._pos >= len(self._data):
+            chunk = self._next_chunk()
+            if chunk is None:
+                return False
+            self._base += len(self._data)
+            self._data = chunk
+            self._pos = 0
+        return True
+
+    def _extend(self) -> bool:
+        """Junta o resto do bloco atual com o próximo (registro na divisa)"""
+        chunk = self._next_chunk()
+        if chunk is None:
+            return False
+        self._base += self._pos
+        self._data = self._data[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def at_end(self) -> bool:
+        return not self._fill()
+
+    def byte(self) -> int:
+        if self._pos >= len(self._data) and not self._fill():
+            raise _EndOfStream()
+        value = self._data[self._pos]
+        self._pos += 1
+        return value
+
+    def read(self, size: int) -> bytes:
+        while len(self._data) - self._pos < size:
+            if not self._extend():
+                raise _EndOfStream()
+        value = self._data[self._pos:self._pos + size]
+        self._pos += size
+        return value
+
+    def peek(self, size: int) -> bytes:
+        """Até size bytes sem consumir (menos só no fim do stream)"""
+        while len(self._data) - self._pos < size and self._extend():
+            pass
+        return self._data[self._pos:self._pos + size]
+
+    def skip(self, size: int):
+        while size > 0:
+            if not self._fill():
+                raise _EndOfStream()
+            step = min(size, len(self._data) - self._pos)
+            self._pos += step
+            size -= step
+
+    def find(self, pattern: bytes) -> bool:
+        """Avança até a próxima ocorrência de pattern (False no fim do stream)"""
+        while True:
+            index = self._data.find(pattern, self._pos)
+            if index >= 0:
+                self._pos = index
+                return True
+            # Guarda o fim do bloco: o padrão pode começar nele
+            self._pos = max(self._pos, len(self._data) - len(pattern) + 1)
+            if not self._extend():
+                self._pos = len(self._data)
+                return False
+
+    def skip_rle(self, length: int):
+        """
+        Percorre uma linha comprimida pelo gbak até expandir length bytes
+
+        Cada trecho começa com um byte com sinal: positivo, são n bytes
+        literais; negativo, um byte repetido -n vezes.
+        """
+        while length > 0:
+            if not self._fill():
+                raise _EndOfStream()
+            data, pos, end = self._data, self._pos, len(self._data)
+            while length > 0 and pos < end:
+                count = data[pos]
+                if count < 128:
+                    if count > length:
+                        raise FbkCheckError(
+                            f"Estrutura inválida na posição {self._base + pos}: "
+                            f"trecho comprimido passa do tamanho da linha"
+                        )
+                    if pos + 1 + count > end:
+                        break
+                    pos += 1 + count
+                    length -= count
+                else:
+                    run = 256 - count
+                    if run > length:
+                        raise FbkCheckError(
+                            f"Estrutura inválida na posição {self._base + pos}: "
+                            f"trecho comprimido passa do tamanho da linha"
+                        )
+                    if pos + 2 > end:
+                        break
+                    pos += 2
+                    length -= run
+            self._pos = pos
+            if length > 0 and pos < end and not self._extend():
+                # Trecho cortado na divisa dos blocos e sem próximo bloco
+                raise _EndOfStream()
+
+
+class _Walker:
+    """
+    Percorre o stream do .fbk conferindo o enquadramento dos registros
+
+    Cabeçalho: rec_burp com atributos (tipo, tamanho, valor) até
+    att_end, versão do formato e rec_database em seguida.
+
+    Dados das tabelas (quase todo o volume do backup): cada seção vai
+    de rec_relation_data a rec_relation_end e é percorrida registro a
+    registro: os atributos de cada linha (rec_data) com o tamanho dela,
+    o conteúdo comprimido (RLE) ou não, que precisa expandir exatamente
+    para esse tamanho, e os blobs (rec_blob) segmento por segmento. Um
+    byte fora do lugar em qualquer ponto da seção quebra o enquadramento
+    e a checagem falha, assim como o stream acabar no meio de uma seção.
+
+    Os registros de metadados entre as seções (domínios, triggers,
+    procedures...) têm codificação própria por atributo e não são
+    interpretados: o walker procura o início da próxima seção de dados,
+    reconhecido pelo registro completo (rec_relation_data, nome da
+    tabela, att_end, seguido de rec_data ou rec_relation_end). Linhas
+    com array (rec_array, raro) encerram a conferência daquela seção.
+    """
+
+    def __init__(self, reader: _Reader):
+        self.reader = reader
+        self.logger = get_logger()
+        self.compressed = False
+        self.tables = 0
+        self.records = 0
+        self.blobs = 0
+
+    def walk(self):
+        """
+        Raises:
+            FbkCheckError: Estrutura inválida ou stream truncado
+        """
+        try:
+            self._header()
+            while self.reader.find(bytes((REC_RELATION_DATA, ATT_RELATION_NAME))):
+                name = self._section_start()
+                if name is None:
+                    self.reader.skip(1)
+                    continue
+                self._section(name)
+        except _EndOfStream:
+            raise FbkCheckError(f"Backup truncado na posição {self.reader.position}")
+
+    def _error(self, message: str) -> "FbkCheckError":
+        return FbkCheckError(f"Estrutura inválida na posição {self.reader.position}: {message}")
+
+    def _attribute(self) -> bytes:
+        """Valor de um atributo (tamanho de 1 byte + valor)"""
+        return self.reader.read(self.reader.byte())
+
+    def _header(self):
+        reader = self.reader
+        if reader.at_end():
+            raise _EndOfStream()
+        if reader.byte() != REC_BURP:
+            raise FbkCheckError("Cabeçalho inválido: arquivo não começa com registro de backup")
+
+        attributes: Dict[int, bytes] = {}
+        while True:
+            attribute = reader.byte()
+            if attribute == ATT_END:
+                break
+            attributes[attribute] = self._attribute()
+
+        backup_format = attributes.get(ATT_BACKUP_FORMAT)
+        if not backup_format or len(backup_format) > 4:
+            raise FbkCheckError("Cabeçalho inválido: versão do formato ausente")
+        version = int.from_bytes(backup_format, 'little')
+        if not 1 <= version <= MAX_BACKUP_FORMAT:
+            raise FbkCheckError(f"Cabeçalho inválido: versão do formato {version}")
+
+        compress = attributes.get(ATT_BACKUP_COMPRESS)
+        self.compressed = bool(compress) and int.from_bytes(compress, 'little') != 0
+
+        record = reader.peek(1)
+        if not record:
+            raise _EndOfStream()
+        if record[0] != REC_DATABASE:
+            raise FbkCheckError(
+                f"Estrutura inválida: registro {record[0]} após o cabeçalho (esperado rec_database)"
+            )
+
+    def _section_start(self) -> Optional[str]:
+        """Nome da tabela se a posição atual é o início de uma seção de dados"""
+        head = self.reader.peek(MAX_NAME_LENGTH + 8)
+        if len(head) < 5:
+            return None
+        length = head[2]
+        if not 1 <= length <= MAX_NAME_LENGTH or len(head) < length + 5:
+            return None
+        name = head[3:3 + length]
+        if any(c < 0x20 or c == 0x7F for c in name) or head[3 + length] != ATT_END:
+            return None
+
+        following = head[4 + length:]
+        if following[0] == REC_RELATION_END:
+            pass
+        elif following[0] == REC_DATA:
+            if len(following) < 3 or following[1] != ATT_DATA_LENGTH or not 1 <= following[2] <= 8:
+                return None
+        else:
+            return None
+
+        self.reader.skip(4 + length)
+        return name.decode('utf-8', errors='replace').rstrip()
+
+    def _section(self, name: str):
+        self.tables += 1
+        reader = self.reader
+        while True:
+            try:
+                record = reader.byte()
+            except _EndOfStream:
+                raise FbkCheckError(f"Backup truncado nos dados da tabela {name}")
+            if record == REC_DATA:
+                self._data(name)
+            elif record == REC_BLOB:
+                self._blob(name)
+            elif record == REC_RELATION_END:
+                return
+            elif record == REC_ARRAY:
+                self.logger.debug(f"Tabela {name} com array: restante da seção não conferido")
+                return
+            else:
+                raise self._error(f"registro {record} nos dados da tabela {name}")
+
+    def _numeric(self, value: bytes) -> int:
+        if not 1 <= len(value) <= 8:
+            raise self._error(f"atributo numérico com {len(value)} bytes")
+        return int.from_bytes(value, 'little')
+
+    def _data(self, name: str):
+        """Linha: atributos até att_data_data e o conteúdo"""
+        lengths: Dict[int, int] = {}
+        for _ in range(MAX_RECORD_ATTRIBUTES):
+            attribute = self.reader.byte()
+            if attribute == ATT_DATA_DATA:
+                break
+            if attribute == ATT_END:
+                raise self._error(f"linha da tabela {name} sem conteúdo")
+            value = self._attribute()
+            if attribute in (ATT_DATA_LENGTH, ATT_XDR_LENGTH):
+                lengths[attribute] = self._numeric(value)
+        else:
+            raise self._error(f"linha da tabela {name} sem conteúdo")
+
+        # Backup transportável: o conteúdo está em XDR, com tamanho próprio
+        length = lengths.get(ATT_XDR_LENGTH, lengths.get(ATT_DATA_LENGTH))
+        if not length or length > MAX_RECORD_LENGTH:
+            raise self._error(f"tamanho de linha {length} na tabela {name}")
+
+        if self.compressed:
+            self.reader.skip_rle(length)
+        else:
+            self.reader.skip(length)
+        self.records += 1
+
+    def _blob(self, name: str):
+        """Blob: atributos até att_blob_data e os segmentos"""
+        segments = 0
+        for _ in range(MAX_RECORD_ATTRIBUTES):
+            attribute = self.reader.byte()
+            if attribute == ATT_BLOB_DATA:
+                break
+            if attribute == ATT_END:
+                raise self._error(f"blob da tabela {name} sem dados")
+            value = self._attribute()
+            if attribute == ATT_BLOB_NUMBER_SEGMENTS:
+                segments = self._numeric(value)
+        else:
+            raise self._error(f"blob da tabela {name} sem dados")
+
+        for _ in range(segments):
+            size = self.reader.read(2)
+            self.reader.skip(size[0] | size[1] << 8)
+        self.blobs += 1
+
+
+class FbkStreamCheck:
+    """
+    Checagem estrutural do stream do gbak, numa thread separada
+
+    Os blocos são repassados por referência para a thread da checagem
+    por uma fila limitada (STREAM_QUEUE_SIZE), então o backup não é lido
+    de novo e a memória fica limitada. A thread percorre o cabeçalho e,
+    registro a registro, os dados de cada tabela (ver _Walker); no fim
+    o último byte precisa ser rec_end. Os metadados entre as seções de
+    dados não são interpretados.
+
+    Usage:
+        check = FbkStreamCheck()
+        check.start()
+        for chunk in check.tap(stream.chunks()):
+            writer.write(chunk)
+        check.finish()  # FbkCheckError se inválido
+    """
+
+    def __init__(self):
+        self._queue: "queue.Queue" = queue.Queue(maxsize=STREAM_QUEUE_SIZE)
+        self._thread: Optional[threading.Thread] = None
+        self._walker: Optional[_Walker] = None
+        self._last_byte: Optional[int] = None
+        self.total_bytes = 0
+        self.error: Optional[str] = None
+
+    @property
+    def tables(self) -> int:
+        return self._walker.tables if self._walker else 0
+
+    @property
+    def records(self) -> int:
+        return self._walker.records if self._walker else 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="fbk-check", daemon=True)
+        self._thread.start()
+
+    def tap(self, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """Repassa os blocos, entregando uma referência de cada um à checagem"""
+        for chunk in self._track(chunks):
+            if chunk:
+                self._queue.put(chunk)
+            yield chunk
+
+    def _track(self, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        for chunk in chunks:
+            if chunk:
+                self.total_bytes += len(chunk)
+                self._last_byte = chunk[-1]
+            yield chunk
+
+    def _chunks(self) -> Iterator[bytes]:
+        while True:
+            chunk = self._queue.get()
+            if chunk is _END:
+                return
+            yield chunk
+
+    def _run(self):
+        chunks = self._chunks()
+        self._walker = _Walker(_Reader(chunks))
+        try:
+            self._walker.walk()
+        except FbkCheckError as e:
+            self.error = str(e)
+        except Exception as e:
+            self.error = f"Erro na checagem: {e}"
+        # Esvazia a fila até o fim: tap() não pode travar na fila cheia
+        for _ in chunks:
+            pass
+
+    def finish(self, abort: bool = False):
+        """
+        Espera a checagem terminar e confere o resultado
+
+        Args:
+            abort: Backup interrompido (só encerra a thread)
+
+        Raises:
+            FbkCheckError: Estrutura inválida ou backup truncado
+        """
+        if self._thread is None:
+            return
+        self._queue.put(_END)
+        self._thread.join()
+        self._thread = None
+        if abort:
+            return
+
+        if self.error:
+            raise FbkCheckError(self.error)
+        if self._last_byte != REC_END:
+            raise FbkCheckError("Backup truncado: marcador de fim (rec_end) ausente")
+
+    @staticmethod
+    def check_file(fbk_path: str) -> "FbkStreamCheck":
+        """
+        Mesma checagem para um .fbk em disco (lê o arquivo uma vez, nesta thread)
+
+        Raises:
+            FbkCheckError: Estrutura inválida ou backup truncado
+        """
+        check = FbkStreamCheck()
+        with open(fbk_path, 'rb') as f:
+            blocks = check._track(iter(lambda: f.read(FILE_READ_SIZE), b""))
+            check._walker = _Walker(_Reader(blocks))
+            check._walker.walk()
+            # Blocos que sobraram depois do walker (não acontece: ele lê até o fim)
+            for _ in blocks:
+                pass
+        if check._last_byte != REC_END:
+            raise FbkCheckError("Backup truncado: marcador de fim (rec_end) ausente")
+        return check
+
+
+class FbkCheckError(Exception):
+    """Exceção para backup com estrutura inválida ou truncado"""
+    pass
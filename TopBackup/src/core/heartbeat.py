@@ -0,0 +1,137 @@
+"""
+TopBackup - Heartbeat
+Registro periódico da interação da empresa (DATA_ULTIMA_INTERACAO), agrupado e com jitter
+"""
+
+import random
+import threading
+import time
+from typing import Callable, Optional
+
+from ..config.constants import HEARTBEAT_JITTER, HEARTBEAT_STARTUP_DELAY, HEARTBEAT_PIGGYBACK
+from ..database.write_journal import WriteJournal
+from ..utils.logger import get_logger
+
+
+class Heartbeat:
+    """
+    Heartbeat da empresa no MySQL
+
+    Início do app, backup concluído e o timer periódico pedem o registro
+    da interação, mas sai no máximo um a cada intervalo: beat() fora do
+    prazo não grava nada (o próximo periódico já cobre). Quando o diário
+    grava outra coisa (log de backup, envio FTP) e já passou metade do
+    intervalo, a interação vai junto no mesmo lote, sem round-trip próprio,
+    e o periódico é adiado.
+
+    O primeiro registro sai num momento aleatório do primeiro minuto e
+    cada intervalo varia ±10%, então clientes reiniciados juntos por uma
+    atualização não batem no servidor ao mesmo tempo.
+
+    Usage:
+        heartbeat = Heartbeat(journal, lambda: settings.app.empresa_id, 600)
+        heartbeat.start()
+        heartbeat.beat()
+    """
+
+    def __init__(
+        self,
+        journal: WriteJournal,
+        empresa_id: Callable[[], Optional[int]],
+        intervalo: float,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        Args:
+            journal: Diário das gravações MySQL
+            empresa_id: Retorna o ID da empresa (None antes da sincronização)
+            intervalo: Segundos entre registros
+        """
+        self.journal = journal
+        self.empresa_id = empresa_id
+        self.logger = get_logger()
+        self._clock = clock
+        self._intervalo = max(intervalo, 1)
+
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+        self._last: Optional[float] = None  # Último registro (clock)
+        self._next = clock() + random.uniform(0, min(HEARTBEAT_STARTUP_DELAY, self._intervalo))
+
+        journal.set_piggyback(self.piggyback)
+
+    def configure(self, intervalo: float):
+        """Troca o intervalo (vale a partir do próximo registro)"""
+        with self._condition:
+            self._intervalo = max(intervalo, 1)
+            if self._last is not None:
+                self._next = min(self._next, self._last + self._jittered())
+            self._condition.notify_all()
+
+    def beat(self) -> bool:
+        """
+        Pede o registro da interação (ex: backup concluído)
+
+        Returns:
+            True se gravou; False se já houve registro dentro do intervalo
+        """
+        id_empresa = self._take(1.0)
+        if id_empresa is None:
+            return False
+        self.journal.update_empresa_interacao(id_empresa)
+        return True
+
+    def piggyback(self) -> Optional[int]:
+        """Empresa cuja interação vai junto da gravação atual do diário (None se não precisa)"""
+        return self._take(HEARTBEAT_PIGGYBACK)
+
+    def start(self):
+        """Inicia os registros periódicos"""
+        self._thread = threading.Thread(target=self._loop, name="heartbeat", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Para os registros periódicos"""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+
+    def _jittered(self) -> float:
+        return self._intervalo * random.uniform(1 - HEARTBEAT_JITTER, 1 + HEARTBEAT_JITTER)
+
+    def _take(self, fracao: float) -> Optional[int]:
+        """Marca o registro se já passou a fração do intervalo desde o último"""
+        id_empresa = self.empresa_id()
+        if not id_empresa:
+            return None
+        with self._condition:
+            agora = self._clock()
+            if self._last is not None and agora - self._last < self._intervalo * fracao:
+                return None
+            self._last = agora
+            self._next = agora + self._jittered()
+        return id_empresa
+
+    def _loop(self):
+        while True:
+            with self._condition:
+                if self._stopped:
+                    return
+                espera = self._next - self._clock()
+                if espera > 0:
+                    # Acorda no próximo registro, no configure() ou no stop()
+                    self._condition.wait(timeout=espera)
+                    continue
+
+            # Registro periódico: o prazo já venceu
+            id_empresa = self._take(0.0)
+            if id_empresa is None:
+                with self._condition:
+                    # Empresa ainda não sincronizada
+                    self._next = self._clock() + self._jittered()
+                continue
+            try:
+                self.journal.update_empresa_interacao(id_empresa)
+            except Exception as e:
+                self.logger.error(f"Erro no heartbeat: {e}")
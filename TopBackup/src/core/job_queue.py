@@ -0,0 +1,324 @@
+"""
+TopBackup - Fila de Jobs de Backup
+Fila persistente (SQLite) com prioridade, deduplicação e execução única por banco
+"""
+
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import closing
+from dataclasses import dataclass, asdict
+from datetime import datetime, timedelta, time as dt_time
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+from .backup_engine import BackupResult
+from .backup_pool import BackupPool
+from ..database.models import AgendaBackup
+from ..utils.logger import get_logger
+
+# Prioridades (maior executa primeiro)
+PRIORIDADE_AGENDADO = 0
+PRIORIDADE_MANUAL = 10
+
+# Status dos jobs
+JOB_PENDENTE = "pendente"
+JOB_EXECUTANDO = "executando"
+JOB_CONCLUIDO = "concluido"
+JOB_FALHA = "falha"
+JOB_EXPIRADO = "expirado"
+
+# Jobs pendentes mais antigos que isso são descartados ao iniciar
+JOB_MAX_AGE_HOURS = 12
+# Histórico de jobs finalizados mantido no arquivo
+JOB_HISTORY_DAYS = 30
+# Resultados mantidos em memória para quem aguarda um job
+MAX_RESULTS = 50
+
+
+@dataclass
+class BackupJob:
+    """Job de backup da fila"""
+    id: int
+    chave: str
+    agenda: AgendaBackup
+    manual: bool
+    prioridade: int
+    status: str = JOB_PENDENTE
+
+
+def _agenda_to_json(agenda: AgendaBackup) -> str:
+    data = asdict(agenda)
+    if isinstance(data['horario'], dt_time):
+        data['horario'] = data['horario'].strftime('%H:%M')
+    return json.dumps(data)
+
+
+class JobQueue:
+    """
+    Fila única de backups do controller
+
+    Todo pedido de backup (agendado, manual, IPC, tray) entra aqui:
+    - Pedidos pendentes para o mesmo banco são mesclados em um só job
+      (fica a maior prioridade e o flag manual).
+    - Pedido para um banco com backup em execução aguarda esse backup
+      em vez de disparar outro gbak (execução única por banco).
+    - O despachante entrega ao BackupPool o pendente de maior
+      prioridade sempre que há worker livre.
+
+    A fila é gravada em SQLite no diretório de dados, então pedidos
+    pendentes sobrevivem a um reinício do serviço.
+
+    Usage:
+        queue = JobQueue(path, pool, runner, resolver)
+        queue.start()
+        job_id = queue.enqueue(agenda, manual=True)
+        result = queue.wait(job_id)
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        pool: BackupPool,
+        runner: Callable[[BackupJob], BackupResult],
+        resolver: Callable[[AgendaBackup], Tuple[str, str]]
+    ):
+        """
+        Args:
+            path: Arquivo SQLite da fila
+            pool: Pool que executa os backups
+            runner: Executa um job e retorna o resultado
+            resolver: Retorna (caminho do banco, destino) de uma agenda
+        """
+        self.path = path
+        self.pool = pool
+        self.runner = runner
+        self.resolver = resolver
+        self.logger = get_logger()
+
+        self._condition = threading.Condition()
+        self._running: Dict[str, int] = {}  # chave do banco -> id do job
+        self._results: "OrderedDict[int, BackupResult]" = OrderedDict()
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+
+        self._init_db()
+
+    # ============ PERSISTÊNCIA ============
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(str(self.path), timeout=30)
+
+    def _init_db(self):
+        """Cria a tabela e recupera jobs interrompidos"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        agora = datetime.now()
+        with closing(self._connect()) as conn, conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS JOBS (
+                    ID INTEGER PRIMARY KEY AUTOINCREMENT,
+                    CHAVE TEXT NOT NULL,
+                    AGENDA TEXT NOT NULL,
+                    MANUAL INTEGER NOT NULL DEFAULT 0,
+                    PRIORIDADE INTEGER NOT NULL DEFAULT 0,
+                    STATUS TEXT NOT NULL,
+                    CRIADO_EM TEXT NOT NULL,
+                    INICIADO_EM TEXT,
+                    FINALIZADO_EM TEXT,
+                    MENSAGEM TEXT
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS IDX_JOBS_STATUS ON JOBS (STATUS, PRIORIDADE)")
+
+            # Backup interrompido (queda do serviço) volta para a fila
+            conn.execute(
+                "UPDATE JOBS SET STATUS = ?, INICIADO_EM = NULL WHERE STATUS = ?",
+                (JOB_PENDENTE, JOB_EXECUTANDO)
+            )
+            # Pedidos antigos demais não fazem mais sentido
+            conn.execute(
+                "UPDATE JOBS SET STATUS = ?, FINALIZADO_EM = ? WHERE STATUS = ? AND CRIADO_EM < ?",
+                (JOB_EXPIRADO, agora.isoformat(), JOB_PENDENTE,
+                 (agora - timedelta(hours=JOB_MAX_AGE_HOURS)).isoformat())
+            )
+            conn.execute(
+                "DELETE FROM JOBS WHERE STATUS NOT IN (?, ?) AND CRIADO_EM < ?",
+                (JOB_PENDENTE, JOB_EXECUTANDO,
+                 (agora - timedelta(days=JOB_HISTORY_DAYS)).isoformat())
+            )
+
+    def _set_status(self, job_id: int, status: str, mensagem: Optional[str] = None):
+        campo = "INICIADO_EM" if status == JOB_EXECUTANDO else "FINALIZADO_EM"
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                f"UPDATE JOBS SET STATUS = ?, {campo} = ?, MENSAGEM = ? WHERE ID = ?",
+                (status, datetime.now().isoformat(), mensagem, job_id)
+            )
+
+    def _next_pending(self) -> Optional[BackupJob]:
+        """Pendente de maior prioridade cujo banco não está em execução"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                """
+                SELECT ID, CHAVE, AGENDA, MANUAL, PRIORIDADE FROM JOBS
+                WHERE STATUS = ?
+                ORDER BY PRIORIDADE DESC, ID
+                """,
+                (JOB_PENDENTE,)
+            ).fetchall()
+
+        for job_id, chave, agenda_json, manual, prioridade in rows:
+            if chave in self._running:
+                continue
+            return BackupJob(
+                id=job_id,
+                chave=chave,
+                agenda=AgendaBackup(**json.loads(agenda_json)),
+                manual=bool(manual),
+                prioridade=prioridade
+            )
+        return None
+
+    # ============ API ============
+
+    def enqueue(
+        self,
+        agenda: AgendaBackup,
+        manual: bool = False,
+        prioridade: Optional[int] = None
+    ) -> int:
+        """
+        Adiciona pedido de backup (ou mescla com um existente)
+
+        Returns:
+            ID do job que vai atender o pedido
+        """
+        if prioridade is None:
+            prioridade = PRIORIDADE_MANUAL if manual else PRIORIDADE_AGENDADO
+
+        database_path, _ = self.resolver(agenda)
+        chave = BackupPool.job_key(database_path)
+
+        with self._condition:
+            # Mesmo banco em execução: o pedido é atendido por esse backup
+            if chave in self._running:
+                self.logger.info("Backup deste banco já em execução: pedido mesclado")
+                return self._running[chave]
+
+            with closing(self._connect()) as conn, conn:
+                row = conn.execute(
+                    "SELECT ID FROM JOBS WHERE CHAVE = ? AND STATUS = ? ORDER BY ID LIMIT 1",
+                    (chave, JOB_PENDENTE)
+                ).fetchone()
+
+                if row:
+                    job_id = row[0]
+                    conn.execute(
+                        """
+                        UPDATE JOBS SET PRIORIDADE = MAX(PRIORIDADE, ?),
+                                        MANUAL = MAX(MANUAL, ?)
+                        WHERE ID = ?
+                        """,
+                        (prioridade, int(manual), job_id)
+                    )
+                    self.logger.info(f"Pedido de backup mesclado no job {job_id}")
+                else:
+                    cursor = conn.execute(
+                        """
+                        INSERT INTO JOBS (CHAVE, AGENDA, MANUAL, PRIORIDADE, STATUS, CRIADO_EM)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                        """,
+                        (chave, _agenda_to_json(agenda), int(manual), prioridade,
+                         JOB_PENDENTE, datetime.now().isoformat())
+                    )
+                    job_id = cursor.lastrowid
+
+            self._condition.notify_all()
+            return job_id
+
+    def wait(self, job_id: int, timeout: Optional[float] = None) -> BackupResult:
+        """Aguarda o fim de um job e retorna o resultado"""
+        with self._condition:
+            finished = self._condition.wait_for(
+                lambda: job_id in self._results or self._stopped,
+                timeout=timeout
+            )
+            if job_id in self._results:
+                return self._results[job_id]
+
+        message = "Fila de backup encerrada" if finished else "Tempo esgotado aguardando o backup"
+        return BackupResult(success=False, message=message)
+
+    def pending_count(self) -> int:
+        """Jobs aguardando execução"""
+        with closing(self._connect()) as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM JOBS WHERE STATUS = ?", (JOB_PENDENTE,)
+            ).fetchone()[0]
+
+    # ============ DESPACHO ============
+
+    def start(self):
+        """Inicia o despachante"""
+        self._thread = threading.Thread(target=self._dispatch_loop, name="job-queue", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Para o despachante (pendentes continuam gravados)"""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+
+    def _dispatch_loop(self):
+        while True:
+            with self._condition:
+                if self._stopped:
+                    return
+
+                job = None
+                if self.pool.active_count < self.pool.max_workers:
+                    job = self._next_pending()
+
+                if job is None:
+                    # Acorda com novo pedido, fim de job ou a cada minuto
+                    self._condition.wait(timeout=60)
+                    continue
+
+                self._running[job.chave] = job.id
+
+            self._dispatch(job)
+
+    def _dispatch(self, job: BackupJob):
+        """Entrega o job ao pool"""
+        database_path, destination = self.resolver(job.agenda)
+        self._set_status(job.id, JOB_EXECUTANDO)
+
+        future = self.pool.submit(database_path, destination, lambda: self.runner(job))
+        if future is None:
+            self._finish(job, BackupResult(success=False, message="Backup já em execução"))
+            return
+
+        def on_done(done):
+            try:
+                result = done.result()
+            except Exception as e:
+                self.logger.error(f"Erro no job de backup {job.id}: {e}")
+                result = BackupResult(success=False, message=str(e))
+            self._finish(job, result)
+
+        future.add_done_callback(on_done)
+
+    def _finish(self, job: BackupJob, result: BackupResult):
+        """Registra o resultado e libera o banco"""
+        try:
+            self._set_status(job.id, JOB_CONCLUIDO if result.success else JOB_FALHA, result.message)
+        except sqlite3.Error as e:
+            self.logger.warning(f"Erro ao gravar status do job {job.id}: {e}")
+
+        with self._condition:
+            self._running.pop(job.chave, None)
+            self._results[job.id] = result
+            while len(self._results) > MAX_RESULTS:
+                self._results.popitem(last=False)
+            self._condition.notify_all()
@@ -0,0 +1,351 @@
+"""
+TopBackup - Motor de Backup Incremental
+Backups físicos com nbackup (níveis 0/1/2) e cadeia de restauração
+"""
+
+import json
+import os
+import subprocess
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+from ..config.settings import Settings
+from ..config.constants import BACKUP_TIMEOUT, NBACKUP_EXTENSION
+from ..database.models import Empresa
+from ..utils.logger import get_logger
+from ..utils.file_utils import FileUtils
+
+CHAIN_DIR_SUFFIX = "_nbackup"
+CHAIN_FILENAME = "cadeia.json"
+CHAIN_FORMAT = 1
+
+# Índice = datetime.weekday()
+DIAS_SEMANA = ['SEG', 'TER', 'QUA', 'QUI', 'SEX', 'SAB', 'DOM']
+
+
+@dataclass
+class NBackupEntry:
+    """Arquivo de uma cadeia de backups incrementais"""
+    nivel: int
+    arquivo: str
+    data: str
+    tamanho: int = 0
+    sha256: Optional[str] = None
+
+
+class BackupChain:
+    """
+    Metadados da cadeia de backups incrementais (cadeia.json)
+
+    Um backup de nível N contém as páginas alteradas desde o último
+    nível N-1. Para restaurar é preciso aplicar, em ordem, o nível 0 e
+    cada nível intermediário até o arquivo desejado.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        self.path = self.directory / CHAIN_FILENAME
+        self.entries: List[NBackupEntry] = self._load()
+
+    @classmethod
+    def for_destination(cls, dest_dir: str, cnpj: str, sufixo: str = "") -> "BackupChain":
+        """Cadeia de um banco da empresa dentro de um diretório de destino"""
+        cnpj_limpo = ''.join(filter(str.isdigit, cnpj))
+        return cls(os.path.join(dest_dir, f"{cnpj_limpo}{sufixo}{CHAIN_DIR_SUFFIX}"))
+
+    def _load(self) -> List[NBackupEntry]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return []
+
+        if data.get('formato') != CHAIN_FORMAT:
+            return []
+        return [NBackupEntry(**entry) for entry in data.get('backups', [])]
+
+    def save(self):
+        """Grava a cadeia de forma atômica"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        temp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(
+                {'formato': CHAIN_FORMAT, 'backups': [asdict(e) for e in self.entries]},
+                f, indent=2
+            )
+        os.replace(temp_path, self.path)
+
+    def add(self, entry: NBackupEntry):
+        self.entries.append(entry)
+
+    def last_of_level(self, nivel: int) -> Optional[NBackupEntry]:
+        """Último backup do nível informado"""
+        for entry in reversed(self.entries):
+            if entry.nivel == nivel:
+                return entry
+        return None
+
+    def is_available(self, entry: NBackupEntry) -> bool:
+        """Verifica se o arquivo do backup ainda está no diretório"""
+        return (self.directory / entry.arquivo).exists()
+
+    def restore_sequence(self, arquivo: str) -> List[NBackupEntry]:
+        """
+        Arquivos a aplicar (nível 0 primeiro) para restaurar um backup
+
+        Raises:
+            NBackupError: Backup fora da cadeia ou cadeia incompleta
+        """
+        index = next(
+            (i for i, entry in enumerate(self.entries) if entry.arquivo == arquivo),
+            None
+        )
+        if index is None:
+            raise NBackupError(f"Backup não encontrado na cadeia: {arquivo}")
+
+        sequence = [self.entries[index]]
+        needed = self.entries[index].nivel - 1
+        for entry in reversed(self.entries[:index]):
+            if needed < 0:
+                break
+            if entry.nivel == needed:
+                sequence.append(entry)
+                needed -= 1
+            elif entry.nivel < needed:
+                break
+
+        if needed >= 0:
+            raise NBackupError(f"Cadeia incompleta: falta backup de nível {needed}")
+
+        sequence.reverse()
+        missing = [entry.arquivo for entry in sequence if not self.is_available(entry)]
+        if missing:
+            raise NBackupError(f"Arquivos da cadeia ausentes: {', '.join(missing)}")
+
+        return sequence
+
+    def starts_after(self, entry: NBackupEntry, base: NBackupEntry) -> bool:
+        """Verifica se entry foi gerado depois de base na cadeia"""
+        return self.entries.index(entry) > self.entries.index(base)
+
+
+class NBackupEngine:
+    """
+    Motor de backup físico incremental com nbackup
+
+    O nível é escolhido pelo dia da semana (BackupConfig.nbackup_dia_nivel0
+    e nbackup_dia_nivel1). Sem base disponível no destino o nível cai
+    para o anterior, então a cadeia sempre pode ser restaurada.
+    """
+
+    def __init__(self, settings: Settings):
+        self.settings = settings
+        self.logger = get_logger()
+
+    def find_nbackup(self) -> str:
+        """Localiza o nbackup no mesmo diretório do gbak"""
+        executable = "nbackup.exe" if os.name == 'nt' else "nbackup"
+        nbackup_path = Path(self.settings.firebird.gbak_path).with_name(executable)
+        if not nbackup_path.exists():
+            raise NBackupError(f"nbackup não encontrado: {nbackup_path}")
+        return str(nbackup_path)
+
+    def plan_level(self, chain: BackupChain, hoje: Optional[datetime] = None) -> int:
+        """
+        Escolhe o nível do próximo backup
+
+        Returns:
+            0 (completo), 1 ou 2
+        """
+        config = self.settings.backup
+        dia = DIAS_SEMANA[(hoje or datetime.now()).weekday()]
+
+        last0 = chain.last_of_level(0)
+        if dia == config.nbackup_dia_nivel0.upper() or last0 is None or not chain.is_available(last0):
+            return 0
+
+        # Sem dia de nível 1 configurado: esquema completo + diferencial
+        if not config.nbackup_dia_nivel1 or dia == config.nbackup_dia_nivel1.upper():
+            return 1
+
+        # Nível 2 precisa de um nível 1 gerado depois do último nível 0
+        last1 = chain.last_of_level(1)
+        if last1 is None or not chain.starts_after(last1, last0) or not chain.is_available(last1):
+            return 1
+        return 2
+
+    def estimate_size(self, empresa: Empresa, dest_dir: str, db_path: str, sufixo: str = "") -> int:
+        """
+        Tamanho previsto do próximo arquivo da cadeia
+
+        Nível 0 copia o banco inteiro; os demais usam o último backup do
+        mesmo nível (o banco inteiro quando não há histórico).
+        """
+        db_size = FileUtils.get_file_size(db_path)
+        chain = BackupChain.for_destination(dest_dir, empresa.cnpj, sufixo)
+        nivel = self.plan_level(chain)
+        if nivel == 0:
+            return db_size
+        last = chain.last_of_level(nivel)
+        return last.tamanho if last and last.tamanho else db_size
+
+    def _run(self, cmd: List[str]) -> subprocess.CompletedProcess:
+        """Executa o nbackup com timeout"""
+        try:
+            return subprocess.run(
+                cmd,
+                capture_output=True,
+                text=True,
+                timeout=BACKUP_TIMEOUT,
+                creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+            )
+        except subprocess.TimeoutExpired:
+            raise NBackupError(f"Timeout após {BACKUP_TIMEOUT}s")
+
+    def backup(
+        self,
+        empresa: Empresa,
+        dest_dir: str,
+        db_path: str,
+        sufixo: str = ""
+    ) -> Tuple[NBackupEntry, str]:
+        """
+        Gera o próximo backup da cadeia direto no destino
+
+        Args:
+            empresa: Dados da empresa
+            dest_dir: Destino principal
+            db_path: Banco de origem
+            sufixo: Identificação do banco nos nomes (ver FileUtils.generate_backup_filename)
+
+        Returns:
+            Tuple[NBackupEntry, str]: (entrada da cadeia, caminho do arquivo)
+        """
+        nbackup_path = self.find_nbackup()
+        if not os.path.exists(db_path):
+            raise NBackupError(f"Banco de dados não encontrado: {db_path}")
+
+        chain = BackupChain.for_destination(dest_dir, empresa.cnpj, sufixo)
+        nivel = self.plan_level(chain)
+
+        chain.directory.mkdir(parents=True, exist_ok=True)
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        filename = f"{empresa.cnpj_limpo()}{sufixo}_{timestamp}_N{nivel}{NBACKUP_EXTENSION}"
+        backup_path = chain.directory / filename
+
+        # nbackup -U user -P pass -B nivel banco arquivo
+        cmd = [
+            nbackup_path,
+            "-U", self.settings.firebird.user,
+            "-P", self.settings.firebird.password,
+            "-B", str(nivel),
+            db_path,
+            str(backup_path)
+        ]
+        self.logger.info(f"nbackup nível {nivel}: {backup_path}")
+
+        try:
+            result = self._run(cmd)
+            if result.returncode != 0:
+                error_msg = result.stderr or result.stdout or "Erro desconhecido"
+                raise NBackupError(f"nbackup falhou: {error_msg}")
+            if not backup_path.exists():
+                raise NBackupError("Arquivo de backup não foi criado")
+        except Exception:
+            FileUtils.safe_delete(str(backup_path))
+            raise
+
+        entry = NBackupEntry(
+            nivel=nivel,
+            arquivo=filename,
+            data=datetime.now().isoformat(timespec='seconds'),
+            tamanho=FileUtils.get_file_size(str(backup_path)),
+            sha256=FileUtils.calculate_sha256(str(backup_path))
+        )
+        chain.add(entry)
+        chain.save()
+
+        return entry, str(backup_path)
+
+    def replicate(
+        self,
+        empresa: Empresa,
+        entry: NBackupEntry,
+        source_dir: str,
+        dest_dir: str,
+        sufixo: str = "",
+        throttle: Optional[Callable[[int], None]] = None
+    ) -> str:
+        """
+        Copia o arquivo e a cadeia para outro destino
+
+        Args:
+            throttle: Limite de banda da cópia (destino em rede)
+
+        Returns:
+            Caminho do arquivo no destino
+        """
+        source = BackupChain.for_destination(source_dir, empresa.cnpj, sufixo)
+        target = BackupChain.for_destination(dest_dir, empresa.cnpj, sufixo)
+        target_path = target.directory / entry.arquivo
+
+        success, message = FileUtils.safe_copy(
+            str(source.directory / entry.arquivo), str(target_path), throttle=throttle
+        )
+        if not success:
+            raise NBackupError(message)
+        self.logger.debug(f"{entry.arquivo}: {message}")
+
+        success, message = FileUtils.safe_copy(str(source.path), str(target.path))
+        if not success:
+            raise NBackupError(message)
+
+        return str(target_path)
+
+    def restore(self, backup_file: str, database_path: str) -> Tuple[bool, str]:
+        """
+        Restaura um backup da cadeia em um banco novo (nbackup -R)
+
+        Returns:
+            Tuple[bool, str]: (sucesso, mensagem)
+        """
+        try:
+            nbackup_path = self.find_nbackup()
+            backup_file = os.path.abspath(backup_file)
+            chain = BackupChain(os.path.dirname(backup_file))
+            sequence = chain.restore_sequence(os.path.basename(backup_file))
+        except NBackupError as e:
+            return False, str(e)
+
+        if os.path.exists(database_path):
+            return False, f"Banco de destino já existe: {database_path}"
+
+        for entry in sequence:
+            if entry.sha256 and FileUtils.calculate_sha256(str(chain.directory / entry.arquivo)) != entry.sha256:
+                return False, f"Arquivo corrompido: {entry.arquivo}"
+
+        cmd = [
+            nbackup_path,
+            "-U", self.settings.firebird.user,
+            "-P", self.settings.firebird.password,
+            "-R", database_path
+        ] + [str(chain.directory / entry.arquivo) for entry in sequence]
+
+        self.logger.info(f"Restaurando cadeia: {', '.join(e.arquivo for e in sequence)}")
+
+        try:
+            result = self._run(cmd)
+        except NBackupError as e:
+            return False, str(e)
+
+        if result.returncode != 0:
+            return False, f"nbackup falhou: {result.stderr or result.stdout or 'Erro desconhecido'}"
+
+        return True, f"Restauração concluída ({len(sequence)} arquivos)"
+
+
+class NBackupError(Exception):
+    """Exceção para erros do backup incremental"""
+    pass
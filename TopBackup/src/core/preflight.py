@@ -0,0 +1,252 @@
+"""
+TopBackup - Verificação Prévia de Espaço
+Previsão do tamanho do backup e checagem de espaço livre antes do gbak
+"""
+
+import os
+import shutil
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .backup_pool import volume_key
+from ..utils.logger import get_logger
+from ..utils.file_utils import FileUtils
+from ..utils.compression_codecs import CompressionStats
+
+# Taxa de compressão assumida sem histórico (.fbk costuma comprimir bem)
+DEFAULT_COMPRESSION_RATIO = 0.35
+# Folga sobre a previsão (bancos crescem entre um backup e outro)
+SPACE_MARGIN = 1.15
+# Espaço que sempre fica livre no volume
+MIN_FREE_BYTES = 256 * 1024 * 1024
+
+# Diretório de trabalho usado dentro do destino quando o temporário não tem espaço
+WORK_DIR_NAME = ".topbackup_tmp"
+
+# Modos de execução avaliados
+MODO_ARQUIVO = "arquivo"        # gbak → .fbk temporário → ZIP
+MODO_STREAMING = "streaming"    # gbak → stdout → ZIP
+MODO_DEDUP = "dedup"            # gbak → stdout → repositório no destino
+MODO_NBACKUP = "nbackup"        # nbackup direto no destino
+
+
+@dataclass
+class SizeForecast:
+    """Tamanhos previstos do backup"""
+    fbk_bytes: int          # .fbk (sem compressão)
+    comprimido_bytes: int   # Artefato final comprimido
+    fonte: str              # Origem da previsão (histórico ou tamanho do banco)
+    compactado: bool = True  # Gera ZIP (senão o .fbk é o artefato final)
+
+
+@dataclass
+class PreflightResult:
+    """Decisão da verificação prévia"""
+    ok: bool
+    message: str = ""
+    modo: str = MODO_ARQUIVO
+    work_dir: Optional[str] = None      # Diretório de trabalho (None = temporário padrão)
+    pular_destino2: bool = False
+    forecast: Optional[SizeForecast] = None
+    avisos: List[str] = field(default_factory=list)
+
+
+def forecast_sizes(
+    database_path: str,
+    stats: Optional[CompressionStats],
+    codec_name: Optional[str]
+) -> SizeForecast:
+    """
+    Prevê os tamanhos do backup
+
+    O .fbk vem do último backup do banco (histórico de compressão) ou,
+    sem histórico, do tamanho do arquivo do banco (o .fbk não leva
+    índices nem páginas livres, então é um teto). A taxa de compressão é
+    a mediana do codec para esse banco.
+    """
+    raw = stats.last_raw_size(database_path) if stats else 0
+    fonte = "histórico"
+    if not raw:
+        raw = FileUtils.get_file_size(database_path)
+        fonte = "tamanho do banco"
+
+    ratio = DEFAULT_COMPRESSION_RATIO
+    if stats and codec_name:
+        summary = stats.summary(database_path).get(codec_name)
+        if summary:
+            ratio = summary['ratio']
+
+    fbk = int(raw * SPACE_MARGIN)
+    comprimido = int(raw * ratio * SPACE_MARGIN) if codec_name else fbk
+    return SizeForecast(
+        fbk_bytes=fbk, comprimido_bytes=comprimido, fonte=fonte, compactado=bool(codec_name)
+    )
+
+
+def _existing_dir(path: str) -> str:
+    """Diretório existente mais próximo (destino ainda não criado)"""
+    current = Path(path).resolve()
+    while not current.exists() and current != current.parent:
+        current = current.parent
+    return str(current)
+
+
+def free_space(path: str) -> Optional[int]:
+    """Bytes livres no volume do caminho (None se não acessível)"""
+    try:
+        return shutil.disk_usage(_existing_dir(path)).free
+    except OSError:
+        return None
+
+
+class PreflightCheck:
+    """
+    Verificação de espaço antes de iniciar o gbak
+
+    Soma o que cada volume vai receber (temporário, destino 1 e
+    destino 2 podem ser o mesmo volume) e compara com o espaço livre.
+    Se o temporário não comporta o modo com .fbk, tenta o streaming;
+    se nem o ZIP cabe no temporário, o ZIP é gerado direto no volume do
+    destino 1. Destino 2 sem espaço é pulado (é opcional); temporário e
+    destino 1 sem espaço falham em segundos, antes do gbak.
+    """
+
+    def __init__(self):
+        self.logger = get_logger()
+
+    def check(
+        self,
+        modo: str,
+        forecast: SizeForecast,
+        temp_dir: str,
+        destino1: str,
+        destino2: Optional[str] = None,
+        nbackup_bytes: Optional[int] = None
+    ) -> PreflightResult:
+        """
+        Avalia o espaço para o modo desejado
+
+        Args:
+            modo: MODO_ARQUIVO, MODO_STREAMING, MODO_DEDUP ou MODO_NBACKUP
+            forecast: Tamanhos previstos
+            temp_dir: Diretório temporário
+            destino1/destino2: Diretórios de destino
+            nbackup_bytes: Tamanho previsto do arquivo do nbackup
+        """
+        result = PreflightResult(ok=True, modo=modo, forecast=forecast)
+
+        # Tudo no temporário primeiro (streaming antes de levar o .fbk pro
+        # destino 1); só depois o diretório de trabalho no destino 1
+        modos = [modo]
+        if modo == MODO_ARQUIVO and forecast.compactado:
+            modos.append(MODO_STREAMING)
+        candidates = [(candidate, None) for candidate in modos]
+        if modo in (MODO_ARQUIVO, MODO_STREAMING):
+            work_dir = os.path.join(destino1, WORK_DIR_NAME)
+            candidates += [(candidate, work_dir) for candidate in modos]
+
+        for candidate, work_dir in candidates:
+            needs = self._needs(
+                candidate, forecast, work_dir or temp_dir, destino1, nbackup_bytes
+            )
+            shortage = self._shortage(needs)
+            if shortage:
+                continue
+
+            result.modo = candidate
+            result.work_dir = work_dir
+            if candidate != modo:
+                result.avisos.append("Pouco espaço no temporário: usando streaming (sem .fbk)")
+            if work_dir:
+                result.avisos.append(f"Pouco espaço no temporário: ZIP gerado em {destino1}")
+            self._check_destino2(result, forecast, destino2, destino1, needs)
+            return result
+
+        # Nenhuma alternativa cabe: mensagem com o modo pedido
+        needs = self._needs(modo, forecast, temp_dir, destino1, nbackup_bytes)
+        result.ok = False
+        result.message = self._shortage(needs)
+        return result
+
+    def _needs(
+        self,
+        modo: str,
+        forecast: SizeForecast,
+        work_dir: str,
+        destino1: str,
+        nbackup_bytes: Optional[int]
+    ) -> Dict[str, Dict]:
+        """Bytes necessários por volume ({volume: {'bytes', 'nomes'}})"""
+        needs: Dict[str, Dict] = {}
+
+        def add(path: str, nome: str, size: int):
+            key = self._volume(path)
+            entry = needs.setdefault(key, {'bytes': 0, 'nomes': [], 'path': path})
+            entry['bytes'] += size
+            if nome not in entry['nomes']:
+                entry['nomes'].append(nome)
+
+        same_volume = self._volume(work_dir) == self._volume(destino1)
+
+        if modo == MODO_ARQUIVO:
+            # .fbk e ZIP coexistem até o .fbk ser apagado
+            temp_bytes = forecast.fbk_bytes
+            if forecast.compactado:
+                temp_bytes += forecast.comprimido_bytes
+            add(work_dir, "temporário", temp_bytes)
+            if not same_volume:
+                add(destino1, "destino 1", forecast.comprimido_bytes)
+        elif modo == MODO_STREAMING:
+            add(work_dir, "temporário", forecast.comprimido_bytes)
+            if not same_volume:
+                add(destino1, "destino 1", forecast.comprimido_bytes)
+        elif modo == MODO_DEDUP:
+            # Pior caso: nenhum chunk repetido
+            add(destino1, "destino 1", forecast.comprimido_bytes)
+        elif modo == MODO_NBACKUP:
+            add(destino1, "destino 1", int((nbackup_bytes or forecast.fbk_bytes) * SPACE_MARGIN))
+
+        return needs
+
+    def _shortage(self, needs: Dict[str, Dict]) -> str:
+        """Mensagem do primeiro volume sem espaço ("" se todos cabem)"""
+        for entry in needs.values():
+            free = free_space(entry['path'])
+            if free is None:
+                continue
+            if entry['bytes'] + MIN_FREE_BYTES > free:
+                return (
+                    f"Espaço insuficiente ({', '.join(entry['nomes'])}: {entry['path']}): "
+                    f"necessário ~{FileUtils.format_size(entry['bytes'])}, "
+                    f"livre {FileUtils.format_size(free)}"
+                )
+        return ""
+
+    def _check_destino2(
+        self,
+        result: PreflightResult,
+        forecast: SizeForecast,
+        destino2: Optional[str],
+        destino1: str,
+        needs: Dict[str, Dict]
+    ):
+        """Destino 2 sem espaço é pulado (backup continua no destino 1)"""
+        if not destino2:
+            return
+        if result.modo == MODO_NBACKUP:
+            size = needs.get(self._volume(destino1), {}).get('bytes', 0)
+        else:
+            size = forecast.comprimido_bytes
+        required = size + needs.get(self._volume(destino2), {}).get('bytes', 0)
+        free = free_space(destino2)
+        if free is not None and required + MIN_FREE_BYTES > free:
+            result.pular_destino2 = True
+            result.avisos.append(
+                f"Destino 2 sem espaço ({destino2}): necessário ~{FileUtils.format_size(required)}, "
+                f"livre {FileUtils.format_size(free)}; backup só no destino 1"
+            )
+
+    @staticmethod
+    def _volume(path: str) -> str:
+        return volume_key(path)
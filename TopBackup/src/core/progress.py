@@ -0,0 +1,280 @@
+"""
+TopBackup - Progresso do Backup
+Eventos de progresso com bytes, throughput e ETA, com limite de frequência
+"""
+
+import re
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, asdict
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from ..utils.file_utils import FileUtils
+
+# Etapas do backup
+ETAPA_GBAK = "gbak"
+ETAPA_NBACKUP = "nbackup"
+ETAPA_VALIDACAO = "validacao"
+ETAPA_COMPACTACAO = "compactacao"
+ETAPA_COPIA = "copia"
+ETAPA_REPLICACAO = "replicacao"
+
+# Intervalo mínimo entre eventos de bytes (início de etapa sempre é enviado)
+PROGRESS_MIN_INTERVAL = 0.5
+# Peso da amostra mais recente na média do throughput
+THROUGHPUT_SMOOTHING = 0.3
+
+
+@dataclass
+class ProgressEvent:
+    """Progresso de uma etapa do backup"""
+    etapa: str
+    mensagem: str
+    bytes_processados: int = 0
+    bytes_total: Optional[int] = None  # Estimativa (None = desconhecido)
+    bytes_por_segundo: float = 0
+    eta_segundos: Optional[float] = None
+    detalhe: str = ""
+    timestamp: float = 0
+
+    @property
+    def percentual(self) -> Optional[float]:
+        """Percentual concluído (0-100), se há estimativa do total"""
+        if not self.bytes_total:
+            return None
+        return min(self.bytes_processados / self.bytes_total * 100, 100.0)
+
+    def descricao(self) -> str:
+        """Texto curto para a interface"""
+        partes = [self.mensagem]
+        if self.bytes_processados:
+            partes.append(FileUtils.format_size(self.bytes_processados))
+        if self.percentual is not None:
+            partes.append(f"{self.percentual:.0f}%")
+        if self.bytes_por_segundo:
+            partes.append(f"{FileUtils.format_size(int(self.bytes_por_segundo))}/s")
+        if self.eta_segundos is not None:
+            minutos, segundos = divmod(int(self.eta_segundos), 60)
+            partes.append(f"faltam {minutos}min{segundos:02d}s")
+        return " - ".join(partes)
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        data['percentual'] = self.percentual
+        return data
+
+
+class ProgressReporter:
+    """
+    Gera ProgressEvent a partir de contadores de bytes
+
+    add()/update() são chamados a cada bloco, mas só emitem evento se
+    passou PROGRESS_MIN_INTERVAL desde o último: o custo por bloco é uma
+    soma e uma leitura de relógio. O throughput é uma média móvel, e o
+    ETA usa a estimativa do total informada em stage().
+
+    Usage:
+        reporter = ProgressReporter(callback)
+        reporter.stage(ETAPA_COMPACTACAO, "Compactando...", total=tamanho)
+        for chunk in reporter.count(chunks):
+            writer.write(chunk)
+    """
+
+    def __init__(
+        self,
+        callback: Optional[Callable[[ProgressEvent], None]] = None,
+        min_interval: float = PROGRESS_MIN_INTERVAL
+    ):
+        self.callback = callback
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._event: Optional[ProgressEvent] = None
+        self._processed = 0
+        self._detail = ""
+        self._last_emit = 0.0
+        self._last_bytes = 0
+        self._rate = 0.0
+        self._stage_started = 0.0
+        self.durations: Dict[str, float] = {}  # Segundos gastos por etapa
+
+    @property
+    def last_event(self) -> Optional[ProgressEvent]:
+        """Último evento emitido"""
+        return self._event
+
+    def reset(self):
+        """Limpa as durações (início de um novo backup)"""
+        with self._lock:
+            self._event = None
+            self._stage_started = 0.0
+            self.durations = {}
+
+    def close_stage(self):
+        """Encerra a etapa atual, somando sua duração em durations"""
+        with self._lock:
+            self._close_stage(time.monotonic())
+
+    def _close_stage(self, now: float):
+        if self._event is not None and self._stage_started:
+            etapa = self._event.etapa
+            self.durations[etapa] = self.durations.get(etapa, 0.0) + now - self._stage_started
+            self._stage_started = 0.0
+
+    def stage(self, etapa: str, mensagem: str, total: Optional[int] = None):
+        """Inicia uma etapa e emite o evento imediatamente"""
+        now = time.monotonic()
+        with self._lock:
+            self._close_stage(now)
+            self._stage_started = now
+            self._processed = 0
+            self._detail = ""
+            self._last_bytes = 0
+            self._last_emit = now
+            self._rate = 0.0
+            self._event = ProgressEvent(
+                etapa=etapa,
+                mensagem=mensagem,
+                bytes_total=total or None,
+                timestamp=time.time()
+            )
+        self._emit(self._event)
+
+    def add(self, count: int):
+        """Soma bytes processados na etapa"""
+        self._processed += count
+        if time.monotonic() - self._last_emit >= self.min_interval:
+            self._publish()
+
+    def update(self, processed: int, detalhe: Optional[str] = None):
+        """Define o total processado (ex: tamanho do arquivo em escrita)"""
+        self._processed = processed
+        if detalhe is not None:
+            self._detail = detalhe
+        if time.monotonic() - self._last_emit >= self.min_interval:
+            self._publish()
+
+    def due(self) -> bool:
+        """Indica se o próximo update() vai emitir (evita medir à toa)"""
+        return time.monotonic() - self._last_emit >= self.min_interval
+
+    def count(self, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """Repassa os blocos contando os bytes"""
+        for chunk in chunks:
+            self.add(len(chunk))
+            yield chunk
+
+    def _publish(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._event is None:
+                return
+            elapsed = now - self._last_emit
+            if elapsed <= 0:
+                return
+
+            sample = (self._processed - self._last_bytes) / elapsed
+            self._rate = sample if not self._rate else (
+                THROUGHPUT_SMOOTHING * sample + (1 - THROUGHPUT_SMOOTHING) * self._rate
+            )
+            self._last_bytes = self._processed
+            self._last_emit = now
+
+            total = self._event.bytes_total
+            eta = None
+            if total and self._rate > 0:
+                eta = max(total - self._processed, 0) / self._rate
+
+            self._event = ProgressEvent(
+                etapa=self._event.etapa,
+                mensagem=self._event.mensagem,
+                bytes_processados=self._processed,
+                bytes_total=total,
+                bytes_por_segundo=self._rate,
+                eta_segundos=eta,
+                detalhe=self._detail,
+                timestamp=time.time()
+            )
+            event = self._event
+        self._emit(event)
+
+    def _emit(self, event: ProgressEvent):
+        if self.callback:
+            try:
+                self.callback(event)
+            except Exception:
+                # Progresso nunca derruba o backup
+                pass
+
+
+class GbakVerboseParser:
+    """
+    Interpreta a saída de gbak -v linha a linha
+
+    Reconhece as linhas "writing data for table X", "N records written"
+    e o total de bytes no fechamento do arquivo, e guarda as últimas
+    linhas para a mensagem de erro.
+
+    O "N records written" é cumulativo dentro da tabela (o gbak repete a
+    linha a cada lote), então vale só o último número de cada tabela.
+    """
+
+    _TABLE = re.compile(r'writing data for table\s+"?([^"\s]+)', re.IGNORECASE)
+    _RECORDS = re.compile(r'(\d+)\s+records?\s+written', re.IGNORECASE)
+    _BYTES = re.compile(r'(\d+)\s+bytes\s+written', re.IGNORECASE)
+    # Só os prefixos de erro do próprio gbak ("gbak: ERROR:...", "gbak:Exiting
+    # before completion..."); nome de tabela com ERROR não conta
+    _ERROR = re.compile(r'^(gbak:\s*)?(ERROR\b|Exiting before completion)', re.IGNORECASE)
+
+    def __init__(self, tail_size: int = 20):
+        self.tabela: Optional[str] = None
+        self.tabelas = 0
+        self.bytes_escritos: Optional[int] = None
+        self._registros_anteriores = 0
+        self._registros_tabela = 0
+        self.errors: List[str] = []
+        self._tail: "deque[str]" = deque(maxlen=tail_size)
+
+    def feed(self, line: str):
+        """Processa uma linha da saída"""
+        line = line.strip()
+        if not line:
+            return
+        self._tail.append(line)
+
+        if self._ERROR.match(line):
+            self.errors.append(line)
+            return
+
+        match = self._TABLE.search(line)
+        if match:
+            self.tabela = match.group(1)
+            self.tabelas += 1
+            self._registros_anteriores += self._registros_tabela
+            self._registros_tabela = 0
+            return
+
+        match = self._RECORDS.search(line)
+        if match:
+            self._registros_tabela = int(match.group(1))
+            return
+
+        match = self._BYTES.search(line)
+        if match:
+            self.bytes_escritos = int(match.group(1))
+
+    @property
+    def registros(self) -> int:
+        """Registros gravados (tabelas anteriores + tabela atual)"""
+        return self._registros_anteriores + self._registros_tabela
+
+    def describe(self) -> str:
+        """Resumo do andamento (tabela atual e contadores)"""
+        if not self.tabela:
+            return ""
+        return f"tabela {self.tabela} ({self.tabelas} tabelas, {self.registros} registros)"
+
+    def error_message(self) -> str:
+        """Mensagem de erro do gbak (linhas de erro ou final da saída)"""
+        lines = self.errors or list(self._tail)
+        return "\n".join(lines)
@@ -0,0 +1,360 @@
+"""
+TopBackup - Retenção de Backups
+Política GFS (diários/semanais/mensais) e limite de espaço, a partir do catálogo
+"""
+
+import os
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+from ..config.settings import Settings
+from ..database.catalog import BackupCatalog, CatalogEntry, ARTEFATO_REMOVIDO
+from ..network.ftp_client import FTPClient
+from ..utils.logger import get_logger
+from ..utils.file_utils import FileUtils
+from .dedup_store import DedupRepository
+from .nbackup_engine import BackupChain
+
+GB = 1024 * 1024 * 1024
+
+# Só o versionado acumula arquivos ('S' e 'U' se sobrescrevem)
+TIPOS_COM_RETENCAO = ('V',)
+# Codec dos arquivos do nbackup no catálogo: nbackup-0, nbackup-1, nbackup-2
+NBACKUP_CODEC_PREFIX = "nbackup-"
+
+
+@dataclass
+class RetentionPolicy:
+    """
+    Quantos backups manter
+
+    diarios/semanais/mensais seguem o esquema GFS: o backup mais recente
+    de cada um dos últimos N dias, semanas (ISO) e meses. Zero em todos
+    desativa o GFS (mantém tudo). max_bytes limita o espaço por destino,
+    removendo os mais antigos.
+    """
+    diarios: int = 0
+    semanais: int = 0
+    mensais: int = 0
+    max_bytes: int = 0
+
+    @property
+    def gfs_enabled(self) -> bool:
+        return bool(self.diarios or self.semanais or self.mensais)
+
+    @property
+    def enabled(self) -> bool:
+        return self.gfs_enabled or self.max_bytes > 0
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "RetentionPolicy":
+        config = settings.backup
+        return cls(
+            diarios=max(config.retencao_diarios, 0),
+            semanais=max(config.retencao_semanais, 0),
+            mensais=max(config.retencao_mensais, 0),
+            max_bytes=int(max(config.retencao_max_gb, 0) * GB)
+        )
+
+
+@dataclass
+class RetentionResult:
+    """Resultado de uma execução da retenção"""
+    removidos: int = 0
+    bytes_liberados: int = 0
+    removidos_ftp: int = 0
+    erros: List[str] = field(default_factory=list)
+
+
+def select_gfs_keep(entries: List[CatalogEntry], policy: RetentionPolicy) -> Set[int]:
+    """
+    IDs mantidos pelo GFS
+
+    Args:
+        entries: Artefatos de um banco, mais recentes primeiro
+
+    Returns:
+        IDs a manter (o mais recente sempre fica)
+    """
+    if not entries:
+        return set()
+    if not policy.gfs_enabled:
+        return {entry.id for entry in entries}
+
+    keep = {entries[0].id}
+    buckets: List[tuple] = [
+        (policy.diarios, lambda e: e.data.date()),
+        (policy.semanais, lambda e: tuple(e.data.isocalendar())[:2]),
+        (policy.mensais, lambda e: (e.data.year, e.data.month)),
+    ]
+    for limit, period_of in buckets:
+        seen = set()
+        for entry in entries:
+            if len(seen) >= limit:
+                break
+            period = period_of(entry)
+            if period not in seen:
+                # Primeiro visto = mais recente do período
+                seen.add(period)
+                keep.add(entry.id)
+    return keep
+
+
+def select_over_limit(
+    entries: List[CatalogEntry],
+    max_bytes: int,
+    protected: Set[int],
+    size_of: Optional[Callable[[CatalogEntry], int]] = None
+) -> Set[int]:
+    """
+    IDs que passam do limite de espaço de um destino
+
+    Args:
+        entries: Artefatos do destino, mais recentes primeiro
+        protected: IDs que nunca são removidos (último backup de cada banco)
+        size_of: Bytes em disco do artefato (padrão: tamanho_bytes)
+    """
+    if max_bytes <= 0:
+        return set()
+
+    size_of = size_of or (lambda entry: entry.tamanho_bytes)
+    total = 0
+    over = set()
+    for entry in entries:
+        size = size_of(entry)
+        total += size
+        if total > max_bytes and entry.id not in protected:
+            over.add(entry.id)
+            total -= size
+    return over
+
+
+def is_nbackup(entry: CatalogEntry) -> bool:
+    return (entry.codec or "").startswith(NBACKUP_CODEC_PREFIX)
+
+
+def group_chains(entries: Iterable[CatalogEntry]) -> List[List[CatalogEntry]]:
+    """
+    Cadeias do nbackup: cada nível 0 com os incrementais seguintes do mesmo diretório
+
+    Returns:
+        Cadeias com os arquivos em ordem de criação
+    """
+    chains: List[List[CatalogEntry]] = []
+    current: Dict[str, List[CatalogEntry]] = {}
+    for entry in sorted((e for e in entries if is_nbackup(e)), key=lambda e: e.data):
+        chain = current.get(entry.destino)
+        if chain is None or entry.codec == f"{NBACKUP_CODEC_PREFIX}0":
+            chain = []
+            chains.append(chain)
+            current[entry.destino] = chain
+        chain.append(entry)
+    return chains
+
+
+def whole_chains(entries: List[CatalogEntry], expired: Set[int]) -> Set[int]:
+    """
+    Restringe os expirados do nbackup a cadeias inteiras
+
+    Um arquivo da cadeia só sai junto com todos os outros (nível 0 e
+    incrementais): apagar parte dela quebraria a restauração do resto.
+    """
+    result = {entry.id for entry in entries if entry.id in expired and not is_nbackup(entry)}
+    for chain in group_chains(entries):
+        ids = {entry.id for entry in chain}
+        if ids <= expired:
+            result |= ids
+    return result
+
+
+class RetentionEngine:
+    """
+    Aplica a política de retenção depois de cada backup
+
+    As decisões vêm do catálogo (sem listar diretórios): GFS por banco e
+    limite de espaço por destino. Arquivos locais são removidos em lote
+    e o catálogo é atualizado numa única transação; no FTP as remoções
+    usam uma única sessão. Cadeias do nbackup saem inteiras, só quando
+    nenhum arquivo delas é mantido pelo GFS ou pelo limite de espaço.
+
+    Usage:
+        RetentionEngine(settings, catalog, ftp_client).apply(banco)
+    """
+
+    def __init__(
+        self,
+        settings: Settings,
+        catalog: BackupCatalog,
+        ftp_client: Optional[FTPClient] = None
+    ):
+        self.settings = settings
+        self.catalog = catalog
+        self.ftp_client = ftp_client
+        self.logger = get_logger()
+
+    @staticmethod
+    def _eligible(entries: Iterable[CatalogEntry]) -> List[CatalogEntry]:
+        # nbackup gera um arquivo por execução em qualquer tipo de agenda
+        return [
+            entry for entry in entries
+            if entry.tipo_backup in TIPOS_COM_RETENCAO or is_nbackup(entry)
+        ]
+
+    @property
+    def remote_enabled(self) -> bool:
+        return bool(self.ftp_client) and self.settings.ftp.retencao_remota
+
+    def apply(self, banco: str) -> RetentionResult:
+        """Aplica a retenção aos backups locais (e remotos, com ftp_client) de um banco"""
+        result = RetentionResult()
+        policy = RetentionPolicy.from_settings(self.settings)
+        if not policy.enabled:
+            return result
+
+        self._apply_local(banco, policy, result)
+        if self.remote_enabled:
+            self._apply_remote(banco, policy, result)
+
+        self._log_result(result)
+        return result
+
+    def apply_remote(self, banco: str) -> RetentionResult:
+        """Aplica só a retenção do FTP (separada para não segurar o backup local)"""
+        result = RetentionResult()
+        policy = RetentionPolicy.from_settings(self.settings)
+        if policy.enabled and self.remote_enabled:
+            self._apply_remote(banco, policy, result)
+            self._log_result(result)
+        return result
+
+    def _log_result(self, result: RetentionResult):
+        if result.removidos or result.removidos_ftp:
+            self.logger.info(
+                f"Retenção: {result.removidos} backups removidos "
+                f"({FileUtils.format_size(result.bytes_liberados)}), "
+                f"{result.removidos_ftp} no FTP"
+            )
+
+    def _expired(
+        self,
+        entries: List[CatalogEntry],
+        policy: RetentionPolicy,
+        destinations: Dict[str, Callable[[], List[CatalogEntry]]],
+        size_of: Optional[Callable[[str], Callable[[CatalogEntry], int]]] = None
+    ) -> List[CatalogEntry]:
+        """
+        Artefatos do banco fora do GFS ou acima do limite de algum destino
+
+        Args:
+            size_of: Fábrica (por destino) do tamanho em disco de cada artefato
+        """
+        keep = select_gfs_keep(entries, policy)
+        expired = {entry.id for entry in entries if entry.id not in keep}
+
+        if policy.max_bytes and destinations:
+            for destino, load in destinations.items():
+                # Todos os bancos do destino; o último de cada banco é protegido
+                in_destination = [e for e in self._eligible(load()) if e.id not in expired]
+                latest_per_db: Dict[str, int] = {}
+                for entry in in_destination:
+                    latest_per_db.setdefault(entry.banco, entry.id)
+                over = select_over_limit(
+                    in_destination, policy.max_bytes, set(latest_per_db.values()),
+                    size_of(destino) if size_of else None
+                )
+                own_ids = {entry.id for entry in entries}
+                expired |= over & own_ids
+
+        expired = whole_chains(entries, expired)
+        return [entry for entry in entries if entry.id in expired]
+
+    @staticmethod
+    def _disk_size(destino: str) -> Callable[[CatalogEntry], int]:
+        """
+        Tamanho em disco dos artefatos de um destino
+
+        Dedup: chunks do repositório atribuídos a cada manifesto (ver
+        DedupRepository.usage_by_manifest), não o tamanho do .fbk.
+        """
+        usage: Dict[str, Dict[str, int]] = {}
+
+        def size_of(entry: CatalogEntry) -> int:
+            if entry.codec != "dedup":
+                return entry.tamanho_bytes
+            path = entry.caminho if entry.destino == destino else entry.caminho2
+            if not path:
+                return entry.tamanho_bytes
+            repo = DedupRepository.from_manifest(path)
+            key = str(repo.root)
+            if key not in usage:
+                usage[key] = repo.usage_by_manifest()
+            return usage[key].get(os.path.basename(path), 0)
+
+        return size_of
+
+    def _apply_local(self, banco: str, policy: RetentionPolicy, result: RetentionResult):
+        entries = self._eligible(self.catalog.list_entries(banco=banco))
+        destinos = {d for e in entries for d in (e.destino, e.destino2) if d}
+        expired = self._expired(
+            entries, policy,
+            {d: (lambda d=d: self.catalog.list_entries(destino=d)) for d in destinos},
+            self._disk_size
+        )
+        if not expired:
+            return
+
+        removed_ids = []
+        repositories: Dict[str, DedupRepository] = {}
+        chain_files: Dict[str, Set[str]] = {}
+        for entry in expired:
+            ok = True
+            for path in (entry.caminho, entry.caminho2):
+                if not path:
+                    continue
+                if entry.codec == "dedup":
+                    repo = DedupRepository.from_manifest(path)
+                    repositories.setdefault(str(repo.root), repo)
+                    repo.delete_manifest(entry.arquivo)
+                    continue
+                success, message = FileUtils.safe_delete(path)
+                if not success:
+                    ok = False
+                    result.erros.append(f"{path}: {message}")
+                elif is_nbackup(entry):
+                    chain_files.setdefault(os.path.dirname(path), set()).add(os.path.basename(path))
+            if ok:
+                removed_ids.append(entry.id)
+                if entry.codec != "dedup":
+                    result.bytes_liberados += entry.tamanho_bytes * (2 if entry.caminho2 else 1)
+
+        # Chunks sem manifesto só saem no gc (um por repositório, não por backup)
+        for repo in repositories.values():
+            result.bytes_liberados += repo.gc()
+
+        # cadeia.json deixa de listar as cadeias removidas
+        for directory, arquivos in chain_files.items():
+            chain = BackupChain(directory)
+            chain.entries = [e for e in chain.entries if e.arquivo not in arquivos]
+            try:
+                chain.save()
+            except OSError as e:
+                result.erros.append(f"{chain.path}: {e}")
+
+        self.catalog.set_status(removed_ids, ARTEFATO_REMOVIDO)
+        result.removidos += len(removed_ids)
+
+    def _apply_remote(self, banco: str, policy: RetentionPolicy, result: RetentionResult):
+        entries = self._eligible(self.catalog.list_remote(banco=banco))
+        # Limite de espaço vale para o FTP inteiro (todos os bancos enviados)
+        expired = self._expired(
+            entries, policy, {"ftp": lambda: self.catalog.list_remote()}
+        )
+        if not expired:
+            return
+
+        by_name = {entry.remoto: entry for entry in expired}
+        deleted, errors = self.ftp_client.delete_files(list(by_name))
+        result.erros.extend(errors)
+
+        self.catalog.set_remote_removed(by_name[name].id for name in deleted)
+        result.removidos_ftp += len(deleted)
@@ -68,9 +68,9 @@ class BackupScheduler:
             agendas: Lista de configurações de agendamento
         """
         # Remove jobs anteriores
-        for i in range(10):  # Remove até 10 jobs de backup
-            self._remove_job(f'backup_job_{i}')
-        self._remove_job('backup_job')
+        for job in self.scheduler.get_jobs():
+            if job.id.startswith('backup_job'):
+                self._remove_job(job.id)
 
         if not agendas:
             self.logger.warning("Nenhuma agenda de backup configurada")
@@ -94,16 +94,18 @@ class BackupScheduler:
 
             job_id = f'backup_job_{i}'
 
-            # Adiciona job
+            # Adiciona job (cada agenda faz backup do seu próprio banco)
             self.scheduler.add_job(
                 func=self._execute_backup_job,
                 trigger=trigger,
+                args=[agenda],
                 id=job_id,
                 name=f'Backup {hora:02d}:{minuto:02d}',
                 replace_existing=True
             )
 
-            self.logger.info(f"Backup agendado: {hora:02d}:{minuto:02d} ({dias_cron})")
+            banco = agenda.banco_origem or "banco principal"
+            self.logger.info(f"Backup agendado: {hora:02d}:{minuto:02d} ({dias_cron}) - {banco}")
 
         # Atualiza próximo backup
         self._update_next_backup()
@@ -193,11 +195,11 @@ class BackupScheduler:
             )
             self.logger.info("Backup manual agendado")
 
-    def _execute_backup_job(self):
-        """Executa job de backup"""
+    def _execute_backup_job(self, agenda: Optional[AgendaBackup] = None):
+        """Executa job de backup (agenda None = agenda principal)"""
         if self._backup_callback:
             try:
-                self._backup_callback()
+                self._backup_callback(agenda)
             except Exception as e:
                 self.logger.error(f"Erro no backup: {e}")
         self._update_next_backup()
@@ -0,0 +1,363 @@
+"""
+TopBackup - Fila de Envio FTP
+Uploads persistentes (SQLite) em segundo plano, com novas tentativas e backoff
+"""
+
+import os
+import sqlite3
+import threading
+import uuid
+from contextlib import closing
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Optional, Tuple
+
+from ..utils.fast_copy import fast_copy
+from ..utils.logger import get_logger
+
+# Status dos envios
+UPLOAD_PENDENTE = "pendente"      # Aguardando envio
+UPLOAD_ENVIADO = "enviado"        # No servidor, falta registrar (catálogo/MySQL)
+UPLOAD_CONCLUIDO = "concluido"
+UPLOAD_DESCARTADO = "descartado"  # Arquivo local não existe mais ou expirou
+
+# Backoff entre tentativas: 1 min, 2, 4... até 1 hora
+OUTBOX_BACKOFF_BASE = 60
+OUTBOX_BACKOFF_MAX = 3600
+# Envio que não sai em tantos dias é descartado
+OUTBOX_MAX_AGE_DAYS = 7
+# Histórico de envios finalizados mantido no arquivo
+OUTBOX_HISTORY_DAYS = 30
+# Cópia de envio de backups com nome fixo ("U"/"S"), ao lado do original
+UPLOAD_COPY_SUFFIX = ".envio"
+
+
+@dataclass
+class UploadItem:
+    """Arquivo na fila de envio"""
+    id: int
+    caminho: str
+    remoto: str
+    sha256: Optional[str] = None
+    log_id: Optional[int] = None
+    tentativas: int = 0
+    status: str = UPLOAD_PENDENTE
+    chave_log: Optional[str] = None  # CHAVE_LOCAL do log (registro do envio pelo diário MySQL)
+    copia: Optional[str] = None  # Cópia enviada no lugar de caminho (ver enqueue)
+
+    @property
+    def origem(self) -> str:
+        """Arquivo lido no envio"""
+        return self.copia or self.caminho
+
+
+def backoff_seconds(tentativas: int) -> int:
+    """Espera antes da próxima tentativa"""
+    return min(OUTBOX_BACKOFF_BASE * 2 ** max(tentativas - 1, 0), OUTBOX_BACKOFF_MAX)
+
+
+class UploadOutbox:
+    """
+    Fila de uploads FTP desacoplada do backup
+
+    O backup só grava o arquivo na fila e termina; uma thread envia em
+    ordem de chegada. Falha de envio agenda nova tentativa com backoff
+    exponencial, e a fila é gravada em SQLite no diretório de dados,
+    então envios pendentes continuam depois de um reinício (o upload em
+    si retoma do checkpoint do FTPClient).
+
+    Depois do envio o item passa a "enviado" até on_done confirmar o
+    registro (catálogo e LOG_BACKUPS.ENVIADO_FTP); se o MySQL estiver
+    fora, o registro é tentado de novo sem reenviar o arquivo.
+
+    Backups com nome fixo ("U"/"S") são enviados de uma cópia: o próximo
+    backup do mesmo nome substitui o arquivo enquanto o envio anterior
+    ainda lê, e no Windows o os.replace falha sobre arquivo aberto.
+
+    Usage:
+        outbox = UploadOutbox(path, uploader, on_done)
+        outbox.start()
+        outbox.enqueue(caminho, remoto, sha256, log_id, chave_log)
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        uploader: Callable[[UploadItem], Tuple[bool, str]],
+        on_done: Callable[[UploadItem, datetime], bool]
+    ):
+        """
+        Args:
+            path: Arquivo SQLite da fila
+            uploader: Envia um item, retorna (sucesso, mensagem)
+            on_done: Registra o envio (data do envio), retorna sucesso
+        """
+        self.path = path
+        self.uploader = uploader
+        self.on_done = on_done
+        self.logger = get_logger()
+
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+        self._current: Optional[int] = None  # Item em envio
+
+        self._init_db()
+
+    # ============ PERSISTÊNCIA ============
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(str(self.path), timeout=30)
+
+    def _init_db(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        agora = datetime.now()
+        with closing(self._connect()) as conn, conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS UPLOADS (
+                    ID INTEGER PRIMARY KEY AUTOINCREMENT,
+                    CAMINHO TEXT NOT NULL,
+                    REMOTO TEXT NOT NULL,
+                    SHA256 TEXT,
+                    LOG_ID INTEGER,
+                    STATUS TEXT NOT NULL,
+                    TENTATIVAS INTEGER NOT NULL DEFAULT 0,
+                    PROXIMA_TENTATIVA TEXT NOT NULL,
+                    CRIADO_EM TEXT NOT NULL,
+                    ENVIADO_EM TEXT,
+                    MENSAGEM TEXT
+                )
+            """)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS IDX_UPLOADS_STATUS ON UPLOADS (STATUS, PROXIMA_TENTATIVA)"
+            )
+            colunas = {row[1] for row in conn.execute("PRAGMA table_info(UPLOADS)")}
+            if 'CHAVE_LOG' not in colunas:
+                # Arquivo criado antes do diário MySQL
+                conn.execute("ALTER TABLE UPLOADS ADD COLUMN CHAVE_LOG TEXT")
+            if 'COPIA' not in colunas:
+                conn.execute("ALTER TABLE UPLOADS ADD COLUMN COPIA TEXT")
+            conn.execute(
+                "UPDATE UPLOADS SET STATUS = ?, MENSAGEM = ? WHERE STATUS = ? AND CRIADO_EM < ?",
+                (UPLOAD_DESCARTADO, "Expirado", UPLOAD_PENDENTE,
+                 (agora - timedelta(days=OUTBOX_MAX_AGE_DAYS)).isoformat())
+            )
+            # Cópias de envios que não vão mais sair (ex: expirados)
+            sobras = conn.execute(
+                "SELECT ID, COPIA FROM UPLOADS WHERE COPIA IS NOT NULL AND STATUS NOT IN (?, ?)",
+                (UPLOAD_PENDENTE, UPLOAD_ENVIADO)
+            ).fetchall()
+            for item_id, copia in sobras:
+                self._remove_copy(copia)
+                conn.execute("UPDATE UPLOADS SET COPIA = NULL WHERE ID = ?", (item_id,))
+            conn.execute(
+                "DELETE FROM UPLOADS WHERE STATUS IN (?, ?) AND CRIADO_EM < ?",
+                (UPLOAD_CONCLUIDO, UPLOAD_DESCARTADO,
+                 (agora - timedelta(days=OUTBOX_HISTORY_DAYS)).isoformat())
+            )
+
+    def _next_due(self) -> Tuple[Optional[UploadItem], Optional[float]]:
+        """
+        Próximo item com tentativa vencida
+
+        Returns:
+            Tuple[Optional[UploadItem], Optional[float]]: (item, segundos até o próximo vencer)
+        """
+        agora = datetime.now()
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                """
+                SELECT ID, CAMINHO, REMOTO, SHA256, LOG_ID, TENTATIVAS, STATUS, CHAVE_LOG, COPIA,
+                       PROXIMA_TENTATIVA
+                FROM UPLOADS WHERE STATUS IN (?, ?)
+                ORDER BY PROXIMA_TENTATIVA, ID LIMIT 1
+                """,
+                (UPLOAD_PENDENTE, UPLOAD_ENVIADO)
+            ).fetchone()
+
+        if row is None:
+            return None, None
+        proxima = datetime.fromisoformat(row[9])
+        if proxima > agora:
+            return None, (proxima - agora).total_seconds()
+        return UploadItem(*row[:9]), None
+
+    def _update(self, item_id: int, **campos):
+        sets = ", ".join(f"{campo.upper()} = ?" for campo in campos)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(f"UPDATE UPLOADS SET {sets} WHERE ID = ?", (*campos.values(), item_id))
+
+    def _make_copy(self, caminho: str) -> Optional[str]:
+        """Cópia de envio (None se não deu: envia o próprio arquivo)"""
+        copia = f"{caminho}.{uuid.uuid4().hex[:8]}{UPLOAD_COPY_SUFFIX}"
+        try:
+            fast_copy(caminho, copia)
+            return copia
+        except OSError as e:
+            self.logger.warning(f"[FTP] Cópia de envio não criada, envia o original: {e}")
+            return None
+
+    def _remove_copy(self, copia: Optional[str]):
+        if not copia:
+            return
+        try:
+            os.remove(copia)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            self.logger.warning(f"[FTP] Cópia de envio não removida: {copia} ({e})")
+
+    # ============ API ============
+
+    def enqueue(
+        self,
+        caminho: str,
+        remoto: Optional[str] = None,
+        sha256: Optional[str] = None,
+        log_id: Optional[int] = None,
+        chave_log: Optional[str] = None,
+        copiar: bool = False
+    ) -> int:
+        """
+        Adiciona arquivo à fila
+
+        Um pendente para o mesmo arquivo (backup "U"/"S" sobrescrito antes
+        do envio) é reaproveitado com os dados novos; se ele já está sendo
+        enviado, entra um item novo e o envio em andamento termina com a
+        cópia dele.
+
+        Args:
+            copiar: Envia de uma cópia (backup com nome fixo, que o próximo
+                backup substitui durante o envio)
+
+        Returns:
+            ID do item
+        """
+        remoto = remoto or os.path.basename(caminho)
+        agora = datetime.now().isoformat()
+        copia = self._make_copy(caminho) if copiar else None
+        with self._condition:
+            em_envio = self._current
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute(
+                "SELECT ID, COPIA FROM UPLOADS WHERE CAMINHO = ? AND STATUS = ? AND ID IS NOT ?",
+                (caminho, UPLOAD_PENDENTE, em_envio)
+            ).fetchone()
+            if row:
+                item_id = row[0]
+                self._remove_copy(row[1])
+                conn.execute(
+                    """
+                    UPDATE UPLOADS SET REMOTO = ?, SHA256 = ?, LOG_ID = ?, CHAVE_LOG = ?, COPIA = ?,
+                        TENTATIVAS = 0, PROXIMA_TENTATIVA = ?, MENSAGEM = NULL
+                    WHERE ID = ?
+                    """,
+                    (remoto, sha256, log_id, chave_log, copia, agora, item_id)
+                )
+            else:
+                item_id = conn.execute(
+                    """
+                    INSERT INTO UPLOADS
+                    (CAMINHO, REMOTO, SHA256, LOG_ID, CHAVE_LOG, COPIA, STATUS, PROXIMA_TENTATIVA,
+                     CRIADO_EM)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (caminho, remoto, sha256, log_id, chave_log, copia, UPLOAD_PENDENTE, agora, agora)
+                ).lastrowid
+
+        with self._condition:
+            self._condition.notify_all()
+        return item_id
+
+    def pending_count(self) -> int:
+        """Envios ainda não concluídos"""
+        with closing(self._connect()) as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM UPLOADS WHERE STATUS IN (?, ?)",
+                (UPLOAD_PENDENTE, UPLOAD_ENVIADO)
+            ).fetchone()[0]
+
+    def start(self):
+        """Inicia o envio em segundo plano (inclui pendentes de antes do reinício)"""
+        self._thread = threading.Thread(target=self._loop, name="upload-outbox", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Para o envio (pendentes continuam gravados)"""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+
+    # ============ ENVIO ============
+
+    def _loop(self):
+        while True:
+            with self._condition:
+                if self._stopped:
+                    return
+                try:
+                    item, wait = self._next_due()
+                except sqlite3.Error as e:
+                    self.logger.error(f"Erro na fila de envio FTP: {e}")
+                    item, wait = None, 60
+                if item is None:
+                    # Acorda com novo envio, na próxima tentativa ou a cada minuto
+                    self._condition.wait(timeout=min(wait or 60, 60))
+                    continue
+                self._current = item.id
+
+            try:
+                self._process(item)
+            except Exception as e:
+                self.logger.error(f"Erro na fila de envio FTP: {e}", exc_info=True)
+                self._retry(item, str(e))
+            finally:
+                with self._condition:
+                    self._current = None
+
+    def _process(self, item: UploadItem):
+        if item.status == UPLOAD_PENDENTE:
+            if not os.path.exists(item.caminho) or not os.path.exists(item.origem):
+                # Removido pela retenção ou manualmente antes do envio
+                self.logger.warning(f"[FTP] Arquivo não existe mais, envio descartado: {item.caminho}")
+                self._update(item.id, status=UPLOAD_DESCARTADO, mensagem="Arquivo não encontrado")
+                self._remove_copy(item.copia)
+                return
+
+            success, message = self.uploader(item)
+            if not success:
+                self._retry(item, message)
+                return
+            enviado_em = datetime.now()
+            item.status = UPLOAD_ENVIADO
+            self._update(
+                item.id, status=UPLOAD_ENVIADO, enviado_em=enviado_em.isoformat(), mensagem=None
+            )
+            self._remove_copy(item.copia)
+        else:
+            enviado_em = self._sent_at(item.id)
+
+        if self.on_done(item, enviado_em):
+            self._update(item.id, status=UPLOAD_CONCLUIDO)
+        else:
+            self._retry(item, "Falha ao registrar o envio")
+
+    def _retry(self, item: UploadItem, message: str):
+        tentativas = item.tentativas + 1
+        espera = backoff_seconds(tentativas)
+        self.logger.warning(
+            f"[FTP] Envio de {item.remoto} falhou ({message}); "
+            f"tentativa {tentativas + 1} em {espera // 60} min"
+        )
+        self._update(
+            item.id,
+            tentativas=tentativas,
+            proxima_tentativa=(datetime.now() + timedelta(seconds=espera)).isoformat(),
+            mensagem=message
+        )
+
+    def _sent_at(self, item_id: int) -> datetime:
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT ENVIADO_EM FROM UPLOADS WHERE ID = ?", (item_id,)).fetchone()
+        return datetime.fromisoformat(row[0]) if row and row[0] else datetime.now()
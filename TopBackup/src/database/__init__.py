@@ -5,3 +5,4 @@ from .models import Empresa, AgendaBackup, LogBackup
 from .firebird_client import FirebirdClient
 from .mysql_client import MySQLClient
 from .sync_manager import SyncManager
+from .catalog import BackupCatalog, CatalogEntry
@@ -0,0 +1,325 @@
+"""
+TopBackup - Catálogo Local de Backups
+Histórico indexado (SQLite) de todos os artefatos gerados
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from contextlib import closing
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from ..utils.logger import get_logger
+
+# Status de um artefato no catálogo
+ARTEFATO_OK = "ok"
+ARTEFATO_REMOVIDO = "removido"
+ARTEFATO_CORROMPIDO = "corrompido"
+
+
+@dataclass
+class CatalogEntry:
+    """Artefato de backup registrado no catálogo"""
+    id: Optional[int] = None
+    data: datetime = field(default_factory=datetime.now)
+    id_empresa: int = 0
+    banco: str = ""                 # Banco de origem
+    tipo_backup: str = ""           # Prefixo da agenda (V/S/U)
+    arquivo: str = ""
+    caminho: str = ""
+    caminho2: Optional[str] = None
+    tamanho_bytes: int = 0
+    sha256: Optional[str] = None
+    codec: Optional[str] = None
+    duracao_segundos: float = 0
+    etapas: Dict[str, float] = field(default_factory=dict)  # Segundos por etapa
+    manual: bool = False
+    log_id: Optional[int] = None    # ID em LOG_BACKUPS (MySQL)
+    status: str = ARTEFATO_OK
+    verificado_em: Optional[datetime] = None
+    remoto: Optional[str] = None    # Nome do arquivo no FTP (None = não enviado)
+    remoto_removido: bool = False
+
+    @property
+    def destino(self) -> str:
+        return os.path.dirname(self.caminho)
+
+    @property
+    def destino2(self) -> Optional[str]:
+        return os.path.dirname(self.caminho2) if self.caminho2 else None
+
+
+_COLUMNS = (
+    "ID, DATA, ID_EMPRESA, BANCO, TIPO_BACKUP, ARQUIVO, CAMINHO, CAMINHO2, "
+    "TAMANHO, SHA256, CODEC, DURACAO, ETAPAS, MANUAL, LOG_ID, STATUS, VERIFICADO_EM, "
+    "REMOTO, REMOTO_REMOVIDO"
+)
+
+# Colunas adicionadas depois da primeira versão do catálogo
+_ADDED_COLUMNS = {
+    "REMOTO": "TEXT",
+    "REMOTO_REMOVIDO": "INTEGER NOT NULL DEFAULT 0",
+}
+
+
+def _normalize_dir(path: Optional[str]) -> Optional[str]:
+    """Diretório na forma usada nos índices (comparação sem caixa no Windows)"""
+    if not path:
+        return None
+    return os.path.normcase(os.path.abspath(path))
+
+
+class BackupCatalog:
+    """
+    Catálogo local dos artefatos de backup
+
+    Cada backup concluído vira uma linha com caminhos, tamanho, hash,
+    codec, duração por etapa e banco de origem, indexada por data, banco
+    e destino. Retenção, verificação, restauração e a tela de histórico
+    consultam o catálogo em vez de listar diretórios ou ir ao MySQL.
+
+    Usage:
+        catalog = BackupCatalog(FileUtils.get_data_directory() / "catalogo.db")
+        catalog.add(CatalogEntry(...))
+        ultimos = catalog.list_entries(destino="D:\\Backup", limit=10)
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.logger = get_logger()
+        self._lock = threading.Lock()
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.path), timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _init_db(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS ARTEFATOS (
+                    ID INTEGER PRIMARY KEY AUTOINCREMENT,
+                    DATA TEXT NOT NULL,
+                    ID_EMPRESA INTEGER NOT NULL DEFAULT 0,
+                    BANCO TEXT NOT NULL,
+                    TIPO_BACKUP TEXT,
+                    ARQUIVO TEXT NOT NULL,
+                    CAMINHO TEXT NOT NULL,
+                    CAMINHO2 TEXT,
+                    DESTINO TEXT NOT NULL,
+                    DESTINO2 TEXT,
+                    TAMANHO INTEGER NOT NULL DEFAULT 0,
+                    SHA256 TEXT,
+                    CODEC TEXT,
+                    DURACAO REAL NOT NULL DEFAULT 0,
+                    ETAPAS TEXT,
+                    MANUAL INTEGER NOT NULL DEFAULT 0,
+                    LOG_ID INTEGER,
+                    STATUS TEXT NOT NULL,
+                    VERIFICADO_EM TEXT
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS IDX_ARTEFATOS_DATA ON ARTEFATOS (DATA)")
+            conn.execute("CREATE INDEX IF NOT EXISTS IDX_ARTEFATOS_BANCO ON ARTEFATOS (BANCO, DATA)")
+            conn.execute("CREATE INDEX IF NOT EXISTS IDX_ARTEFATOS_DESTINO ON ARTEFATOS (DESTINO, DATA)")
+            conn.execute("CREATE INDEX IF NOT EXISTS IDX_ARTEFATOS_DESTINO2 ON ARTEFATOS (DESTINO2, DATA)")
+            conn.execute("CREATE INDEX IF NOT EXISTS IDX_ARTEFATOS_CAMINHO ON ARTEFATOS (CAMINHO)")
+
+            existing = {row[1] for row in conn.execute("PRAGMA table_info(ARTEFATOS)")}
+            for column, definition in _ADDED_COLUMNS.items():
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE ARTEFATOS ADD COLUMN {column} {definition}")
+            conn.execute("CREATE INDEX IF NOT EXISTS IDX_ARTEFATOS_REMOTO ON ARTEFATOS (BANCO, REMOTO_REMOVIDO, DATA)")
+
+    @staticmethod
+    def _row_to_entry(row) -> CatalogEntry:
+        (id_, data, id_empresa, banco, tipo, arquivo, caminho, caminho2, tamanho,
+         sha256, codec, duracao, etapas, manual, log_id, status, verificado_em,
+         remoto, remoto_removido) = row
+        return CatalogEntry(
+            id=id_,
+            data=datetime.fromisoformat(data),
+            id_empresa=id_empresa,
+            banco=banco,
+            tipo_backup=tipo or "",
+            arquivo=arquivo,
+            caminho=caminho,
+            caminho2=caminho2,
+            tamanho_bytes=tamanho,
+            sha256=sha256,
+            codec=codec,
+            duracao_segundos=duracao,
+            etapas=json.loads(etapas) if etapas else {},
+            manual=bool(manual),
+            log_id=log_id,
+            status=status,
+            verificado_em=datetime.fromisoformat(verificado_em) if verificado_em else None,
+            remoto=remoto,
+            remoto_removido=bool(remoto_removido)
+        )
+
+    def add(self, entry: CatalogEntry) -> int:
+        """
+        Registra um artefato
+
+        Um artefato com o mesmo caminho (modos 'U' e 'S' sobrescrevem o
+        arquivo) substitui o registro anterior.
+
+        Returns:
+            ID do registro
+        """
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.execute(
+                "UPDATE ARTEFATOS SET STATUS = ? WHERE CAMINHO = ? AND STATUS = ?",
+                (ARTEFATO_REMOVIDO, entry.caminho, ARTEFATO_OK)
+            )
+            cursor = conn.execute(
+                """
+                INSERT INTO ARTEFATOS (
+                    DATA, ID_EMPRESA, BANCO, TIPO_BACKUP, ARQUIVO, CAMINHO, CAMINHO2,
+                    DESTINO, DESTINO2, TAMANHO, SHA256, CODEC, DURACAO, ETAPAS,
+                    MANUAL, LOG_ID, STATUS
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    entry.data.isoformat(timespec='seconds'), entry.id_empresa, entry.banco,
+                    entry.tipo_backup, entry.arquivo, entry.caminho, entry.caminho2,
+                    _normalize_dir(entry.destino), _normalize_dir(entry.destino2),
+                    entry.tamanho_bytes, entry.sha256, entry.codec, entry.duracao_segundos,
+                    json.dumps({k: round(v, 3) for k, v in entry.etapas.items()}),
+                    int(entry.manual), entry.log_id, entry.status
+                )
+            )
+            entry.id = cursor.lastrowid
+            return entry.id
+
+    def list_entries(
+        self,
+        banco: Optional[str] = None,
+        destino: Optional[str] = None,
+        desde: Optional[datetime] = None,
+        ate: Optional[datetime] = None,
+        status: Optional[str] = ARTEFATO_OK,
+        limit: Optional[int] = None
+    ) -> List[CatalogEntry]:
+        """
+        Lista artefatos (mais recentes primeiro)
+
+        Args:
+            banco: Só deste banco de origem
+            destino: Só artefatos neste diretório (destino 1 ou 2)
+            desde/ate: Intervalo de datas
+            status: Filtra pelo status (None = todos)
+            limit: Máximo de registros
+        """
+        where, params = [], []
+        if banco:
+            where.append("BANCO = ?")
+            params.append(banco)
+        if destino:
+            where.append("(DESTINO = ? OR DESTINO2 = ?)")
+            params += [_normalize_dir(destino)] * 2
+        if desde:
+            where.append("DATA >= ?")
+            params.append(desde.isoformat(timespec='seconds'))
+        if ate:
+            where.append("DATA <= ?")
+            params.append(ate.isoformat(timespec='seconds'))
+        if status:
+            where.append("STATUS = ?")
+            params.append(status)
+
+        sql = f"SELECT {_COLUMNS} FROM ARTEFATOS"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY DATA DESC, ID DESC"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        with closing(self._connect()) as conn:
+            return [self._row_to_entry(row) for row in conn.execute(sql, params)]
+
+    def latest(self, banco: Optional[str] = None) -> Optional[CatalogEntry]:
+        """Último artefato disponível (de um banco ou de qualquer um)"""
+        entries = self.list_entries(banco=banco, limit=1)
+        return entries[0] if entries else None
+
+    def find_by_path(self, caminho: str) -> Optional[CatalogEntry]:
+        """Artefato pelo caminho (destino 1 ou 2)"""
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                f"SELECT {_COLUMNS} FROM ARTEFATOS WHERE CAMINHO = ? OR CAMINHO2 = ? "
+                "ORDER BY ID DESC LIMIT 1",
+                (caminho, caminho)
+            ).fetchone()
+        return self._row_to_entry(row) if row else None
+
+    def set_status(self, ids: Iterable[int], status: str):
+        """Atualiza o status de vários artefatos (ex: removidos pela retenção)"""
+        ids = list(ids)
+        if not ids:
+            return
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "UPDATE ARTEFATOS SET STATUS = ? WHERE ID = ?",
+                [(status, id_) for id_ in ids]
+            )
+
+    def mark_uploaded(self, caminho: str, remoto: str):
+        """Registra o envio do artefato ao FTP"""
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.execute(
+                """
+                UPDATE ARTEFATOS SET REMOTO = ?, REMOTO_REMOVIDO = 0
+                WHERE ID = (SELECT MAX(ID) FROM ARTEFATOS WHERE CAMINHO = ?)
+                """,
+                (remoto, caminho)
+            )
+
+    def list_remote(self, banco: Optional[str] = None) -> List[CatalogEntry]:
+        """Artefatos presentes no FTP (mais recentes primeiro)"""
+        sql = f"SELECT {_COLUMNS} FROM ARTEFATOS WHERE REMOTO IS NOT NULL AND REMOTO_REMOVIDO = 0"
+        params: list = []
+        if banco:
+            sql += " AND BANCO = ?"
+            params.append(banco)
+        sql += " ORDER BY DATA DESC, ID DESC"
+        with closing(self._connect()) as conn:
+            return [self._row_to_entry(row) for row in conn.execute(sql, params)]
+
+    def set_remote_removed(self, ids: Iterable[int]):
+        """Marca artefatos como removidos do FTP"""
+        ids = list(ids)
+        if not ids:
+            return
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "UPDATE ARTEFATOS SET REMOTO_REMOVIDO = 1 WHERE ID = ?",
+                [(id_,) for id_ in ids]
+            )
+
+    def mark_verified(self, entry_id: int, ok: bool = True):
+        """Registra o resultado de uma verificação do artefato"""
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.execute(
+                "UPDATE ARTEFATOS SET VERIFICADO_EM = ?, STATUS = ? WHERE ID = ?",
+                (datetime.now().isoformat(timespec='seconds'),
+                 ARTEFATO_OK if ok else ARTEFATO_CORROMPIDO, entry_id)
+            )
+
+    def total_bytes(self, destino: Optional[str] = None) -> int:
+        """Espaço ocupado pelos artefatos disponíveis (opcionalmente de um destino)"""
+        sql = "SELECT COALESCE(SUM(TAMANHO), 0) FROM ARTEFATOS WHERE STATUS = ?"
+        params: list = [ARTEFATO_OK]
+        if destino:
+            sql += " AND (DESTINO = ? OR DESTINO2 = ?)"
+            params += [_normalize_dir(destino)] * 2
+        with closing(self._connect()) as conn:
+            return conn.execute(sql, params).fetchone()[0]
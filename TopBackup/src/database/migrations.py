@@ -0,0 +1,186 @@
+"""
+TopBackup - Migrações do Schema MySQL
+Alterações do schema versionadas em SCHEMA_VERSION, aplicadas uma vez sob lock
+"""
+
+from dataclasses import dataclass
+from typing import Any, Callable, List, Optional
+
+from mysql.connector import errorcode
+from mysql.connector.errors import ProgrammingError
+
+from ..config.constants import MYSQL_SCHEMA_LOCK_WAIT
+from ..utils.logger import get_logger
+
+
+@dataclass
+class Migration:
+    """Alteração do schema (aplicar recebe o cursor e o nome do banco)"""
+    versao: int
+    descricao: str
+    aplicar: Callable[[Any, str], None]
+
+
+def _column_exists(cursor: Any, database: str, table: str, column: str) -> bool:
+    cursor.execute("""
+        SELECT COUNT(*) FROM INFORMATION_SCHEMA.COLUMNS
+        WHERE TABLE_SCHEMA = %s
+        AND TABLE_NAME = %s
+        AND COLUMN_NAME = %s
+    """, (database, table, column))
+    return cursor.fetchone()[0] > 0
+
+
+# As migrações conferem o schema antes de alterar: bancos anteriores ao
+# SCHEMA_VERSION podem já ter parte delas (eram aplicadas pelo ensure_schema)
+
+def _add_manual(cursor: Any, database: str):
+    if not _column_exists(cursor, database, 'LOG_BACKUPS', 'MANUAL'):
+        cursor.execute("ALTER TABLE LOG_BACKUPS ADD COLUMN MANUAL CHAR(1) DEFAULT 'N'")
+
+
+def _add_caminho_destino2(cursor: Any, database: str):
+    if not _column_exists(cursor, database, 'LOG_BACKUPS', 'CAMINHO_DESTINO2'):
+        cursor.execute("""
+            ALTER TABLE LOG_BACKUPS
+            ADD COLUMN CAMINHO_DESTINO2 VARCHAR(500) AFTER CAMINHO_DESTINO
+        """)
+
+
+def _add_codec(cursor: Any, database: str):
+    if not _column_exists(cursor, database, 'LOG_BACKUPS', 'CODEC'):
+        cursor.execute("ALTER TABLE LOG_BACKUPS ADD COLUMN CODEC VARCHAR(20) AFTER TIPO_BACKUP")
+
+
+def _add_chave_local(cursor: Any, database: str):
+    # Única: o diário local reenvia lotes sem duplicar
+    if not _column_exists(cursor, database, 'LOG_BACKUPS', 'CHAVE_LOCAL'):
+        cursor.execute("""
+            ALTER TABLE LOG_BACKUPS
+            ADD COLUMN CHAVE_LOCAL VARCHAR(32) NULL,
+            ADD UNIQUE KEY UK_LOG_BACKUPS_CHAVE_LOCAL (CHAVE_LOCAL)
+        """)
+
+
+def _rename_ultima_abertura(cursor: Any, database: str):
+    if _column_exists(cursor, database, 'EMPRESA', 'DATA_ULTIMA_ABERTURA'):
+        cursor.execute("""
+            ALTER TABLE EMPRESA
+            CHANGE DATA_ULTIMA_ABERTURA DATA_ULTIMA_INTERACAO DATETIME
+        """)
+
+
+def _drop_ultimo_contato(cursor: Any, database: str):
+    if _column_exists(cursor, database, 'EMPRESA', 'ULTIMO_CONTATO'):
+        cursor.execute("ALTER TABLE EMPRESA DROP COLUMN ULTIMO_CONTATO")
+
+
+# Novas alterações entram no fim, com a versão seguinte (nunca mudar as já publicadas)
+MIGRATIONS: List[Migration] = [
+    Migration(1, "Coluna MANUAL em LOG_BACKUPS", _add_manual),
+    Migration(2, "Coluna CAMINHO_DESTINO2 em LOG_BACKUPS", _add_caminho_destino2),
+    Migration(3, "Coluna CODEC em LOG_BACKUPS", _add_codec),
+    Migration(4, "Coluna CHAVE_LOCAL em LOG_BACKUPS", _add_chave_local),
+    Migration(5, "DATA_ULTIMA_ABERTURA renomeada para DATA_ULTIMA_INTERACAO", _rename_ultima_abertura),
+    Migration(6, "Remove coluna ULTIMO_CONTATO de EMPRESA", _drop_ultimo_contato),
+]
+
+
+class SchemaMigrator:
+    """
+    Aplica as migrações pendentes do schema MySQL
+
+    A versão do schema fica numa linha de SCHEMA_VERSION: na partida o
+    cliente faz só uma busca pela chave primária e, com o schema em dia,
+    termina aí (sem consultas ao INFORMATION_SCHEMA). Havendo migração
+    pendente, ela roda sob GET_LOCK, então os clientes que sobem juntos
+    (ex: depois de uma atualização) não disputam o DDL: o primeiro
+    migra e os outros, ao pegar o lock, já encontram a versão nova.
+
+    Usage:
+        with client.get_connection() as conn:
+            SchemaMigrator(conn, database).migrate()
+    """
+
+    def __init__(self, conn: Any, database: str, migrations: Optional[List[Migration]] = None):
+        self.conn = conn
+        self.database = database
+        self.migrations = migrations if migrations is not None else MIGRATIONS
+        self.logger = get_logger()
+        self._lock_name = f"topbackup.schema.{database}"[:64]  # Limite do GET_LOCK
+
+    @property
+    def latest(self) -> int:
+        return self.migrations[-1].versao if self.migrations else 0
+
+    def current_version(self) -> Optional[int]:
+        """Versão do schema no servidor (None se SCHEMA_VERSION ainda não existe)"""
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute("SELECT VERSAO FROM SCHEMA_VERSION WHERE ID = 1")
+            row = cursor.fetchone()
+        except ProgrammingError as e:
+            if e.errno == errorcode.ER_NO_SUCH_TABLE:
+                return None
+            raise
+        finally:
+            cursor.close()
+        # Encerra a leitura: depois do lock a versão é lida de novo
+        self.conn.commit()
+        return row[0] if row else 0
+
+    def migrate(self) -> bool:
+        """
+        Aplica as migrações pendentes
+
+        Returns:
+            False se outro cliente segurou o lock além de MYSQL_SCHEMA_LOCK_WAIT
+            (a migração fica para a próxima partida)
+        """
+        versao = self.current_version()
+        if versao is not None and versao >= self.latest:
+            return True
+
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute("SELECT GET_LOCK(%s, %s)", (self._lock_name, MYSQL_SCHEMA_LOCK_WAIT))
+            if cursor.fetchone()[0] != 1:
+                self.logger.warning("Schema MySQL em migração por outro cliente, verificação adiada")
+                return False
+
+            try:
+                self._migrate_locked(cursor)
+            finally:
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (self._lock_name,))
+                cursor.fetchone()
+            return True
+        finally:
+            cursor.close()
+
+    def _migrate_locked(self, cursor: Any):
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS SCHEMA_VERSION (
+                ID TINYINT PRIMARY KEY,
+                VERSAO INT NOT NULL,
+                ATUALIZADO_EM DATETIME NOT NULL
+            ) ENGINE=InnoDB
+        """)
+        cursor.execute("INSERT IGNORE INTO SCHEMA_VERSION (ID, VERSAO, ATUALIZADO_EM) VALUES (1, 0, NOW())")
+        self.conn.commit()
+
+        # Com o lock: outro cliente pode ter migrado enquanto este esperava
+        cursor.execute("SELECT VERSAO FROM SCHEMA_VERSION WHERE ID = 1")
+        versao = cursor.fetchone()[0]
+        self.conn.commit()
+
+        for migration in self.migrations:
+            if migration.versao <= versao:
+                continue
+            migration.aplicar(cursor, self.database)
+            # DDL faz commit implícito no MySQL: a versão avança a cada migração
+            cursor.execute(
+                "UPDATE SCHEMA_VERSION SET VERSAO = %s, ATUALIZADO_EM = NOW() WHERE ID = 1",
+                (migration.versao,)
+            )
+            self.conn.commit()
+            self.logger.info(f"Migração {migration.versao} aplicada: {migration.descricao}")
@@ -137,6 +137,8 @@ class LogBackup:
     enviado_ftp: str = 'N'
     data_envio_ftp: Optional[datetime] = None
     manual: bool = False  # True se foi backup manual, False se automático
+    codec: Optional[str] = None  # Codec de compressão usado (ex: deflate-6, zstd-3)
+    chave_local: Optional[str] = None  # Chave gerada localmente (gravação idempotente pelo diário)
 
     def set_sucesso(self, arquivo: str, caminho: str, tamanho: int, tamanho_fmt: str, caminho2: Optional[str] = None):
         """Define backup como sucesso"""
@@ -5,23 +5,33 @@ Conexão e operações com banco MySQL na nuvem
 
 import mysql.connector
 from mysql.connector import Error as MySQLError
-from typing import Optional, List, Tuple
+from typing import Dict, Optional, List, Tuple
 from contextlib import contextmanager
 from datetime import datetime
 
 from .models import Empresa, LogBackup, VersaoApp
+from .migrations import SchemaMigrator
+from .mysql_pool import MySQLConnectionPool
 from ..config.settings import MySQLConfig
 from ..utils.logger import get_logger
 from ..utils.resilience import retry
 
 
 class MySQLClient:
-    """Cliente para conexão com banco MySQL na nuvem"""
+    """
+    Cliente para conexão com banco MySQL na nuvem
+
+    As operações usam conexões do MySQLConnectionPool e statements
+    preparados: backup, heartbeat e sincronização reaproveitam a mesma
+    conexão em vez de abrir uma (TCP + TLS + autenticação) por chamada.
+    """
 
     def __init__(self, config: MySQLConfig):
         self.config = config
         self.logger = get_logger()
-        self._pool = None
+        self._pool = MySQLConnectionPool(
+            lambda: mysql.connector.connect(**self._get_connection_params())
+        )
 
     def _get_connection_params(self) -> dict:
         """Retorna parâmetros de conexão"""
@@ -38,14 +48,22 @@ class MySQLClient:
 
     @contextmanager
     def get_connection(self):
-        """Context manager para conexão com MySQL"""
-        connection = None
-        try:
-            connection = mysql.connector.connect(**self._get_connection_params())
-            yield connection
-        finally:
-            if connection and connection.is_connected():
-                connection.close()
+        """Context manager para conexão com MySQL (conexão do pool, para SQL avulso)"""
+        with self._pool.connection() as conn:
+            yield conn.raw
+
+    def pool_stats(self) -> dict:
+        """Conexões abertas, reaproveitadas, round-trips e tempo de conexão"""
+        return self._pool.stats.to_dict()
+
+    def close(self):
+        """Fecha as conexões ociosas (encerramento do app)"""
+        stats = self._pool.stats
+        self.logger.debug(
+            f"MySQL: {stats.conexoes_abertas} conexões abertas, "
+            f"{stats.reaproveitadas} reaproveitadas, {stats.round_trips} round-trips"
+        )
+        self._pool.close()
 
     @retry(max_attempts=3, delay=2.0, exceptions=(MySQLError,))
     def test_connection(self) -> Tuple[bool, str]:
@@ -56,10 +74,8 @@ class MySQLClient:
             Tuple[bool, str]: (sucesso, mensagem)
         """
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT 1")
-                cursor.fetchone()
+            with self._pool.connection() as conn:
+                conn.fetch_one("SELECT 1")
                 return True, "Conexão bem-sucedida"
         except MySQLError as e:
             self.logger.error(f"Erro de conexão MySQL: {e}")
@@ -73,8 +89,7 @@ class MySQLClient:
     def get_empresa_by_cnpj(self, cnpj: str) -> Optional[Empresa]:
         """Busca empresa pelo CNPJ"""
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor(dictionary=True)
+            with self._pool.connection() as conn:
                 sql = """
                     SELECT ID, ID_AUX, FANTASIA, RAZAO, CNPJ,
                            DATA_ULTIMA_INTERACAO, VERSAO_LOCAL,
@@ -82,8 +97,7 @@ class MySQLClient:
                     FROM EMPRESA
                     WHERE CNPJ = %s
                 """
-                cursor.execute(sql, (cnpj,))
-                row = cursor.fetchone()
+                row = conn.fetch_one(sql, (cnpj,))
 
                 if row:
                     return Empresa(
@@ -106,15 +120,14 @@ class MySQLClient:
     def insert_empresa(self, empresa: Empresa) -> Optional[int]:
         """Insere nova empresa"""
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
+            with self._pool.connection() as conn:
                 sql = """
                     INSERT INTO EMPRESA
                     (ID_AUX, FANTASIA, RAZAO, CNPJ, DATA_ULTIMA_INTERACAO,
                      VERSAO_LOCAL, ATIVO)
                     VALUES (%s, %s, %s, %s, %s, %s, %s)
                 """
-                cursor.execute(sql, (
+                cursor = conn.execute(sql, (
                     empresa.id_aux,
                     empresa.fantasia,
                     empresa.razao,
@@ -133,8 +146,7 @@ class MySQLClient:
     def update_empresa(self, empresa: Empresa) -> bool:
         """Atualiza dados da empresa"""
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
+            with self._pool.connection() as conn:
                 sql = """
                     UPDATE EMPRESA SET
                         ID_AUX = %s,
@@ -145,7 +157,7 @@ class MySQLClient:
                         ATIVO = %s
                     WHERE ID = %s
                 """
-                cursor.execute(sql, (
+                cursor = conn.execute(sql, (
                     empresa.id_aux,
                     empresa.fantasia,
                     empresa.razao,
@@ -161,6 +173,48 @@ class MySQLClient:
             self.logger.error(f"Erro ao atualizar empresa: {e}")
             return False
 
+    def upsert_empresa(self, empresa: Empresa) -> Optional[int]:
+        """
+        Insere ou atualiza a empresa num único comando (CNPJ é único)
+
+        ID = LAST_INSERT_ID(ID) faz o lastrowid trazer o ID também quando
+        a empresa já existia, sem o SELECT antes.
+
+        Returns:
+            ID da empresa, ou None em caso de erro
+        """
+        try:
+            with self._pool.connection() as conn:
+                sql = """
+                    INSERT INTO EMPRESA
+                    (ID_AUX, FANTASIA, RAZAO, CNPJ, DATA_ULTIMA_INTERACAO,
+                     VERSAO_LOCAL, ATIVO)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE
+                        ID = LAST_INSERT_ID(ID),
+                        ID_AUX = VALUES(ID_AUX),
+                        FANTASIA = VALUES(FANTASIA),
+                        RAZAO = VALUES(RAZAO),
+                        DATA_ULTIMA_INTERACAO = VALUES(DATA_ULTIMA_INTERACAO),
+                        VERSAO_LOCAL = VALUES(VERSAO_LOCAL),
+                        ATIVO = VALUES(ATIVO)
+                """
+                cursor = conn.execute(sql, (
+                    empresa.id_aux,
+                    empresa.fantasia,
+                    empresa.razao,
+                    empresa.cnpj,
+                    datetime.now(),
+                    empresa.versao_local,
+                    empresa.ativo
+                ))
+                conn.commit()
+                return cursor.lastrowid or None
+
+        except Exception as e:
+            self.logger.error(f"Erro ao sincronizar empresa: {e}")
+            return None
+
     def sync_empresa(self, empresa: Empresa) -> Optional[int]:
         """Sincroniza empresa (insert ou update)"""
         existing = self.get_empresa_by_cnpj(empresa.cnpj)
@@ -177,16 +231,15 @@ class MySQLClient:
     def insert_log_backup(self, log: LogBackup) -> Optional[int]:
         """Insere novo log de backup"""
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
+            with self._pool.connection() as conn:
                 sql = """
                     INSERT INTO LOG_BACKUPS
                     (ID_EMPRESA, DATA_INICIO, DATA_FIM, NOME_ARQUIVO,
                      CAMINHO_DESTINO, CAMINHO_DESTINO2, TAMANHO_BYTES, TAMANHO_FORMATADO,
-                     STATUS, MENSAGEM_ERRO, TIPO_BACKUP, ENVIADO_FTP, DATA_ENVIO_FTP, MANUAL)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                     STATUS, MENSAGEM_ERRO, TIPO_BACKUP, ENVIADO_FTP, DATA_ENVIO_FTP, MANUAL, CODEC)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
                 """
-                cursor.execute(sql, (
+                cursor = conn.execute(sql, (
                     log.id_empresa,
                     log.data_inicio,
                     log.data_fim,
@@ -200,7 +253,8 @@ class MySQLClient:
                     log.tipo_backup,
                     log.enviado_ftp,
                     log.data_envio_ftp,
-                    'S' if log.manual else 'N'
+                    'S' if log.manual else 'N',
+                    log.codec
                 ))
                 conn.commit()
                 return cursor.lastrowid
@@ -212,8 +266,7 @@ class MySQLClient:
     def update_log_backup(self, log: LogBackup) -> bool:
         """Atualiza log de backup"""
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
+            with self._pool.connection() as conn:
                 sql = """
                     UPDATE LOG_BACKUPS SET
                         DATA_FIM = %s,
@@ -225,10 +278,11 @@ class MySQLClient:
                         STATUS = %s,
                         MENSAGEM_ERRO = %s,
                         ENVIADO_FTP = %s,
-                        DATA_ENVIO_FTP = %s
+                        DATA_ENVIO_FTP = %s,
+                        CODEC = %s
                     WHERE ID = %s
                 """
-                cursor.execute(sql, (
+                cursor = conn.execute(sql, (
                     log.data_fim,
                     log.nome_arquivo,
                     log.caminho_destino,
@@ -239,6 +293,7 @@ class MySQLClient:
                     log.mensagem_erro,
                     log.enviado_ftp,
                     log.data_envio_ftp,
+                    log.codec,
                     log.id
                 ))
                 conn.commit()
@@ -248,19 +303,137 @@ class MySQLClient:
             self.logger.error(f"Erro ao atualizar log de backup: {e}")
             return False
 
+    def update_log_ftp(self, log_id: int, data_envio: datetime) -> bool:
+        """Marca o backup como enviado ao FTP"""
+        try:
+            with self._pool.connection() as conn:
+                conn.execute(
+                    "UPDATE LOG_BACKUPS SET ENVIADO_FTP = 'S', DATA_ENVIO_FTP = %s WHERE ID = %s",
+                    (data_envio, log_id)
+                )
+                conn.commit()
+                return True
+
+        except Exception as e:
+            self.logger.error(f"Erro ao atualizar envio FTP do log: {e}")
+            return False
+
+    def write_journal_batch(
+        self,
+        inserts: List[LogBackup],
+        updates: List[LogBackup],
+        envios_ftp: List[Tuple[str, datetime]],
+        interacoes: List[Tuple[int, datetime]]
+    ) -> Dict[str, int]:
+        """
+        Grava um lote do diário local numa única transação
+
+        Os logs são identificados pela CHAVE_LOCAL, então repetir um lote
+        (queda depois do COMMIT e antes de o diário registrar) não duplica
+        nada: o INSERT ignora chaves já gravadas e os UPDATEs só regravam
+        os mesmos valores.
+
+        Returns:
+            Dict[str, int]: CHAVE_LOCAL → ID em LOG_BACKUPS dos inseridos
+
+        Raises:
+            MySQLError: Falha no lote (nada é gravado)
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+
+            if inserts:
+                # executemany vira um INSERT com várias linhas
+                cursor.executemany("""
+                    INSERT INTO LOG_BACKUPS
+                    (ID_EMPRESA, DATA_INICIO, DATA_FIM, NOME_ARQUIVO,
+                     CAMINHO_DESTINO, CAMINHO_DESTINO2, TAMANHO_BYTES, TAMANHO_FORMATADO,
+                     STATUS, MENSAGEM_ERRO, TIPO_BACKUP, ENVIADO_FTP, DATA_ENVIO_FTP, MANUAL, CODEC,
+                     CHAVE_LOCAL)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE ID = ID
+                """, [(
+                    log.id_empresa,
+                    log.data_inicio,
+                    log.data_fim,
+                    log.nome_arquivo,
+                    log.caminho_destino,
+                    log.caminho_destino2,
+                    log.tamanho_bytes,
+                    log.tamanho_formatado,
+                    log.status,
+                    log.mensagem_erro,
+                    log.tipo_backup,
+                    log.enviado_ftp,
+                    log.data_envio_ftp,
+                    'S' if log.manual else 'N',
+                    log.codec,
+                    log.chave_local
+                ) for log in inserts])
+
+            if updates:
+                cursor.executemany("""
+                    UPDATE LOG_BACKUPS SET
+                        DATA_FIM = %s,
+                        NOME_ARQUIVO = %s,
+                        CAMINHO_DESTINO = %s,
+                        CAMINHO_DESTINO2 = %s,
+                        TAMANHO_BYTES = %s,
+                        TAMANHO_FORMATADO = %s,
+                        STATUS = %s,
+                        MENSAGEM_ERRO = %s,
+                        CODEC = %s
+                    WHERE CHAVE_LOCAL = %s
+                """, [(
+                    log.data_fim,
+                    log.nome_arquivo,
+                    log.caminho_destino,
+                    log.caminho_destino2,
+                    log.tamanho_bytes,
+                    log.tamanho_formatado,
+                    log.status,
+                    log.mensagem_erro,
+                    log.codec,
+                    log.chave_local
+                ) for log in updates])
+
+            if envios_ftp:
+                cursor.executemany(
+                    "UPDATE LOG_BACKUPS SET ENVIADO_FTP = 'S', DATA_ENVIO_FTP = %s WHERE CHAVE_LOCAL = %s",
+                    [(data_envio, chave) for chave, data_envio in envios_ftp]
+                )
+
+            if interacoes:
+                # A interação mais recente prevalece (lote atrasado não volta a data)
+                cursor.executemany("""
+                    UPDATE EMPRESA SET DATA_ULTIMA_INTERACAO = %s
+                    WHERE ID = %s AND (DATA_ULTIMA_INTERACAO IS NULL OR DATA_ULTIMA_INTERACAO < %s)
+                """, [(data, id_empresa, data) for id_empresa, data in interacoes])
+
+            ids: Dict[str, int] = {}
+            if inserts:
+                chaves = [log.chave_local for log in inserts]
+                cursor.execute(
+                    "SELECT CHAVE_LOCAL, ID FROM LOG_BACKUPS WHERE CHAVE_LOCAL IN ("
+                    + ", ".join(["%s"] * len(chaves)) + ")",
+                    chaves
+                )
+                ids = {chave: log_id for chave, log_id in cursor.fetchall()}
+
+            conn.commit()
+            return ids
+
     def get_logs_by_empresa(self, id_empresa: int, limit: int = 50) -> List[LogBackup]:
         """Busca logs de backup por empresa"""
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor(dictionary=True)
+            with self._pool.connection() as conn:
                 sql = """
                     SELECT * FROM LOG_BACKUPS
                     WHERE ID_EMPRESA = %s
                     ORDER BY DATA_INICIO DESC
                     LIMIT %s
                 """
-                cursor.execute(sql, (id_empresa, limit))
-                rows = cursor.fetchall()
+                rows = conn.fetch_all(sql, (id_empresa, limit))
 
                 logs = []
                 for row in rows:
@@ -282,7 +455,9 @@ class MySQLClient:
                         tipo_backup=row['TIPO_BACKUP'],
                         enviado_ftp=row['ENVIADO_FTP'],
                         data_envio_ftp=row['DATA_ENVIO_FTP'],
-                        manual=(manual_value == 'S')
+                        manual=(manual_value == 'S'),
+                        codec=row.get('CODEC'),
+                        chave_local=row.get('CHAVE_LOCAL')
                     ))
                 return logs
 
@@ -295,15 +470,13 @@ class MySQLClient:
     def get_latest_version(self) -> Optional[VersaoApp]:
         """Busca a versão mais recente do aplicativo"""
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor(dictionary=True)
+            with self._pool.connection() as conn:
                 sql = """
                     SELECT * FROM VERSAO_APP
                     ORDER BY DATA_LANCAMENTO DESC
                     LIMIT 1
                 """
-                cursor.execute(sql)
-                row = cursor.fetchone()
+                row = conn.fetch_one(sql)
 
                 if row:
                     return VersaoApp(
@@ -326,12 +499,11 @@ class MySQLClient:
     def update_empresa_interacao(self, id_empresa: int) -> bool:
         """Atualiza última interação da empresa (abertura do app ou backup)"""
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
+            with self._pool.connection() as conn:
                 sql = """
                     UPDATE EMPRESA SET DATA_ULTIMA_INTERACAO = %s WHERE ID = %s
                 """
-                cursor.execute(sql, (datetime.now(), id_empresa))
+                conn.execute(sql, (datetime.now(), id_empresa))
                 conn.commit()
                 return True
 
@@ -342,76 +514,10 @@ class MySQLClient:
     # ============ SCHEMA ============
 
     def ensure_schema(self):
-        """Garante que o schema do banco está atualizado"""
+        """Garante que o schema do banco está atualizado (migrações versionadas)"""
         try:
             with self.get_connection() as conn:
-                cursor = conn.cursor()
-
-                # Verifica se coluna MANUAL existe em LOG_BACKUPS
-                cursor.execute("""
-                    SELECT COUNT(*) FROM INFORMATION_SCHEMA.COLUMNS
-                    WHERE TABLE_SCHEMA = %s
-                    AND TABLE_NAME = 'LOG_BACKUPS'
-                    AND COLUMN_NAME = 'MANUAL'
-                """, (self.config.database,))
-
-                if cursor.fetchone()[0] == 0:
-                    # Adiciona coluna MANUAL
-                    cursor.execute("""
-                        ALTER TABLE LOG_BACKUPS
-                        ADD COLUMN MANUAL CHAR(1) DEFAULT 'N'
-                    """)
-                    conn.commit()
-                    self.logger.info("Coluna MANUAL adicionada à tabela LOG_BACKUPS")
-
-                # Verifica se coluna CAMINHO_DESTINO2 existe em LOG_BACKUPS
-                cursor.execute("""
-                    SELECT COUNT(*) FROM INFORMATION_SCHEMA.COLUMNS
-                    WHERE TABLE_SCHEMA = %s
-                    AND TABLE_NAME = 'LOG_BACKUPS'
-                    AND COLUMN_NAME = 'CAMINHO_DESTINO2'
-                """, (self.config.database,))
-
-                if cursor.fetchone()[0] == 0:
-                    # Adiciona coluna CAMINHO_DESTINO2
-                    cursor.execute("""
-                        ALTER TABLE LOG_BACKUPS
-                        ADD COLUMN CAMINHO_DESTINO2 VARCHAR(500) AFTER CAMINHO_DESTINO
-                    """)
-                    conn.commit()
-                    self.logger.info("Coluna CAMINHO_DESTINO2 adicionada à tabela LOG_BACKUPS")
-
-                # Migração: Renomeia DATA_ULTIMA_ABERTURA para DATA_ULTIMA_INTERACAO
-                cursor.execute("""
-                    SELECT COUNT(*) FROM INFORMATION_SCHEMA.COLUMNS
-                    WHERE TABLE_SCHEMA = %s
-                    AND TABLE_NAME = 'EMPRESA'
-                    AND COLUMN_NAME = 'DATA_ULTIMA_ABERTURA'
-                """, (self.config.database,))
-
-                if cursor.fetchone()[0] > 0:
-                    cursor.execute("""
-                        ALTER TABLE EMPRESA
-                        CHANGE DATA_ULTIMA_ABERTURA DATA_ULTIMA_INTERACAO DATETIME
-                    """)
-                    conn.commit()
-                    self.logger.info("Coluna DATA_ULTIMA_ABERTURA renomeada para DATA_ULTIMA_INTERACAO")
-
-                # Migração: Remove coluna ULTIMO_CONTATO (obsoleta)
-                cursor.execute("""
-                    SELECT COUNT(*) FROM INFORMATION_SCHEMA.COLUMNS
-                    WHERE TABLE_SCHEMA = %s
-                    AND TABLE_NAME = 'EMPRESA'
-                    AND COLUMN_NAME = 'ULTIMO_CONTATO'
-                """, (self.config.database,))
-
-                if cursor.fetchone()[0] > 0:
-                    cursor.execute("""
-                        ALTER TABLE EMPRESA
-                        DROP COLUMN ULTIMO_CONTATO
-                    """)
-                    conn.commit()
-                    self.logger.info("Coluna ULTIMO_CONTATO removida da tabela EMPRESA")
+                SchemaMigrator(conn, self.config.database).migrate()
 
         except Exception as e:
             self.logger.warning(f"Erro ao verificar schema: {e}")
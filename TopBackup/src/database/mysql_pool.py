@@ -0,0 +1,258 @@
+"""
+TopBackup - Pool de Conexões MySQL
+Conexões reaproveitadas com verificação, descarte por ociosidade e statements preparados
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+from mysql.connector.errors import InterfaceError, OperationalError
+
+from ..config.constants import (
+    MYSQL_POOL_SIZE, MYSQL_POOL_WAIT, MYSQL_POOL_IDLE_TIMEOUT, MYSQL_POOL_CHECK_AFTER
+)
+from ..utils.logger import get_logger
+
+# Falhas que indicam conexão morta (descartada em vez de devolvida ao pool)
+CONNECTION_ERRORS = (InterfaceError, OperationalError, OSError)
+
+
+@dataclass
+class PoolStats:
+    """Contadores do pool (mostram a economia de conexões e round-trips)"""
+    conexoes_abertas: int = 0       # Handshakes (TCP, TLS e autenticação)
+    tempo_conexao_ms: float = 0.0   # Soma do tempo dos handshakes
+    reaproveitadas: int = 0         # Operações atendidas por conexão já aberta
+    descartadas: int = 0            # Fechadas por erro, ping sem resposta ou ociosidade
+    round_trips: int = 0            # Comandos ao servidor (inclui PREPARE, COMMIT e ping)
+    preparados: int = 0             # Statements preparados no servidor
+    preparados_reusados: int = 0    # Execuções que aproveitaram um statement já preparado
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        data['tempo_medio_conexao_ms'] = round(
+            self.tempo_conexao_ms / self.conexoes_abertas, 1
+        ) if self.conexoes_abertas else 0.0
+        return data
+
+
+class PooledConnection:
+    """
+    Conexão do pool com cache de statements preparados
+
+    Cada SQL fixo é preparado uma vez por conexão (cursor prepared do
+    mysql.connector); as execuções seguintes só mandam os parâmetros.
+    SQL avulso (ex: verificação de schema) usa raw.cursor().
+    """
+
+    def __init__(self, raw: Any, pool: "MySQLConnectionPool"):
+        self.raw = raw
+        self.last_used = time.monotonic()
+        self._pool = pool
+        self._statements: Dict[str, Any] = {}
+
+    def execute(self, sql: str, params: Sequence = ()) -> Any:
+        """Executa SQL fixo com statement preparado (retorna o cursor)"""
+        cursor = self._statements.get(sql)
+        if cursor is None:
+            cursor = self.raw.cursor(prepared=True)
+            self._statements[sql] = cursor
+            self._pool._count(round_trips=2, preparados=1)
+        else:
+            self._pool._count(round_trips=1, preparados_reusados=1)
+        cursor.execute(sql, tuple(params))
+        return cursor
+
+    def fetch_all(self, sql: str, params: Sequence = ()) -> List[Dict[str, Any]]:
+        """Linhas da consulta como dicionários (coluna → valor)"""
+        cursor = self.execute(sql, params)
+        rows = cursor.fetchall()
+        columns = list(cursor.column_names)
+        return [dict(zip(columns, row)) for row in rows]
+
+    def fetch_one(self, sql: str, params: Sequence = ()) -> Optional[Dict[str, Any]]:
+        """Primeira linha da consulta (o restante é descartado)"""
+        rows = self.fetch_all(sql, params)
+        return rows[0] if rows else None
+
+    def commit(self):
+        self.raw.commit()
+        self._pool._count(round_trips=1)
+
+    def close(self):
+        for cursor in self._statements.values():
+            try:
+                cursor.close()
+            except Exception:
+                pass
+        self._statements.clear()
+        try:
+            self.raw.close()
+        except Exception:
+            pass
+
+
+class MySQLConnectionPool:
+    """
+    Pool limitado de conexões MySQL
+
+    Até max_size conexões em uso ao mesmo tempo (quem passa disso espera
+    até MYSQL_POOL_WAIT). A conexão devolvida fica ociosa para a próxima
+    operação: backup, heartbeat e sincronização deixam de abrir uma
+    conexão (TCP + TLS + autenticação) cada. Conexão parada há mais de
+    check_after recebe ping antes do uso e, se caiu, outra é aberta; as
+    ociosas além de idle_timeout são fechadas por uma thread.
+
+    Usage:
+        pool = MySQLConnectionPool(lambda: mysql.connector.connect(**params))
+        with pool.connection() as conn:
+            conn.execute("UPDATE ...", (valor, id))
+            conn.commit()
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], Any],
+        max_size: int = MYSQL_POOL_SIZE,
+        idle_timeout: float = MYSQL_POOL_IDLE_TIMEOUT,
+        check_after: float = MYSQL_POOL_CHECK_AFTER
+    ):
+        self.logger = get_logger()
+        self.max_size = max(max_size, 1)
+        self.idle_timeout = idle_timeout
+        self.check_after = check_after
+        self.stats = PoolStats()
+        self._connect = connect
+        self._slots = threading.BoundedSemaphore(self.max_size)
+        self._lock = threading.Lock()
+        self._idle: List[PooledConnection] = []
+        self._stop = threading.Event()
+        self._reaper: Optional[threading.Thread] = None
+
+    def _count(self, **campos):
+        with self._lock:
+            for campo, valor in campos.items():
+                setattr(self.stats, campo, getattr(self.stats, campo) + valor)
+
+    def _open(self) -> PooledConnection:
+        inicio = time.monotonic()
+        raw = self._connect()
+        self._count(conexoes_abertas=1, tempo_conexao_ms=(time.monotonic() - inicio) * 1000)
+        return PooledConnection(raw, self)
+
+    def acquire(self, timeout: float = MYSQL_POOL_WAIT) -> PooledConnection:
+        """
+        Conexão ociosa (verificada se parada há tempo) ou uma nova
+
+        Raises:
+            MySQLPoolError: Todas as conexões em uso além do timeout
+        """
+        if not self._slots.acquire(timeout=timeout):
+            raise MySQLPoolError(f"Nenhuma conexão MySQL livre após {timeout}s")
+        try:
+            while True:
+                with self._lock:
+                    conn = self._idle.pop() if self._idle else None
+                if conn is None:
+                    return self._open()
+                if time.monotonic() - conn.last_used < self.check_after or self._ping(conn):
+                    self._count(reaproveitadas=1)
+                    return conn
+                self._discard(conn)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, conn: PooledConnection, broken: bool = False):
+        """Devolve a conexão ao pool (broken=True descarta)"""
+        try:
+            if not broken and getattr(conn.raw, 'in_transaction', False):
+                # Transação aberta por leitura: encerra para a próxima ver dados atuais
+                try:
+                    conn.raw.rollback()
+                    self._count(round_trips=1)
+                except Exception:
+                    broken = True
+
+            if broken or self._stop.is_set():
+                self._discard(conn)
+                return
+
+            conn.last_used = time.monotonic()
+            with self._lock:
+                self._idle.append(conn)
+                self._start_reaper()
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self) -> Iterator[PooledConnection]:
+        """Conexão do pool; erro de conexão descarta a conexão"""
+        conn = self.acquire()
+        try:
+            yield conn
+        except CONNECTION_ERRORS:
+            self.release(conn, broken=True)
+            raise
+        except BaseException:
+            # Erro de SQL (ex: chave duplicada): a conexão continua boa
+            self.release(conn)
+            raise
+        else:
+            self.release(conn)
+
+    def close(self):
+        """Fecha as conexões ociosas e para a limpeza"""
+        self._stop.set()
+        with self._lock:
+            idle = self._idle
+            self._idle = []
+        for conn in idle:
+            self._discard(conn)
+
+    @property
+    def idle_count(self) -> int:
+        with self._lock:
+            return len(self._idle)
+
+    def _start_reaper(self):
+        # Chamado com self._lock
+        if self._reaper is not None:
+            return
+        self._reaper = threading.Thread(target=self._reaper_loop, daemon=True)
+        self._reaper.start()
+
+    def _reaper_loop(self):
+        while not self._stop.wait(max(self.idle_timeout / 4, 1.0)):
+            now = time.monotonic()
+            with self._lock:
+                expired = [c for c in self._idle if now - c.last_used > self.idle_timeout]
+                self._idle = [c for c in self._idle if c not in expired]
+                done = not self._idle
+                if done:
+                    # Sem conexões ociosas a thread termina (recomeça no próximo release)
+                    self._reaper = None
+            for conn in expired:
+                self._discard(conn)
+            if done:
+                return
+
+    def _ping(self, conn: PooledConnection) -> bool:
+        try:
+            conn.raw.ping(reconnect=False)
+            self._count(round_trips=1)
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, conn: PooledConnection):
+        self._count(descartadas=1)
+        conn.close()
+
+
+class MySQLPoolError(Exception):
+    """Erro do pool de conexões MySQL"""
+    pass
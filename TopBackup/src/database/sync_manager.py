@@ -3,6 +3,9 @@ TopBackup - Gerenciador de Sincronização
 Sincroniza dados entre Firebird local e MySQL na nuvem
 """
 
+import hashlib
+import json
+import os
 from typing import Optional, Tuple
 from datetime import datetime
 
@@ -10,9 +13,13 @@ from .models import Empresa, AgendaBackup
 from .firebird_client import FirebirdClient
 from .mysql_client import MySQLClient
 from ..config.settings import Settings
+from ..utils.file_utils import FileUtils
 from ..utils.logger import get_logger
 from ..version import VERSION
 
+# Último estado da empresa enviado ao MySQL
+EMPRESA_SYNC_FILE = "empresa_sync.json"
+
 
 class SyncManager:
     """Gerenciador de sincronização Firebird ↔ MySQL"""
@@ -26,6 +33,42 @@ class SyncManager:
         self._empresa_local: Optional[Empresa] = None
         self._empresa_cloud: Optional[Empresa] = None
         self._agenda: Optional[AgendaBackup] = None
+        self._state_path = FileUtils.get_data_directory() / EMPRESA_SYNC_FILE
+
+    # ============ ESTADO ENVIADO ============
+
+    def _fingerprint(self, empresa: Empresa) -> str:
+        """Resumo dos dados enviados (DATA_ULTIMA_INTERACAO fica de fora)"""
+        dados = [
+            self.settings.mysql.host, self.settings.mysql.database,
+            empresa.id_aux, empresa.fantasia, empresa.razao, empresa.cnpj,
+            empresa.versao_local, empresa.ativo
+        ]
+        return hashlib.sha256(json.dumps(dados, default=str).encode('utf-8')).hexdigest()
+
+    def _load_state(self) -> dict:
+        try:
+            with open(self._state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self, fingerprint: str, id_empresa: int):
+        try:
+            os.makedirs(os.path.dirname(self._state_path), exist_ok=True)
+            temp_path = f"{self._state_path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'fingerprint': fingerprint,
+                    'id': id_empresa,
+                    'sincronizado_em': datetime.now().isoformat(timespec='seconds')
+                }, f, indent=2)
+            os.replace(temp_path, self._state_path)
+        except OSError as e:
+            # Sem o arquivo, a próxima sincronização só envia de novo
+            self.logger.warning(f"Erro ao gravar estado da sincronização: {e}")
+
+    # ============ SINCRONIZAÇÃO ============
 
     def sync_empresa(self) -> Tuple[bool, str, Optional[int]]:
         """
@@ -47,20 +90,31 @@ class SyncManager:
             # Usa versão do TopBackup
             self._empresa_local.versao_local = VERSION
 
-            # Atualiza data de interação
-            self._empresa_local.data_ultima_interacao = datetime.now()
+            # Nada mudou desde o último envio: não vai ao MySQL
+            # (a interação da empresa é registrada pelo diário)
+            fingerprint = self._fingerprint(self._empresa_local)
+            estado = self._load_state()
+            if (estado.get('fingerprint') == fingerprint
+                    and estado.get('id')
+                    and estado['id'] == self.settings.app.empresa_id
+                    and self.settings.app.empresa_cnpj == self._empresa_local.cnpj):
+                self.logger.debug(f"Empresa sem alterações (ID: {estado['id']})")
+                return True, "Empresa sem alterações", estado['id']
 
-            # Sincroniza com MySQL (insert ou update)
-            id_empresa = self.mysql.sync_empresa(self._empresa_local)
+            # Insert ou update num único comando, que já retorna o ID
+            id_empresa = self.mysql.upsert_empresa(self._empresa_local)
 
             if id_empresa:
-                # Atualiza empresa cloud
-                self._empresa_cloud = self.mysql.get_empresa_by_cnpj(self._empresa_local.cnpj)
+                # Empresa cloud é recarregada sob demanda (get_empresa_cloud)
+                self._empresa_cloud = None
+                self._save_state(fingerprint, id_empresa)
 
-                # Salva ID na configuração
-                self.settings.app.empresa_id = id_empresa
-                self.settings.app.empresa_cnpj = self._empresa_local.cnpj
-                self.settings.save()
+                # Salva ID na configuração (só se mudou)
+                if (self.settings.app.empresa_id != id_empresa
+                        or self.settings.app.empresa_cnpj != self._empresa_local.cnpj):
+                    self.settings.app.empresa_id = id_empresa
+                    self.settings.app.empresa_cnpj = self._empresa_local.cnpj
+                    self.settings.save()
 
                 self.logger.info(f"Empresa sincronizada: {self._empresa_local.fantasia} (ID: {id_empresa})")
                 return True, "Empresa sincronizada com sucesso", id_empresa
@@ -85,6 +139,8 @@ class SyncManager:
             if not self._agenda:
                 return False, "Agenda de backup não encontrada no Firebird"
 
+            antes = self._agenda_values()
+
             # Sincroniza configurações - config local tem prioridade sobre Firebird
             self.logger.info(f"Valores do Firebird:")
             self.logger.info(f"  Destino 1 FB: {self._agenda.local_destino1}")
@@ -114,7 +170,9 @@ class SyncManager:
             self.settings.backup.backup_remoto = self._agenda.backup_remoto == 'S'
             self.settings.backup.prefixo_backup = self._agenda.prefixo_backup
 
-            self.settings.save()
+            # Só grava o config.json se algo mudou
+            if self._agenda_values() != antes:
+                self.settings.save()
 
             self.logger.info(f"Agenda sincronizada: {self._agenda.horario}")
             return True, "Agenda sincronizada com sucesso"
@@ -123,6 +181,11 @@ class SyncManager:
             self.logger.error(f"Erro ao sincronizar agenda: {e}", exc_info=True)
             return False, str(e)
 
+    def _agenda_values(self) -> tuple:
+        backup = self.settings.backup
+        return (backup.local_destino1, backup.local_destino2,
+                backup.backup_remoto, backup.prefixo_backup)
+
     def full_sync(self) -> Tuple[bool, str]:
         """
         Executa sincronização completa
@@ -0,0 +1,311 @@
+"""
+TopBackup - Diário de Gravações MySQL
+Gravações no MySQL passam por um diário local (SQLite) e são enviadas em lotes
+"""
+
+import json
+import sqlite3
+import threading
+import uuid
+from contextlib import closing
+from dataclasses import asdict, fields
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from mysql.connector.errors import DataError, IntegrityError
+
+from .models import LogBackup
+from .mysql_client import MySQLClient
+from ..utils.logger import get_logger
+
+# Tipos de registro do diário
+JOURNAL_LOG_INSERT = "log_insert"
+JOURNAL_LOG_UPDATE = "log_update"
+JOURNAL_LOG_FTP = "log_ftp"
+JOURNAL_INTERACAO = "interacao"
+
+# Registros enviados por lote
+JOURNAL_BATCH_SIZE = 200
+# Espera entre tentativas com o MySQL fora: 15s, 30s, 60s... até 10 min
+JOURNAL_BACKOFF_BASE = 15
+JOURNAL_BACKOFF_MAX = 600
+# Registros já enviados mantidos no arquivo
+JOURNAL_HISTORY_DAYS = 7
+
+_LOG_DATES = ('data_inicio', 'data_fim', 'data_envio_ftp')
+_LOG_FIELDS = {f.name for f in fields(LogBackup)}
+
+# Registro que o MySQL nunca vai aceitar (ou corrompido no diário): é descartado.
+# Qualquer outro erro (link fora, pool esgotado, schema) mantém o lote para depois
+_DATA_ERRORS = (DataError, IntegrityError, ValueError, KeyError, TypeError)
+
+
+def _dump_log(log: LogBackup) -> str:
+    data = asdict(log)
+    for campo in _LOG_DATES:
+        if data[campo]:
+            data[campo] = data[campo].isoformat()
+    return json.dumps(data)
+
+
+def _load_log(dados: str) -> LogBackup:
+    data = {k: v for k, v in json.loads(dados).items() if k in _LOG_FIELDS}
+    for campo in _LOG_DATES:
+        if data.get(campo):
+            data[campo] = datetime.fromisoformat(data[campo])
+    return LogBackup(**data)
+
+
+class WriteJournal:
+    """
+    Diário local das gravações no MySQL (LOG_BACKUPS e interação da empresa)
+
+    Cada gravação é anexada a um SQLite no diretório de dados e volta na
+    hora: o backup não espera o MySQL na nuvem (nem o timeout de conexão
+    quando o link caiu). Uma thread envia os registros em ordem, em lotes
+    numa transação só (INSERT com várias linhas, executemany nos UPDATEs);
+    com o MySQL fora, tenta de novo com backoff e o dashboard se atualiza
+    quando o link volta.
+
+    Os logs são identificados pela CHAVE_LOCAL (gerada aqui), então
+    reenviar um lote não duplica nada. O ID do servidor de cada log fica
+    mapeado em LOG_IDS depois do envio (server_id()).
+
+    Usage:
+        journal = WriteJournal(path, mysql)
+        journal.start()
+        journal.insert_log_backup(log)
+        journal.update_log_backup(log)
+    """
+
+    def __init__(self, path: Path, mysql: MySQLClient):
+        self.path = path
+        self.mysql = mysql
+        self.logger = get_logger()
+
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+        self._falhas = 0  # Lotes seguidos sem conseguir falar com o MySQL
+        self._dirty = True  # Há registro novo desde a última leitura
+        self._piggyback: Optional[Callable[[], Optional[int]]] = None
+
+        self._init_db()
+
+    # ============ PERSISTÊNCIA ============
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(str(self.path), timeout=30)
+
+    def _init_db(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS JOURNAL (
+                    ID INTEGER PRIMARY KEY AUTOINCREMENT,
+                    TIPO TEXT NOT NULL,
+                    CHAVE TEXT NOT NULL,
+                    DADOS TEXT NOT NULL,
+                    CRIADO_EM TEXT NOT NULL,
+                    ENVIADO_EM TEXT,
+                    MENSAGEM TEXT
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS IDX_JOURNAL_ENVIADO ON JOURNAL (ENVIADO_EM, ID)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS LOG_IDS (
+                    CHAVE TEXT PRIMARY KEY,
+                    SERVER_ID INTEGER NOT NULL
+                )
+            """)
+            limite = (datetime.now() - timedelta(days=JOURNAL_HISTORY_DAYS)).isoformat()
+            conn.execute("DELETE FROM JOURNAL WHERE ENVIADO_EM IS NOT NULL AND ENVIADO_EM < ?", (limite,))
+
+    def _append(self, tipo: str, chave: str, dados: str):
+        agora = datetime.now().isoformat()
+        rows = [(tipo, chave, dados, agora)]
+        if tipo != JOURNAL_INTERACAO and self._piggyback:
+            # Interação da empresa entra junto (mesmo lote, sem round-trip próprio)
+            id_empresa = self._piggyback()
+            if id_empresa:
+                rows.append((JOURNAL_INTERACAO, str(id_empresa), json.dumps({'data': agora}), agora))
+
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "INSERT INTO JOURNAL (TIPO, CHAVE, DADOS, CRIADO_EM) VALUES (?, ?, ?, ?)", rows
+            )
+        with self._condition:
+            self._dirty = True
+            self._condition.notify_all()
+
+    # ============ API ============
+
+    def insert_log_backup(self, log: LogBackup) -> str:
+        """
+        Registra um novo log de backup
+
+        Returns:
+            CHAVE_LOCAL do log (também gravada em log.chave_local)
+        """
+        log.chave_local = log.chave_local or uuid.uuid4().hex
+        self._append(JOURNAL_LOG_INSERT, log.chave_local, _dump_log(log))
+        return log.chave_local
+
+    def update_log_backup(self, log: LogBackup):
+        """Registra a atualização de um log (resultado do backup)"""
+        if not log.chave_local:
+            return
+        self._append(JOURNAL_LOG_UPDATE, log.chave_local, _dump_log(log))
+        if not log.id:
+            log.id = self.server_id(log.chave_local)
+
+    def update_log_ftp(self, chave_local: str, data_envio: datetime):
+        """Registra o envio do backup ao FTP"""
+        self._append(JOURNAL_LOG_FTP, chave_local, json.dumps({'data_envio': data_envio.isoformat()}))
+
+    def update_empresa_interacao(self, id_empresa: int):
+        """Registra a interação da empresa (a data é a do registro, não a do envio)"""
+        self._append(
+            JOURNAL_INTERACAO, str(id_empresa), json.dumps({'data': datetime.now().isoformat()})
+        )
+
+    def set_piggyback(self, callback: Callable[[], Optional[int]]):
+        """
+        Define quem decide se a interação da empresa vai junto das outras gravações
+
+        O callback retorna o ID da empresa (ou None) e é chamado a cada log
+        ou envio FTP registrado (ver core.heartbeat).
+        """
+        self._piggyback = callback
+
+    def server_id(self, chave_local: str) -> Optional[int]:
+        """ID em LOG_BACKUPS de um log já enviado"""
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT SERVER_ID FROM LOG_IDS WHERE CHAVE = ?", (chave_local,)).fetchone()
+        return row[0] if row else None
+
+    def pending_count(self) -> int:
+        """Registros ainda não enviados ao MySQL"""
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT COUNT(*) FROM JOURNAL WHERE ENVIADO_EM IS NULL").fetchone()[0]
+
+    def start(self):
+        """Inicia o envio em segundo plano (inclui registros de antes do reinício)"""
+        self._thread = threading.Thread(target=self._loop, name="mysql-journal", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Para o envio (pendentes continuam gravados)"""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+
+    # ============ ENVIO ============
+
+    def _loop(self):
+        espera = 0.0
+        while True:
+            with self._condition:
+                if not self._stopped and not self._dirty:
+                    # Acorda com novo registro, no fim do backoff ou a cada minuto
+                    self._condition.wait(timeout=espera)
+                if self._stopped:
+                    return
+                self._dirty = False
+
+            try:
+                rows = self._pending()
+            except sqlite3.Error as e:
+                self.logger.error(f"Erro no diário MySQL: {e}")
+                espera = JOURNAL_BACKOFF_MAX
+                continue
+
+            if not rows:
+                espera = 60.0
+            elif self._flush(rows):
+                espera = 0.0
+            else:
+                espera = self._backoff()
+
+    def _backoff(self) -> float:
+        self._falhas += 1
+        return min(JOURNAL_BACKOFF_BASE * 2 ** (self._falhas - 1), JOURNAL_BACKOFF_MAX)
+
+    def _pending(self) -> List[Tuple[int, str, str, str]]:
+        with closing(self._connect()) as conn:
+            return conn.execute(
+                "SELECT ID, TIPO, CHAVE, DADOS FROM JOURNAL WHERE ENVIADO_EM IS NULL ORDER BY ID LIMIT ?",
+                (JOURNAL_BATCH_SIZE,)
+            ).fetchall()
+
+    def _flush(self, rows: List[Tuple[int, str, str, str]]) -> bool:
+        """
+        Envia um lote
+
+        Returns:
+            False se o MySQL está fora (o lote fica para a próxima tentativa)
+        """
+        try:
+            ids = self._send(rows)
+        except _DATA_ERRORS as e:
+            if len(rows) == 1:
+                # Erro de dados: o registro nunca vai entrar, não pode travar o diário
+                self.logger.error(f"Registro {rows[0][1]} descartado do diário MySQL: {e}")
+                self._mark_sent(rows, {}, mensagem=str(e))
+                return True
+            # Um registro ruim no lote: envia um a um para isolar
+            for row in rows:
+                if not self._flush([row]):
+                    return False
+            return True
+        except Exception as e:
+            if self._falhas == 0:
+                self.logger.warning(
+                    f"MySQL indisponível, {len(rows)} gravações ficam no diário local: {e}"
+                )
+            return False
+
+        self._mark_sent(rows, ids)
+        if self._falhas:
+            self.logger.info("MySQL disponível novamente, diário local enviado")
+            self._falhas = 0
+        return True
+
+    def _send(self, rows: List[Tuple[int, str, str, str]]) -> Dict[str, int]:
+        inserts: Dict[str, LogBackup] = {}
+        updates: Dict[str, LogBackup] = {}
+        envios_ftp: Dict[str, datetime] = {}
+        interacoes: Dict[int, datetime] = {}
+
+        for _, tipo, chave, dados in rows:
+            if tipo == JOURNAL_LOG_INSERT:
+                inserts[chave] = _load_log(dados)
+            elif tipo == JOURNAL_LOG_UPDATE:
+                # Só o último estado do log importa
+                updates[chave] = _load_log(dados)
+            elif tipo == JOURNAL_LOG_FTP:
+                envios_ftp[chave] = datetime.fromisoformat(json.loads(dados)['data_envio'])
+            elif tipo == JOURNAL_INTERACAO:
+                data = datetime.fromisoformat(json.loads(dados)['data'])
+                id_empresa = int(chave)
+                interacoes[id_empresa] = max(data, interacoes.get(id_empresa, data))
+
+        return self.mysql.write_journal_batch(
+            list(inserts.values()),
+            list(updates.values()),
+            list(envios_ftp.items()),
+            list(interacoes.items())
+        )
+
+    def _mark_sent(self, rows: List[Tuple[int, str, str, str]], ids: Dict[str, int], mensagem: Optional[str] = None):
+        agora = datetime.now().isoformat()
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "UPDATE JOURNAL SET ENVIADO_EM = ?, MENSAGEM = ? WHERE ID = ?",
+                [(agora, mensagem, row[0]) for row in rows]
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO LOG_IDS (CHAVE, SERVER_ID) VALUES (?, ?)",
+                list(ids.items())
+            )
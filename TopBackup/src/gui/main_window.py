@@ -47,6 +47,7 @@ class MainWindow(ctk.CTk):
         # Configura callbacks do controller
         self.controller.set_state_callback(self._on_state_change)
         self.controller.set_backup_progress_callback(self._on_backup_progress)
+        self.controller.set_progress_event_callback(self._on_progress_event)
         self.controller.set_notification_callback(self._on_notification)
 
         # Cria interface
@@ -428,6 +429,10 @@ class MainWindow(ctk.CTk):
             # Mensagem vazia indica fim do backup - esconde a barra
             self.after(0, self._hide_progress)
 
+    def _on_progress_event(self, event):
+        """Callback de progresso com bytes/ETA (barra determinada quando há estimativa)"""
+        self.after(0, lambda: self._show_progress_event(event))
+
     def _on_notification(self, title: str, message: str):
         """Callback de notificação"""
         # Notifica via tray se minimizado
@@ -444,6 +449,16 @@ class MainWindow(ctk.CTk):
         self.progress_bar.configure(mode="indeterminate")
         self.progress_bar.start()
 
+    def _show_progress_event(self, event):
+        """Atualiza barra e texto com o evento de progresso"""
+        if not self.progress_bar.winfo_ismapped():
+            return
+        self.progress_label.configure(text=event.descricao())
+        if event.percentual is not None:
+            self.progress_bar.stop()
+            self.progress_bar.configure(mode="determinate")
+            self.progress_bar.set(event.percentual / 100)
+
     def _hide_progress(self):
         """Esconde barra de progresso"""
         self.progress_bar.stop()
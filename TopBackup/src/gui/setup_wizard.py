@@ -486,6 +486,7 @@ class SetupWizard(ctk.CTkToplevel):
 
         client = MySQLClient(config)
         success, msg = client.test_connection()
+        client.close()
 
         if success:
             self.mysql_status_label.configure(text="Conexão OK!", text_color="green")
@@ -251,6 +251,52 @@ def run_backup_now():
     controller.stop()
 
 
+def export_manifest(manifest_path: str, output_path: str):
+    """Reconstrói um .fbk a partir de um manifesto do repositório dedup"""
+    from src.core.dedup_store import DedupRepository, DedupError
+
+    manifest_path = os.path.abspath(manifest_path)
+    repo = DedupRepository.from_manifest(manifest_path)
+
+    try:
+        with open(output_path, 'wb') as output:
+            written = repo.export(manifest_path, output)
+    except (DedupError, OSError) as e:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        print(f"Falha na exportação: {e}")
+        sys.exit(1)
+
+    print(f"Backup exportado: {output_path} ({written} bytes)")
+
+
+def restore_backup(backup_path: str, database_path: str):
+    """
+    Restaura um backup para um banco novo
+
+    Aceita um manifesto do repositório dedup (.json) ou um arquivo
+    da cadeia incremental (.nbk).
+    """
+    from src.config.settings import Settings
+    from src.config.constants import NBACKUP_EXTENSION
+    from src.core.backup_engine import BackupEngine
+    from src.core.nbackup_engine import NBackupEngine
+
+    settings = Settings.load()
+    backup_path = os.path.abspath(backup_path)
+
+    if backup_path.lower().endswith(NBACKUP_EXTENSION):
+        success, msg = NBackupEngine(settings).restore(backup_path, database_path)
+    else:
+        success, msg = BackupEngine(settings).restore_from_repository(backup_path, database_path)
+
+    if not success:
+        print(f"Falha na restauração: {msg}")
+        sys.exit(1)
+
+    print(f"{msg}: {database_path}")
+
+
 def ensure_installation():
     """
     Verifica se o app está instalado em C:\TOPBACKUP.
@@ -294,6 +340,11 @@ Exemplos:
   topbackup --stop             Para o serviço Windows
   topbackup --status           Exibe status do serviço
   topbackup --backup           Executa backup imediatamente
+  topbackup --export MANIFESTO --output ARQUIVO.fbk
+                               Exporta backup do repositório dedup para .fbk
+  topbackup --restore MANIFESTO|ARQUIVO.nbk --database BANCO.fdb
+                               Restaura backup do repositório dedup ou da
+                               cadeia incremental (nbackup)
         """
     )
 
@@ -332,6 +383,26 @@ Exemplos:
         action='store_true',
         help='Executa backup imediatamente (sem GUI)'
     )
+    parser.add_argument(
+        '--export',
+        metavar='MANIFESTO',
+        help='Exporta um manifesto do repositório dedup para .fbk'
+    )
+    parser.add_argument(
+        '--restore',
+        metavar='BACKUP',
+        help='Restaura um manifesto dedup (gbak) ou um arquivo .nbk da cadeia incremental'
+    )
+    parser.add_argument(
+        '--output',
+        metavar='ARQUIVO',
+        help='Arquivo .fbk gerado pelo --export'
+    )
+    parser.add_argument(
+        '--database',
+        metavar='BANCO',
+        help='Banco criado pelo --restore'
+    )
     parser.add_argument(
         '--version',
         action='store_true',
@@ -359,6 +430,14 @@ Exemplos:
         service_status()
     elif args.backup:
         run_backup_now()
+    elif args.export:
+        if not args.output:
+            parser.error("--export requer --output")
+        export_manifest(args.export, args.output)
+    elif args.restore:
+        if not args.database:
+            parser.error("--restore requer --database")
+        restore_backup(args.restore, args.database)
     else:
         run_gui()
 
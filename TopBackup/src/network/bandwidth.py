@@ -0,0 +1,188 @@
+"""
+TopBackup - Limite de Banda
+Token bucket compartilhado pelas transferências de rede, com limites por horário
+"""
+
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, List, Optional
+
+from ..utils.logger import get_logger
+
+# kbit/s → bytes/s
+KBPS_BYTES = 1000 / 8
+# Crédito acumulado com a rede parada (rajada no início de uma transferência)
+BURST_SECONDS = 1.0
+# Espera máxima antes de reavaliar o limite (mudança de janela ou de configuração)
+RATE_CHECK_INTERVAL = 1.0
+
+
+@dataclass
+class BandwidthWindow:
+    """Janela de horário com limite próprio (pode virar a meia-noite)"""
+    inicio: int  # Minutos desde a meia-noite
+    fim: int
+    kbps: int    # 0 = sem limite
+
+    def contains(self, minuto: int) -> bool:
+        if self.inicio <= self.fim:
+            return self.inicio <= minuto < self.fim
+        return minuto >= self.inicio or minuto < self.fim
+
+
+def _parse_time(value: str) -> int:
+    horas, minutos = value.strip().split(':')
+    horas, minutos = int(horas), int(minutos)
+    if not (0 <= horas <= 24 and 0 <= minutos < 60) or horas * 60 + minutos > 24 * 60:
+        raise ValueError(value)
+    return horas * 60 + minutos
+
+
+def parse_windows(janelas: List[dict]) -> List[BandwidthWindow]:
+    """
+    Converte as janelas do config.json
+
+    Formato: {"inicio": "22:00", "fim": "06:00", "kbps": 0}
+
+    Raises:
+        ValueError: Janela com horário ou limite inválido
+    """
+    windows = []
+    for janela in janelas or []:
+        try:
+            window = BandwidthWindow(
+                inicio=_parse_time(janela['inicio']),
+                fim=_parse_time(janela['fim']),
+                kbps=int(janela.get('kbps', 0))
+            )
+        except (KeyError, TypeError, ValueError, AttributeError):
+            raise ValueError(f"Janela de banda inválida: {janela}")
+        if window.kbps < 0:
+            raise ValueError(f"Janela de banda inválida: {janela}")
+        windows.append(window)
+    return windows
+
+
+class BandwidthLimiter:
+    """
+    Limite de banda (token bucket) para todas as transferências de rede
+
+    Upload FTP (inclusive as conexões paralelas), cópia para o destino 2
+    em rede e download de atualizações chamam consume() com os bytes de
+    cada bloco, e o total fica dentro do limite. Os pedidos são atendidos
+    em ordem de chegada.
+
+    O limite vem da primeira janela de horário que contém a hora atual
+    (ou do limite padrão) e é reavaliado durante a espera, então a troca
+    de janela (ex: 22:00 libera a banda) e o configure() valem na hora
+    para transferências em andamento.
+
+    Usage:
+        limiter = get_bandwidth_limiter()
+        limiter.configure(2000, parse_windows(janelas))
+        limiter.consume(len(data))
+    """
+
+    def __init__(
+        self,
+        default_kbps: int = 0,
+        windows: Optional[List[BandwidthWindow]] = None,
+        clock: Callable[[], float] = time.monotonic,
+        now: Callable[[], datetime] = datetime.now
+    ):
+        self.logger = get_logger()
+        self._clock = clock
+        self._now = now
+        self._condition = threading.Condition()
+        self._default_kbps = max(default_kbps, 0)
+        self._windows = list(windows or [])
+        self._reserved = 0.0   # Bytes pedidos desde o início
+        self._issued = 0.0     # Bytes liberados (pode passar do pedido até a rajada)
+        self._last = clock()
+        self._kbps = self.current_kbps()
+
+    def configure(self, default_kbps: int, windows: Optional[List[BandwidthWindow]] = None):
+        """Troca os limites (vale também para quem está esperando)"""
+        with self._condition:
+            self._refill()
+            self._default_kbps = max(default_kbps, 0)
+            self._windows = list(windows or [])
+            self._condition.notify_all()
+
+    def current_kbps(self) -> int:
+        """Limite em vigor agora (0 = sem limite)"""
+        agora = self._now()
+        minuto = agora.hour * 60 + agora.minute
+        for window in self._windows:
+            if window.contains(minuto):
+                return window.kbps
+        return self._default_kbps
+
+    @property
+    def enabled(self) -> bool:
+        """Indica se há limite configurado (em algum horário)"""
+        return bool(self._default_kbps or any(w.kbps for w in self._windows))
+
+    def consume(self, nbytes: int):
+        """Bloqueia até os bytes caberem no limite"""
+        if nbytes <= 0:
+            return
+        with self._condition:
+            self._refill()
+            self._reserved += nbytes
+            ticket = self._reserved
+            while self._issued < ticket:
+                rate = self._kbps * KBPS_BYTES
+                self._condition.wait(min((ticket - self._issued) / rate, RATE_CHECK_INTERVAL))
+                self._refill()
+
+    def _refill(self):
+        """Libera os bytes do tempo decorrido no limite atual (com self._condition)"""
+        now = self._clock()
+        kbps = self.current_kbps()
+        if kbps != self._kbps:
+            self.logger.debug(
+                f"Limite de banda: {f'{kbps} kbit/s' if kbps else 'sem limite'}"
+            )
+            self._kbps = kbps
+
+        if not kbps:
+            self._issued = self._reserved
+        else:
+            rate = kbps * KBPS_BYTES
+            self._issued = min(
+                self._issued + (now - self._last) * rate,
+                self._reserved + rate * BURST_SECONDS
+            )
+        self._last = now
+
+
+_limiter: Optional[BandwidthLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_bandwidth_limiter() -> BandwidthLimiter:
+    """Retorna o limitador compartilhado pelas transferências"""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = BandwidthLimiter()
+        return _limiter
+
+
+def configure_bandwidth(default_kbps: int, janelas: List[dict]) -> bool:
+    """
+    Aplica os limites do config.json ao limitador compartilhado
+
+    Returns:
+        False se alguma janela é inválida (limites anteriores mantidos)
+    """
+    try:
+        windows = parse_windows(janelas)
+    except ValueError as e:
+        get_logger().error(str(e))
+        return False
+    get_bandwidth_limiter().configure(default_kbps, windows)
+    return True
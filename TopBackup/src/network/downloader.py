@@ -12,6 +12,7 @@ import requests
 
 from ..config.constants import UPDATE_DIR_NAME
 from ..utils.logger import get_logger
+from .bandwidth import get_bandwidth_limiter
 
 
 class Downloader:
@@ -19,6 +20,7 @@ class Downloader:
 
     def __init__(self):
         self.logger = get_logger()
+        self._limiter = get_bandwidth_limiter()
         self._progress_callback: Optional[Callable[[int, int], None]] = None
         self._cancel_requested = False
 
@@ -95,6 +97,7 @@ class Downloader:
                         return False, "Download cancelado"
 
                     if chunk:
+                        self._limiter.consume(len(chunk))
                         f.write(chunk)
                         bytes_downloaded += len(chunk)
 
@@ -6,23 +6,41 @@ Upload de backups para servidor FTP
 import os
 import ftplib
 from pathlib import Path
-from typing import Optional, Tuple, Callable
+from typing import List, Optional, Tuple, Callable
 from datetime import datetime
 
 from ..config.settings import FTPConfig
-from ..config.constants import FTP_TIMEOUT, FTP_CHUNK_SIZE
+from ..config.constants import FTP_CHUNK_SIZE, FTP_CHECKPOINT_BYTES, FTP_UPLOAD_ATTEMPTS
 from ..utils.logger import get_logger
+from ..utils.file_utils import FileUtils
 from ..utils.resilience import retry
+from .bandwidth import get_bandwidth_limiter
+from .ftp_pool import FTPSessionPool, SESSION_ERRORS
+from .upload_checkpoint import UploadCheckpoint, UploadCheckpointStore
+from .segmented_upload import (
+    SegmentedUpload, segment_size_for, read_manifest, remove_segmented, MANIFEST_SUFFIX
+)
 
 
 class FTPClient:
-    """Cliente para upload FTP de backups"""
+    """
+    Cliente para upload FTP de backups
 
-    def __init__(self, config: FTPConfig):
+    As operações usam sessões do FTPSessionPool: login e CWD acontecem
+    uma vez e a mesma sessão atende uploads, listagens e remoções
+    seguidas (ex: retenção apagando dezenas de arquivos). Os envios
+    passam pelo limite de banda compartilhado (ver BandwidthLimiter).
+    """
+
+    def __init__(self, config: FTPConfig, checkpoints: Optional[UploadCheckpointStore] = None):
         self.config = config
         self.logger = get_logger()
-        self._ftp: Optional[ftplib.FTP] = None
+        self._pool = FTPSessionPool(config, max_idle=max(config.conexoes_paralelas, 1))
+        self._limiter = get_bandwidth_limiter()
         self._progress_callback: Optional[Callable[[int, int], None]] = None
+        self._checkpoints = checkpoints or UploadCheckpointStore(
+            FileUtils.get_data_directory() / "ftp_uploads.json"
+        )
 
     def set_progress_callback(self, callback: Callable[[int, int], None]):
         """
@@ -35,29 +53,14 @@ class FTPClient:
 
     def connect(self) -> Tuple[bool, str]:
         """
-        Conecta ao servidor FTP
+        Conecta ao servidor FTP (a sessão fica no pool para a próxima operação)
 
         Returns:
             Tuple[bool, str]: (sucesso, mensagem)
         """
         try:
-            self._ftp = ftplib.FTP()
-            self._ftp.connect(
-                self.config.host,
-                self.config.port,
-                timeout=FTP_TIMEOUT
-            )
-            self._ftp.login(self.config.user, self.config.password)
-
-            if self.config.passive_mode:
-                self._ftp.set_pasv(True)
-
-            # Navega para diretório remoto
-            if self.config.remote_path:
-                self._ensure_remote_directory(self.config.remote_path)
-                self._ftp.cwd(self.config.remote_path)
-
-            self.logger.debug(f"Conectado ao FTP: {self.config.host}")
+            with self._pool.session():
+                pass
             return True, "Conexão estabelecida"
 
         except ftplib.error_perm as e:
@@ -69,46 +72,32 @@ class FTPClient:
             return False, str(e)
 
     def disconnect(self):
-        """Desconecta do servidor FTP"""
-        if self._ftp:
-            try:
-                self._ftp.quit()
-            except Exception:
-                pass
-            self._ftp = None
-
-    def _ensure_remote_directory(self, path: str):
-        """Garante que o diretório remoto existe"""
-        if not self._ftp:
-            return
-
-        parts = path.strip('/').split('/')
-        current = ""
-
-        for part in parts:
-            if not part:
-                continue
-            current = f"{current}/{part}"
-            try:
-                self._ftp.cwd(current)
-            except ftplib.error_perm:
-                try:
-                    self._ftp.mkd(current)
-                    self._ftp.cwd(current)
-                except ftplib.error_perm:
-                    pass
-
-        # Volta para raiz
-        self._ftp.cwd("/")
-
-    @retry(max_attempts=3, delay=5.0, exceptions=(ftplib.error_temp, ConnectionError))
-    def upload(self, local_path: str, remote_filename: Optional[str] = None) -> Tuple[bool, str]:
+        """Fecha as sessões ociosas"""
+        self._pool.clear()
+
+    def close(self):
+        """Fecha as sessões e para o keep-alive (encerramento do app)"""
+        self._pool.close()
+
+    def upload(
+        self,
+        local_path: str,
+        remote_filename: Optional[str] = None,
+        sha256: Optional[str] = None
+    ) -> Tuple[bool, str]:
         """
         Faz upload de arquivo para FTP
 
+        Se a conexão cai, o envio continua de onde o servidor parou
+        (SIZE + REST) em vez de recomeçar do zero. O checkpoint em disco
+        permite retomar também depois de reiniciar o serviço. Arquivos a
+        partir de upload_paralelo_min_mb vão em partes por várias conexões
+        quando conexoes_paralelas > 1.
+
         Args:
             local_path: Caminho do arquivo local
             remote_filename: Nome do arquivo remoto (opcional)
+            sha256: Hash do arquivo, gravado no manifesto do upload segmentado
 
         Returns:
             Tuple[bool, str]: (sucesso, mensagem)
@@ -116,35 +105,20 @@ class FTPClient:
         if not os.path.exists(local_path):
             return False, f"Arquivo não encontrado: {local_path}"
 
-        # Conecta se necessário
-        if not self._ftp:
-            success, msg = self.connect()
-            if not success:
-                return False, msg
+        filename = remote_filename or os.path.basename(local_path)
+        self.logger.ftp_start(filename)
 
         try:
-            filename = remote_filename or os.path.basename(local_path)
-            file_size = os.path.getsize(local_path)
-            bytes_sent = 0
-
-            self.logger.ftp_start(filename)
-
-            # Callback para progresso
-            def progress_callback(data):
-                nonlocal bytes_sent
-                bytes_sent += len(data)
-                if self._progress_callback:
-                    self._progress_callback(bytes_sent, file_size)
-
-            # Upload com progresso
-            with open(local_path, 'rb') as f:
-                self._ftp.storbinary(
-                    f'STOR {filename}',
-                    f,
-                    blocksize=FTP_CHUNK_SIZE,
-                    callback=progress_callback
-                )
-
+            if self._use_segmented(local_path):
+                message = self._upload_segmented(local_path, filename, sha256)
+                self.logger.info(f"[FTP] {filename}: {message}")
+            else:
+                self._upload_resumable(local_path, filename)
+                # Envio segmentado anterior do mesmo nome ficaria como versão "completa"
+                with self._pool.session() as ftp:
+                    removed = remove_segmented(ftp, filename)
+                if removed:
+                    self.logger.info(f"[FTP] {filename}: {removed} partes de envio anterior removidas")
             self.logger.ftp_success(filename)
             return True, "Upload concluído"
 
@@ -156,40 +130,186 @@ class FTPClient:
             self.logger.ftp_error(local_path, str(e))
             return False, str(e)
 
-        finally:
-            self.disconnect()
+    def _use_segmented(self, local_path: str) -> bool:
+        """Upload em partes só compensa para arquivos grandes"""
+        if self.config.conexoes_paralelas <= 1:
+            return False
+        min_bytes = max(self.config.upload_paralelo_min_mb, 1) * 1024 * 1024
+        return os.path.getsize(local_path) >= min_bytes
+
+    def _upload_segmented(self, local_path: str, filename: str, sha256: Optional[str]) -> str:
+        """Envia em partes por conexões paralelas (ver SegmentedUpload)"""
+        stat = os.stat(local_path)
+        key = self._checkpoint_key(filename)
+        max_connections = self.config.conexoes_paralelas
+        segmento = segment_size_for(stat.st_size, max_connections)
+
+        # Partes no servidor só são aproveitadas se a divisão é a mesma
+        previous = self._checkpoints.get(key)
+        resume = bool(
+            previous and previous.matches(local_path, stat) and previous.segmento == segmento
+        )
+        self._checkpoints.put(key, UploadCheckpoint(
+            remoto=filename,
+            local=local_path,
+            tamanho=stat.st_size,
+            mtime=stat.st_mtime_ns,
+            segmento=segmento
+        ))
+
+        upload = SegmentedUpload(
+            self._pool, local_path, filename, max_connections,
+            resume=resume, sha256=sha256, progress=self._progress_callback,
+            throttle=self._limiter.consume
+        )
+        message = upload.run()
+        self._checkpoints.remove(key)
+        return message
+
+    def _checkpoint_key(self, filename: str) -> str:
+        remote_dir = (self.config.remote_path or "").rstrip('/')
+        return f"{self.config.host}:{self.config.port}{remote_dir}/{filename}"
+
+    @retry(
+        max_attempts=FTP_UPLOAD_ATTEMPTS, delay=5.0, max_delay=60.0,
+        exceptions=SESSION_ERRORS
+    )
+    def _upload_resumable(self, local_path: str, filename: str):
+        """Uma tentativa de envio, continuando do que já está no servidor"""
+        try:
+            with self._pool.session() as ftp:
+                self._send_resumable(ftp, local_path, filename)
+        except SESSION_ERRORS as e:
+            # Sessão descartada pelo pool: a próxima tentativa reconecta
+            self.logger.warning(f"[FTP] Conexão perdida no envio de {filename}: {e}")
+            raise
+
+    def _send_resumable(self, ftp: ftplib.FTP, local_path: str, filename: str):
+        stat = os.stat(local_path)
+        key = self._checkpoint_key(filename)
+        offset = self._resume_offset(ftp, key, local_path, filename, stat)
+
+        checkpoint = UploadCheckpoint(
+            remoto=filename,
+            local=local_path,
+            tamanho=stat.st_size,
+            mtime=stat.st_mtime_ns,
+            enviados=offset
+        )
+        if offset == stat.st_size:
+            # Caiu depois do último bloco: o servidor já tem o arquivo inteiro
+            self._checkpoints.remove(key)
+            return
+        self._checkpoints.put(key, checkpoint)
 
-    def list_files(self, path: Optional[str] = None) -> list:
-        """Lista arquivos no diretório remoto"""
-        if not self._ftp:
-            success, _ = self.connect()
-            if not success:
-                return []
+        if offset:
+            self.logger.info(
+                f"[FTP] Retomando {filename} a partir de {FileUtils.format_size(offset)}"
+            )
+            try:
+                self._store(ftp, local_path, filename, checkpoint, key)
+            except ftplib.error_perm as e:
+                # Servidor sem REST: só resta reenviar do início
+                self.logger.warning(f"[FTP] Servidor não aceitou retomar ({e}), reenviando do início")
+                checkpoint.enviados = 0
+                self._store(ftp, local_path, filename, checkpoint, key)
+        else:
+            self._store(ftp, local_path, filename, checkpoint, key)
+
+        remote_size = self._remote_size(ftp, filename)
+        if remote_size is not None and remote_size != stat.st_size:
+            # Arquivo remoto inconsistente: a próxima tentativa recomeça do zero
+            self._checkpoints.remove(key)
+            raise ftplib.error_temp(
+                f"451 Tamanho remoto ({remote_size}) diferente do local ({stat.st_size})"
+            )
+        self._checkpoints.remove(key)
+
+    def _store(
+        self,
+        ftp: ftplib.FTP,
+        local_path: str,
+        filename: str,
+        checkpoint: UploadCheckpoint,
+        key: str
+    ):
+        """STOR (ou REST + STOR) a partir de checkpoint.enviados"""
+        offset = checkpoint.enviados
+        sent = offset
+        last_saved = offset
+
+        def progress_callback(data):
+            nonlocal sent, last_saved
+            self._limiter.consume(len(data))
+            sent += len(data)
+            if sent - last_saved >= FTP_CHECKPOINT_BYTES:
+                checkpoint.enviados = sent
+                self._checkpoints.put(key, checkpoint)
+                last_saved = sent
+            if self._progress_callback:
+                self._progress_callback(sent, checkpoint.tamanho)
+
+        with open(local_path, 'rb') as f:
+            f.seek(offset)
+            ftp.storbinary(
+                f'STOR {filename}',
+                f,
+                blocksize=FTP_CHUNK_SIZE,
+                callback=progress_callback,
+                rest=offset or None
+            )
 
+    def _resume_offset(
+        self,
+        ftp: ftplib.FTP,
+        key: str,
+        local_path: str,
+        filename: str,
+        stat: os.stat_result
+    ) -> int:
+        """
+        Byte a partir do qual o envio continua
+
+        Só retoma com checkpoint do mesmo arquivo local: um arquivo remoto
+        com o mesmo nome sem checkpoint pode ser de outro backup.
+        """
+        checkpoint = self._checkpoints.get(key)
+        if not checkpoint or not checkpoint.matches(local_path, stat):
+            return 0
+        remote_size = self._remote_size(ftp, filename)
+        if remote_size is None or remote_size > stat.st_size:
+            # Sem SIZE não dá pra saber o que o servidor gravou
+            return 0
+        return remote_size
+
+    @staticmethod
+    def _remote_size(ftp: ftplib.FTP, filename: str) -> Optional[int]:
+        """Tamanho do arquivo no servidor (None se não existe ou sem SIZE)"""
         try:
-            if path:
-                self._ftp.cwd(path)
+            # SIZE em modo ASCII pode contar quebras de linha convertidas
+            ftp.voidcmd('TYPE I')
+            return ftp.size(filename)
+        except ftplib.error_perm:
+            return None
 
+    def list_files(self, path: Optional[str] = None) -> list:
+        """Lista arquivos no diretório remoto"""
+        try:
             files = []
-            self._ftp.retrlines('LIST', lambda x: files.append(x))
+            with self._pool.session() as ftp:
+                # LIST com caminho: a sessão continua no diretório remoto padrão
+                ftp.retrlines(f'LIST {path}' if path else 'LIST', files.append)
             return files
 
         except Exception as e:
             self.logger.error(f"Erro ao listar arquivos FTP: {e}")
             return []
 
-        finally:
-            self.disconnect()
-
     def delete_file(self, filename: str) -> Tuple[bool, str]:
         """Remove arquivo do servidor FTP"""
-        if not self._ftp:
-            success, msg = self.connect()
-            if not success:
-                return False, msg
-
         try:
-            self._ftp.delete(filename)
+            with self._pool.session() as ftp:
+                ftp.delete(filename)
             return True, "Arquivo removido"
 
         except ftplib.error_perm as e:
@@ -198,15 +318,53 @@ class FTPClient:
         except Exception as e:
             return False, str(e)
 
-        finally:
-            self.disconnect()
+    def delete_files(self, filenames: List[str]) -> Tuple[List[str], List[str]]:
+        """
+        Remove vários arquivos numa única sessão FTP
+
+        Returns:
+            Tuple[List[str], List[str]]: (removidos, erros)
+        """
+        deleted: List[str] = []
+        errors: List[str] = []
+        if not filenames:
+            return deleted, errors
+
+        try:
+            with self._pool.session() as ftp:
+                for filename in filenames:
+                    try:
+                        ftp.delete(filename)
+                        deleted.append(filename)
+                    except ftplib.error_perm as e:
+                        if not str(e).startswith('550'):
+                            errors.append(f"{filename}: {e}")
+                            continue
+                        # 550: upload segmentado (partes + manifesto) ou já
+                        # removido do servidor; nos dois casos conta como removido
+                        manifest = read_manifest(ftp, filename)
+                        if manifest:
+                            self._delete_segmented(ftp, filename, manifest, errors)
+                        deleted.append(filename)
+        except Exception as e:
+            errors.append(str(e))
+
+        return deleted, errors
+
+    @staticmethod
+    def _delete_segmented(ftp: ftplib.FTP, filename: str, manifest: dict, errors: List[str]):
+        """Remove as partes e por último o manifesto"""
+        for part in manifest.get('partes', []):
+            try:
+                ftp.delete(part['nome'])
+            except ftplib.error_perm as e:
+                if not str(e).startswith('550'):
+                    errors.append(f"{part['nome']}: {e}")
+        ftp.delete(f"{filename}{MANIFEST_SUFFIX}")
 
     def test_connection(self) -> Tuple[bool, str]:
         """Testa conexão com servidor FTP"""
         try:
-            success, msg = self.connect()
-            if success:
-                self.disconnect()
-            return success, msg
+            return self.connect()
         except Exception as e:
             return False, str(e)
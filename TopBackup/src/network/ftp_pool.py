@@ -0,0 +1,235 @@
+"""
+TopBackup - Pool de Sessões FTP
+Sessões reaproveitadas entre operações, com keep-alive e reconexão
+"""
+
+import ftplib
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional, Set, Tuple
+
+from ..config.settings import FTPConfig
+from ..config.constants import (
+    FTP_TIMEOUT, FTP_KEEPALIVE_INTERVAL, FTP_IDLE_TIMEOUT, FTP_CHECK_AFTER
+)
+from ..utils.logger import get_logger
+
+# Falhas que indicam sessão morta (descartada em vez de devolvida ao pool)
+SESSION_ERRORS = (ftplib.error_temp, ftplib.error_reply, OSError, EOFError)
+
+
+class RemoteDirectoryCache:
+    """
+    Diretórios remotos que já se sabe que existem
+
+    Evita o CWD/MKD por componente a cada conexão: o caminho completo é
+    testado com um único CWD e só se ele falha os componentes são
+    criados um a um.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._known: Set[str] = set()
+
+    def ensure(self, ftp: ftplib.FTP, path: str):
+        """Entra no diretório, criando o que faltar"""
+        path = "/" + path.strip('/')
+        with self._lock:
+            known = path in self._known
+        try:
+            ftp.cwd(path)
+            if not known:
+                with self._lock:
+                    self._known.add(path)
+            return
+        except ftplib.error_perm:
+            with self._lock:
+                self._known.discard(path)
+
+        current = ""
+        for part in path.strip('/').split('/'):
+            if not part:
+                continue
+            current = f"{current}/{part}"
+            try:
+                ftp.cwd(current)
+            except ftplib.error_perm:
+                try:
+                    ftp.mkd(current)
+                except ftplib.error_perm:
+                    pass
+        ftp.cwd(path)
+        with self._lock:
+            self._known.add(path)
+
+    def forget(self, path: Optional[str] = None):
+        """Esquece um diretório (ou todos)"""
+        with self._lock:
+            if path is None:
+                self._known.clear()
+            else:
+                self._known.discard("/" + path.strip('/'))
+
+
+class FTPSessionPool:
+    """
+    Pool de sessões FTP já autenticadas e no diretório remoto
+
+    Uma sessão devolvida fica ociosa para a próxima operação. Uma thread
+    manda NOOP nas ociosas a cada FTP_KEEPALIVE_INTERVAL (o servidor não
+    derruba por inatividade) e fecha as que passaram de FTP_IDLE_TIMEOUT.
+    Ao pegar uma sessão parada há mais de FTP_CHECK_AFTER ela é testada
+    com NOOP; se caiu, abre outra.
+
+    Usage:
+        pool = FTPSessionPool(config)
+        with pool.session() as ftp:
+            ftp.delete("arquivo.zip")
+    """
+
+    def __init__(
+        self,
+        config: FTPConfig,
+        max_idle: int = 2,
+        factory: Optional[Callable[[], ftplib.FTP]] = None
+    ):
+        self.config = config
+        self.max_idle = max(max_idle, 1)
+        self.logger = get_logger()
+        self.directories = RemoteDirectoryCache()
+        self._factory = factory or ftplib.FTP
+        self._lock = threading.Lock()
+        self._idle: List[Tuple[ftplib.FTP, float]] = []  # (sessão, último uso)
+        self._stop = threading.Event()
+        self._keepalive: Optional[threading.Thread] = None
+        self.opened = 0  # Sessões abertas desde o início (logins)
+
+    def _open(self) -> ftplib.FTP:
+        """Abre, autentica e entra no diretório remoto"""
+        ftp = self._factory()
+        ftp.connect(
+            self.config.host,
+            self.config.port,
+            timeout=FTP_TIMEOUT
+        )
+        try:
+            ftp.login(self.config.user, self.config.password)
+
+            if self.config.passive_mode:
+                ftp.set_pasv(True)
+
+            if self.config.remote_path:
+                self.directories.ensure(ftp, self.config.remote_path)
+        except Exception:
+            self._close(ftp)
+            raise
+
+        with self._lock:
+            self.opened += 1
+        self.logger.debug(f"Conectado ao FTP: {self.config.host}")
+        return ftp
+
+    def acquire(self) -> ftplib.FTP:
+        """Sessão ociosa (testada se parada há tempo) ou uma nova"""
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                ftp, last_used = self._idle.pop()
+            if time.monotonic() - last_used < FTP_CHECK_AFTER or self._alive(ftp):
+                return ftp
+            self._close(ftp)
+        return self._open()
+
+    def release(self, ftp: Optional[ftplib.FTP], broken: bool = False):
+        """Devolve a sessão ao pool (broken=True descarta)"""
+        if ftp is None:
+            return
+        if not broken:
+            with self._lock:
+                if len(self._idle) < self.max_idle and not self._stop.is_set():
+                    self._idle.append((ftp, time.monotonic()))
+                    self._start_keepalive()
+                    return
+        self._close(ftp)
+
+    @contextmanager
+    def session(self) -> Iterator[ftplib.FTP]:
+        """Sessão do pool; erro de conexão descarta a sessão"""
+        ftp = self.acquire()
+        try:
+            yield ftp
+        except SESSION_ERRORS:
+            self.release(ftp, broken=True)
+            raise
+        except BaseException:
+            # Erro de protocolo (ex: 550): a sessão continua boa
+            self.release(ftp)
+            raise
+        else:
+            self.release(ftp)
+
+    def close(self):
+        """Fecha as sessões ociosas e para o keep-alive"""
+        self._stop.set()
+        self.clear()
+
+    def clear(self):
+        """Fecha as sessões ociosas (o pool continua utilizável)"""
+        with self._lock:
+            idle = [ftp for ftp, _ in self._idle]
+            self._idle = []
+        for ftp in idle:
+            self._close(ftp)
+
+    @property
+    def idle_count(self) -> int:
+        with self._lock:
+            return len(self._idle)
+
+    def _start_keepalive(self):
+        # Chamado com self._lock
+        if self._keepalive is not None:
+            return
+        self._keepalive = threading.Thread(target=self._keepalive_loop, daemon=True)
+        self._keepalive.start()
+
+    def _keepalive_loop(self):
+        while not self._stop.wait(FTP_KEEPALIVE_INTERVAL):
+            with self._lock:
+                idle = self._idle
+                self._idle = []
+                if not idle:
+                    # Sem sessões ociosas a thread termina (recomeça no próximo release)
+                    self._keepalive = None
+                    return
+
+            now = time.monotonic()
+            keep = []
+            for ftp, last_used in idle:
+                if now - last_used > FTP_IDLE_TIMEOUT or not self._alive(ftp):
+                    self._close(ftp)
+                else:
+                    keep.append((ftp, last_used))
+
+            with self._lock:
+                self._idle.extend(keep)
+
+    @staticmethod
+    def _alive(ftp: ftplib.FTP) -> bool:
+        try:
+            ftp.voidcmd('NOOP')
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close(ftp: ftplib.FTP):
+        try:
+            ftp.quit()
+        except Exception:
+            try:
+                ftp.close()
+            except Exception:
+                pass
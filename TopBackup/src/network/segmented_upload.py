@@ -0,0 +1,429 @@
+"""
+TopBackup - Upload FTP Segmentado
+Envia arquivos grandes em partes por várias conexões FTP em paralelo
+"""
+
+import ftplib
+import hashlib
+import io
+import json
+import math
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from ..utils.logger import get_logger
+from .ftp_pool import FTPSessionPool
+
+# Sufixos dos arquivos remotos (arquivo.zip.part001 ... arquivo.zip.manifest.json)
+PART_SUFFIX = ".part"
+MANIFEST_SUFFIX = ".manifest.json"
+
+# Tamanho mínimo de cada parte
+SEGMENT_MIN_BYTES = 64 * 1024 * 1024
+# Partes por conexão (sobra trabalho para as conexões mais rápidas)
+SEGMENTS_PER_CONNECTION = 4
+
+# Nova conexão só fica se o throughput total subir pelo menos 15%
+ADAPT_INTERVAL = 5.0
+ADAPT_GAIN = 1.15
+
+# Bloco do storbinary: ~50ms de dados na velocidade medida
+BLOCK_MIN = 64 * 1024
+BLOCK_MAX = 4 * 1024 * 1024
+BLOCK_SECONDS = 0.05
+
+SEGMENT_ATTEMPTS = 3
+# Leitura do trecho já enviado de uma parte retomada (só entra no hash)
+HASH_READ_SIZE = 1024 * 1024
+
+
+def segment_size_for(file_size: int, max_connections: int) -> int:
+    """Tamanho das partes (determinístico, para retomar após reinício)"""
+    parts = max(max_connections, 1) * SEGMENTS_PER_CONNECTION
+    return max(math.ceil(file_size / parts), SEGMENT_MIN_BYTES)
+
+
+def block_size_for(bytes_per_second: float) -> int:
+    """Bloco de envio proporcional ao throughput da conexão"""
+    size = BLOCK_MIN
+    while size < BLOCK_MAX and size < bytes_per_second * BLOCK_SECONDS:
+        size *= 2
+    return size
+
+
+def part_name(filename: str, index: int) -> str:
+    return f"{filename}{PART_SUFFIX}{index + 1:03d}"
+
+
+@dataclass
+class Segment:
+    """Faixa de bytes enviada como um arquivo remoto"""
+    index: int
+    inicio: int
+    tamanho: int
+    nome: str
+    sha256: str = ""
+    tentativas: int = 0
+
+
+class _RangeReader:
+    """Lê uma faixa do arquivo calculando o SHA-256 do que passa"""
+
+    def __init__(self, f, remaining: int, digest):
+        self._f = f
+        self._remaining = remaining
+        self._digest = digest
+
+    def read(self, size: int = -1) -> bytes:
+        if self._remaining <= 0:
+            return b""
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._f.read(size)
+        self._remaining -= len(data)
+        self._digest.update(data)
+        return data
+
+    def consume(self, block_size: int = HASH_READ_SIZE):
+        """Passa a faixa inteira pelo hash em blocos (memória limitada ao bloco)"""
+        while self.read(block_size):
+            pass
+
+
+class SegmentedUpload:
+    """
+    Upload de um arquivo em partes, por conexões FTP paralelas
+
+    O arquivo é dividido em faixas (arquivo.zip.part001, part002...) e
+    cada conexão pega a próxima faixa livre. Começa com duas conexões e
+    abre outra enquanto o throughput total continua subindo, até
+    max_connections. No fim grava arquivo.zip.manifest.json com o
+    tamanho e o SHA-256 de cada parte (a presença do manifesto indica
+    upload completo). O manifesto de um envio anterior do mesmo nome é
+    apagado antes das partes serem sobrescritas, e partes que sobram
+    dele (envio anterior maior) são apagadas antes do manifesto novo. FTP não tem concatenação no servidor, então a
+    restauração junta as partes (copy /b ou cat). Com limite de banda
+    (throttle) novas conexões não trazem ganho e o envio fica nas duas.
+
+    Partes que já estão completas no servidor (mesmo tamanho) não são
+    reenviadas; partes incompletas continuam com REST.
+
+    Usage:
+        upload = SegmentedUpload(pool, local_path, "arquivo.zip", 4)
+        upload.run()
+    """
+
+    def __init__(
+        self,
+        pool: FTPSessionPool,
+        local_path: str,
+        filename: str,
+        max_connections: int,
+        resume: bool = False,
+        sha256: Optional[str] = None,
+        progress: Optional[Callable[[int, int], None]] = None,
+        throttle: Optional[Callable[[int], None]] = None
+    ):
+        self.pool = pool
+        self.local_path = local_path
+        self.filename = filename
+        self.max_connections = max(max_connections, 1)
+        self.resume = resume
+        self.sha256 = sha256
+        self.progress = progress
+        self.throttle = throttle
+        self.logger = get_logger()
+
+        self.file_size = os.path.getsize(local_path)
+        self.segment_size = segment_size_for(self.file_size, self.max_connections)
+        self.segments = self._build_segments()
+
+        self._queue: "queue.Queue[Segment]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._sent = 0
+        self._transferred = 0  # Só o que passou pela rede (partes retomadas não contam)
+        self._counted: Dict[int, int] = {}  # Bytes de cada parte já somados ao progresso
+        self._remaining = len(self.segments)
+        self._done = threading.Event()
+        self._error: Optional[str] = None
+        self._workers: List[threading.Thread] = []
+
+    def _build_segments(self) -> List[Segment]:
+        segments = []
+        inicio = 0
+        index = 0
+        while inicio < self.file_size:
+            tamanho = min(self.segment_size, self.file_size - inicio)
+            segments.append(Segment(index, inicio, tamanho, part_name(self.filename, index)))
+            inicio += tamanho
+            index += 1
+        return segments
+
+    @property
+    def manifest_name(self) -> str:
+        return f"{self.filename}{MANIFEST_SUFFIX}"
+
+    def run(self) -> str:
+        """
+        Envia as partes e o manifesto
+
+        Returns:
+            Mensagem com conexões usadas e throughput
+
+        Raises:
+            SegmentedUploadError: Parte não enviada após SEGMENT_ATTEMPTS
+        """
+        inicio = time.monotonic()
+        # Manifesto antigo apontaria para partes que vão ser sobrescritas
+        with self.pool.session() as ftp:
+            delete_if_exists(ftp, self.manifest_name)
+
+        for segment in self.segments:
+            self._queue.put(segment)
+
+        self._start_worker()
+        self._start_worker()
+        self._adapt()
+
+        for worker in self._workers:
+            worker.join()
+        if self._error:
+            raise SegmentedUploadError(self._error)
+
+        with self.pool.session() as ftp:
+            remove_parts(ftp, self.filename, first=len(self.segments))
+        self._write_manifest()
+
+        seconds = max(time.monotonic() - inicio, 0.001)
+        return (
+            f"{len(self.segments)} partes por {len(self._workers)} conexões, "
+            f"{self.file_size / seconds / 1024 / 1024:.1f} MB/s"
+        )
+
+    def _adapt(self):
+        """Abre conexões enquanto o throughput total sobe"""
+        last_rate = 0.0
+        last_sent = 0
+        while not self._done.wait(ADAPT_INTERVAL):
+            with self._lock:
+                sent = self._transferred
+            rate = (sent - last_sent) / ADAPT_INTERVAL
+            last_sent = sent
+
+            if last_rate and rate < last_rate * ADAPT_GAIN:
+                # A última conexão não trouxe ganho: fica com as atuais até o fim
+                return
+            last_rate = rate
+            if len(self._workers) >= self.max_connections or self._queue.empty():
+                return
+            self.logger.debug(
+                f"[FTP] {rate / 1024 / 1024:.1f} MB/s com {len(self._workers)} conexões, abrindo mais uma"
+            )
+            self._start_worker()
+
+    def _start_worker(self):
+        if len(self._workers) >= self.max_connections:
+            return
+        worker = threading.Thread(target=self._worker, daemon=True)
+        self._workers.append(worker)
+        worker.start()
+
+    def _worker(self):
+        ftp = None
+        rate = 0.0
+        try:
+            while not self._error:
+                try:
+                    segment = self._queue.get_nowait()
+                except queue.Empty:
+                    return
+
+                try:
+                    if ftp is None:
+                        ftp = self.pool.acquire()
+                    inicio = time.monotonic()
+                    sent = self._send_segment(ftp, segment, block_size_for(rate))
+                    seconds = time.monotonic() - inicio
+                    if sent and seconds > 0:
+                        rate = sent / seconds
+                    self._segment_done()
+                except (ftplib.Error, OSError, EOFError) as e:
+                    # Sessão descartada; a parte volta para a fila
+                    self.pool.release(ftp, broken=True)
+                    ftp = None
+                    segment.tentativas += 1
+                    self.logger.warning(f"[FTP] Erro na parte {segment.nome}: {e}")
+                    if segment.tentativas >= SEGMENT_ATTEMPTS:
+                        self._fail(f"Parte {segment.nome} não enviada: {e}")
+                        return
+                    time.sleep(min(5.0 * segment.tentativas, 30.0))
+                    self._queue.put(segment)
+        finally:
+            self.pool.release(ftp)
+
+    def _segment_done(self):
+        with self._lock:
+            self._remaining -= 1
+            if self._remaining == 0:
+                self._done.set()
+
+    def _fail(self, message: str):
+        with self._lock:
+            if not self._error:
+                self._error = message
+        self._done.set()
+
+    def _add_sent(self, segment: Segment, count: int, transferred: bool = True):
+        if transferred and self.throttle:
+            # Limite de banda compartilhado: as conexões juntas respeitam o total
+            self.throttle(count)
+        with self._lock:
+            self._counted[segment.index] = self._counted.get(segment.index, 0) + count
+            self._sent += count
+            if transferred:
+                self._transferred += count
+            sent = self._sent
+        if self.progress:
+            self.progress(sent, self.file_size)
+
+    def _send_segment(self, ftp: ftplib.FTP, segment: Segment, block_size: int) -> int:
+        """Envia (ou completa) uma parte e confere o resultado"""
+        digest = hashlib.sha256()
+        offset = self._remote_size(ftp, segment.nome) if (self.resume or segment.tentativas) else None
+        if offset is None or offset > segment.tamanho:
+            offset = 0
+
+        with open(self.local_path, 'rb') as f:
+            # O que já está no servidor entra no hash pela cópia local
+            f.seek(segment.inicio)
+            _RangeReader(f, offset, digest).consume()
+            # Numa nova tentativa parte disso já entrou no progresso
+            with self._lock:
+                counted = self._counted.get(segment.index, 0)
+            self._add_sent(segment, offset - counted, transferred=False)
+
+            if offset < segment.tamanho:
+                reader = _RangeReader(f, segment.tamanho - offset, digest)
+                ftp.storbinary(
+                    f'STOR {segment.nome}',
+                    reader,
+                    blocksize=block_size,
+                    callback=lambda data: self._add_sent(segment, len(data)),
+                    rest=offset or None
+                )
+
+        segment.sha256 = digest.hexdigest()
+        self._verify(ftp, segment)
+        return segment.tamanho - offset
+
+    def _verify(self, ftp: ftplib.FTP, segment: Segment):
+        """Confere tamanho e, se o servidor calcula hash, o SHA-256 da parte"""
+        size = self._remote_size(ftp, segment.nome)
+        if size is not None and size != segment.tamanho:
+            raise ftplib.error_temp(
+                f"451 {segment.nome}: tamanho remoto {size}, esperado {segment.tamanho}"
+            )
+        remote_hash = remote_sha256(ftp, segment.nome)
+        if remote_hash and remote_hash != segment.sha256:
+            # Apaga para a próxima tentativa não retomar de uma parte corrompida
+            try:
+                ftp.delete(segment.nome)
+            except ftplib.Error:
+                pass
+            raise ftplib.error_temp(f"451 {segment.nome}: SHA-256 remoto diferente do local")
+
+    @staticmethod
+    def _remote_size(ftp: ftplib.FTP, name: str) -> Optional[int]:
+        try:
+            ftp.voidcmd('TYPE I')
+            return ftp.size(name)
+        except ftplib.error_perm:
+            return None
+
+    def _write_manifest(self):
+        """Grava o manifesto (último arquivo: marca o upload como completo)"""
+        manifest = {
+            'arquivo': self.filename,
+            'tamanho': self.file_size,
+            'sha256': self.sha256,
+            'data': datetime.now().isoformat(timespec='seconds'),
+            'partes': [
+                {k: v for k, v in asdict(s).items() if k != 'tentativas'}
+                for s in self.segments
+            ],
+        }
+        data = json.dumps(manifest, indent=2).encode('utf-8')
+        with self.pool.session() as ftp:
+            ftp.storbinary(f'STOR {self.manifest_name}', io.BytesIO(data))
+
+
+def remote_sha256(ftp: ftplib.FTP, name: str) -> Optional[str]:
+    """
+    SHA-256 calculado pelo servidor (HASH ou XSHA256), se suportado
+
+    Returns:
+        Hash em hexadecimal minúsculo, ou None se o servidor não calcula
+    """
+    for command in (f'HASH {name}', f'XSHA256 {name}'):
+        try:
+            if command.startswith('HASH'):
+                ftp.sendcmd('OPTS HASH SHA-256')
+            response = ftp.sendcmd(command)
+        except ftplib.Error:
+            continue
+        # "213 SHA-256 0-1234 <hash> nome" ou "250 <hash>"
+        for token in response.split()[1:]:
+            if len(token) == 64 and all(c in '0123456789abcdefABCDEF' for c in token):
+                return token.lower()
+    return None
+
+
+def delete_if_exists(ftp: ftplib.FTP, name: str) -> bool:
+    """Apaga um arquivo remoto (False se ele não existe ou o servidor recusou)"""
+    try:
+        ftp.delete(name)
+        return True
+    except ftplib.error_perm:
+        return False
+
+
+def remove_parts(ftp: ftplib.FTP, filename: str, first: int = 0) -> int:
+    """
+    Apaga as partes de um upload segmentado a partir da parte first
+
+    As partes são numeradas em sequência, então para na primeira que
+    não existe.
+
+    Returns:
+        Quantidade de partes apagadas
+    """
+    index = first
+    while delete_if_exists(ftp, part_name(filename, index)):
+        index += 1
+    return index - first
+
+
+def remove_segmented(ftp: ftplib.FTP, filename: str) -> int:
+    """Apaga manifesto e partes de um envio segmentado anterior do arquivo"""
+    delete_if_exists(ftp, f"{filename}{MANIFEST_SUFFIX}")
+    return remove_parts(ftp, filename)
+
+
+def read_manifest(ftp: ftplib.FTP, filename: str) -> Optional[Dict]:
+    """Manifesto de um upload segmentado (None se o arquivo não foi segmentado)"""
+    buffer = io.BytesIO()
+    try:
+        ftp.retrbinary(f'RETR {filename}{MANIFEST_SUFFIX}', buffer.write)
+        return json.loads(buffer.getvalue().decode('utf-8'))
+    except (ftplib.error_perm, ValueError):
+        return None
+
+
+class SegmentedUploadError(Exception):
+    """Erro no upload segmentado"""
+    pass
@@ -0,0 +1,98 @@
+"""
+TopBackup - Checkpoints de Upload
+Estado dos uploads FTP em andamento, para retomar após queda ou reinício
+"""
+
+import json
+import os
+import threading
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional
+
+
+@dataclass
+class UploadCheckpoint:
+    """
+    Upload em andamento
+
+    tamanho e mtime identificam o arquivo local: se o arquivo mudou
+    (backup "U" ou "S" sobrescrito), o que está no servidor não serve e
+    o envio recomeça do zero.
+    """
+    remoto: str
+    local: str
+    tamanho: int
+    mtime: int          # st_mtime_ns do arquivo local
+    enviados: int = 0   # Último total confirmado (o SIZE do servidor prevalece)
+    segmento: int = 0   # Tamanho das partes no upload segmentado (0 = upload simples)
+    atualizado: str = ""
+
+    def matches(self, local_path: str, stat: os.stat_result) -> bool:
+        """Indica se o checkpoint é do mesmo arquivo local"""
+        return (
+            os.path.normcase(self.local) == os.path.normcase(local_path)
+            and self.tamanho == stat.st_size
+            and self.mtime == stat.st_mtime_ns
+        )
+
+
+class UploadCheckpointStore:
+    """
+    Checkpoints persistidos em JSON no diretório de dados
+
+    Um checkpoint por arquivo remoto (servidor + caminho). É criado
+    antes do STOR, atualizado a cada FTP_CHECKPOINT_BYTES enviados e
+    removido quando o upload termina.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._data: Dict[str, dict] = self._load()
+
+    def _load(self) -> Dict[str, dict]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._data, f, indent=2)
+        os.replace(temp_path, self.path)
+
+    def get(self, key: str) -> Optional[UploadCheckpoint]:
+        """Checkpoint do arquivo remoto, se houver"""
+        with self._lock:
+            data = self._data.get(key)
+        if not data:
+            return None
+        try:
+            return UploadCheckpoint(**data)
+        except TypeError:
+            return None
+
+    def put(self, key: str, checkpoint: UploadCheckpoint):
+        """Grava (ou atualiza) o checkpoint"""
+        checkpoint.atualizado = datetime.now().isoformat(timespec='seconds')
+        with self._lock:
+            self._data[key] = asdict(checkpoint)
+            try:
+                self._save()
+            except OSError:
+                pass
+
+    def remove(self, key: str):
+        """Remove o checkpoint (upload concluído ou descartado)"""
+        with self._lock:
+            if self._data.pop(key, None) is None:
+                return
+            try:
+                self._save()
+            except OSError:
+                pass
@@ -99,6 +99,10 @@ class IPCClient:
         """Solicita execução de backup manual"""
         return self._send_command(IPCCommands.BACKUP_MANUAL)
 
+    def get_progress(self) -> Tuple[bool, Dict]:
+        """Obtém progresso dos backups em execução"""
+        return self._send_command(IPCCommands.GET_PROGRESS)
+
     def reload_config(self) -> Tuple[bool, Dict]:
         """Solicita recarga de configurações"""
         return self._send_command(IPCCommands.RELOAD_CONFIG)
@@ -162,6 +162,7 @@ class IPCCommands:
 
     STATUS = "STATUS"
     BACKUP_MANUAL = "BACKUP_MANUAL"
+    GET_PROGRESS = "GET_PROGRESS"
     RELOAD_CONFIG = "RELOAD_CONFIG"
     GET_LOGS = "GET_LOGS"
     GET_NEXT_BACKUP = "GET_NEXT_BACKUP"
@@ -191,6 +192,9 @@ def create_ipc_handlers(controller) -> Dict[str, Callable]:
             'arquivo': result.arquivo
         }
 
+    def handle_get_progress(params):
+        return {'backups': controller.get_progress()}
+
     def handle_reload_config(params):
         controller.reload_config()
         return {'reloaded': True}
@@ -205,7 +209,8 @@ def create_ipc_handlers(controller) -> Dict[str, Callable]:
                     'data_inicio': log.data_inicio.isoformat() if log.data_inicio else None,
                     'status': log.status,
                     'arquivo': log.nome_arquivo,
-                    'tamanho': log.tamanho_formatado
+                    'tamanho': log.tamanho_formatado,
+                    'codec': log.codec
                 }
                 for log in logs
             ]
@@ -232,6 +237,7 @@ def create_ipc_handlers(controller) -> Dict[str, Callable]:
     return {
         IPCCommands.STATUS: handle_status,
         IPCCommands.BACKUP_MANUAL: handle_backup_manual,
+        IPCCommands.GET_PROGRESS: handle_get_progress,
         IPCCommands.RELOAD_CONFIG: handle_reload_config,
         IPCCommands.GET_LOGS: handle_get_logs,
         IPCCommands.GET_NEXT_BACKUP: handle_get_next_backup,
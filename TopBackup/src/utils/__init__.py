@@ -4,3 +4,4 @@ TopBackup - Utils Package
 from .logger import Logger, get_logger
 from .file_utils import FileUtils
 from .resilience import retry, RetryConfig
+from .parallel_zip import ParallelDeflateWriter
@@ -0,0 +1,337 @@
+"""
+TopBackup - Codecs de Compressão
+Registro de codecs, histórico de desempenho e seleção automática
+"""
+
+import json
+import os
+import statistics
+import threading
+import zipfile
+import zlib
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .parallel_zip import ParallelDeflateWriter, ZipEntryWriter, DEFAULT_BLOCK_SIZE
+
+try:
+    import zstandard
+except ImportError:  # zstd é opcional
+    zstandard = None
+
+# Método ZIP do Zstandard (APPNOTE 4.4.5)
+ZIP_METHOD_ZSTD = 93
+
+CODEC_AUTO = "auto"
+DEFAULT_CODEC = "deflate-6"
+
+
+@dataclass
+class CompressionCodec:
+    """Codec de compressão disponível para o ZIP do backup"""
+    name: str
+    family: str  # deflate, lzma, zstd
+    level: Optional[int] = None
+    description: str = ""
+    # Velocidade aproximada em relação ao deflate-6, puxada para baixo:
+    # estimativa para codecs ainda não medidos no modo "auto"
+    relative_speed: float = 1.0
+
+    def is_available(self) -> bool:
+        """Verifica se o codec pode ser usado nesta máquina"""
+        if self.family == "zstd":
+            return zstandard is not None
+        return True
+
+    def open_writer(
+        self,
+        zip_path: str,
+        arcname: str,
+        workers: int = 1,
+        block_size: int = DEFAULT_BLOCK_SIZE
+    ):
+        """
+        Abre um writer de ZIP para este codec
+
+        O objeto retornado aceita write(), close() e abort(), e expõe
+        raw_size, compressed_size e comment (metadados do arquivo).
+        """
+        if not self.is_available():
+            raise RuntimeError(f"Codec {self.name} não está disponível")
+
+        if self.family == "deflate":
+            if workers > 1:
+                return ParallelDeflateWriter(
+                    zip_path, arcname, level=self.level,
+                    workers=workers, block_size=block_size
+                )
+            return _ZipfileWriter(zip_path, arcname, zipfile.ZIP_DEFLATED, self.level)
+
+        if self.family == "lzma":
+            return _ZipfileWriter(zip_path, arcname, zipfile.ZIP_LZMA)
+
+        return _ZstdZipWriter(zip_path, arcname, self.level, workers)
+
+
+class _ZipfileWriter:
+    """Writer single-thread baseado no zipfile da biblioteca padrão"""
+
+    def __init__(self, zip_path: str, arcname: str, method: int, level: Optional[int] = None):
+        self._zip = zipfile.ZipFile(zip_path, 'w', method, compresslevel=level)
+        # force_zip64: tamanho final é desconhecido (pode passar de 4GB)
+        self._entry = self._zip.open(arcname, 'w', force_zip64=True)
+        self._path = zip_path
+        self.raw_size = 0
+        self.comment = b""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    @property
+    def compressed_size(self) -> int:
+        return self._zip.fp.tell() if self._zip.fp else os.path.getsize(self._path)
+
+    def write(self, data: bytes) -> int:
+        self.raw_size += len(data)
+        return self._entry.write(data)
+
+    def close(self):
+        self._entry.close()
+        self._zip.comment = self.comment
+        self._zip.close()
+
+    def abort(self):
+        try:
+            self._entry.close()
+        finally:
+            self._zip.close()
+
+
+class _ZstdZipWriter:
+    """Writer de ZIP com entrada Zstandard (método 93)"""
+
+    def __init__(self, zip_path: str, arcname: str, level: int, workers: int):
+        self._file = open(zip_path, "wb")
+        self._entry = ZipEntryWriter(self._file, arcname, ZIP_METHOD_ZSTD, version_needed=63)
+        # threads > 1 ativa a compressão multi-thread nativa do zstd
+        compressor = zstandard.ZstdCompressor(
+            level=level,
+            threads=workers if workers > 1 else 0
+        )
+        self._compressor = compressor.compressobj()
+        self._crc = 0
+        self.raw_size = 0
+        self.comment = b""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    @property
+    def compressed_size(self) -> int:
+        return self._entry.compressed_size
+
+    def write(self, data: bytes) -> int:
+        self._crc = zlib.crc32(data, self._crc)
+        self.raw_size += len(data)
+        out = self._compressor.compress(data)
+        if out:
+            self._entry.write_compressed(out)
+        return len(data)
+
+    def close(self):
+        try:
+            self._entry.write_compressed(self._compressor.flush())
+            self._entry.finish(self._crc, self.raw_size, self.comment)
+        finally:
+            self._file.close()
+
+    def abort(self):
+        self._file.close()
+
+
+# Ordem do registro: do mais rápido para o que mais comprime
+CODECS: Dict[str, CompressionCodec] = {
+    codec.name: codec for codec in [
+        CompressionCodec("deflate-1", "deflate", 1, "DEFLATE rápido", 2.0),
+        CompressionCodec("zstd-3", "zstd", 3, "Zstandard padrão", 2.0),
+        CompressionCodec("deflate-6", "deflate", 6, "DEFLATE padrão", 1.0),
+        CompressionCodec("zstd-9", "zstd", 9, "Zstandard alto", 0.7),
+        CompressionCodec("deflate-9", "deflate", 9, "DEFLATE máximo", 0.3),
+        CompressionCodec("zstd-19", "zstd", 19, "Zstandard máximo", 0.05),
+        # Sempre single-thread: bem mais lento que o deflate paralelo
+        CompressionCodec("lzma", "lzma", None, "LZMA (7-Zip)", 0.05),
+    ]
+}
+
+
+def get_codec(name: str) -> CompressionCodec:
+    """Retorna codec pelo nome (usa o padrão se desconhecido ou indisponível)"""
+    codec = CODECS.get(name)
+    if codec is None or not codec.is_available():
+        return CODECS[DEFAULT_CODEC]
+    return codec
+
+
+def available_codecs() -> List[CompressionCodec]:
+    """Lista codecs disponíveis nesta máquina"""
+    return [codec for codec in CODECS.values() if codec.is_available()]
+
+
+def build_archive_comment(codec: CompressionCodec, **extra) -> bytes:
+    """Gera metadados JSON gravados como comentário do ZIP"""
+    data = {
+        'codec': codec.name,
+        'familia': codec.family,
+        'nivel': codec.level,
+        'criado_em': datetime.now().isoformat(timespec='seconds'),
+    }
+    data.update(extra)
+    return json.dumps(data, ensure_ascii=True).encode('ascii')
+
+
+def read_archive_codec(zip_path: str) -> Optional[str]:
+    """Lê o codec registrado no comentário de um ZIP de backup"""
+    try:
+        with zipfile.ZipFile(zip_path) as zipf:
+            return json.loads(zipf.comment.decode('ascii')).get('codec')
+    except Exception:
+        return None
+
+
+class CompressionStats:
+    """
+    Histórico de desempenho dos codecs por banco de dados
+
+    Persistido em JSON no diretório de dados. Cada backup concluído grava
+    throughput e taxa de compressão, usados pelo modo "auto".
+    """
+
+    MAX_SAMPLES = 10  # Amostras mantidas por banco/codec
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._data: Dict[str, Dict[str, List[dict]]] = self._load()
+
+    def _load(self) -> Dict[str, Dict[str, List[dict]]]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._data, f, indent=2)
+        os.replace(temp_path, self.path)
+
+    def record(
+        self,
+        database: str,
+        codec: str,
+        raw_bytes: int,
+        compressed_bytes: int,
+        seconds: float
+    ):
+        """Registra o resultado de uma compressão"""
+        if raw_bytes <= 0 or seconds <= 0:
+            return
+
+        sample = {
+            'data': datetime.now().isoformat(timespec='seconds'),
+            'raw_bytes': raw_bytes,
+            'compressed_bytes': compressed_bytes,
+            'throughput': raw_bytes / seconds,
+            'ratio': compressed_bytes / raw_bytes,
+        }
+
+        with self._lock:
+            samples = self._data.setdefault(database, {}).setdefault(codec, [])
+            samples.append(sample)
+            del samples[:-self.MAX_SAMPLES]
+            try:
+                self._save()
+            except OSError:
+                pass
+
+    def summary(self, database: str) -> Dict[str, dict]:
+        """Retorna mediana de throughput e taxa por codec"""
+        with self._lock:
+            per_codec = self._data.get(database, {})
+            return {
+                codec: {
+                    'throughput': statistics.median(s['throughput'] for s in samples),
+                    'ratio': statistics.median(s['ratio'] for s in samples),
+                    'raw_bytes': samples[-1]['raw_bytes'],
+                }
+                for codec, samples in per_codec.items() if samples
+            }
+
+    def last_raw_size(self, database: str) -> int:
+        """Tamanho do último backup não comprimido (0 se sem histórico)"""
+        with self._lock:
+            latest = [
+                samples[-1] for samples in self._data.get(database, {}).values() if samples
+            ]
+        if not latest:
+            return 0
+        return max(latest, key=lambda s: s['data'])['raw_bytes']
+
+    def choose_codec(self, database: str, raw_size: int, window_seconds: float) -> CompressionCodec:
+        """
+        Escolhe o codec com melhor compressão que cabe na janela de backup
+
+        Sem histórico usa o padrão. Codecs ainda não medidos são testados
+        um por vez, apenas quando o melhor codec conhecido usa menos da
+        metade da janela e a estimativa do codec novo também cabe nessa
+        metade, para não arriscar estourar o horário. A estimativa vem do
+        relative_speed aplicado ao codec medido mais lento (pessimista).
+        """
+        summary = self.summary(database)
+        if not summary:
+            return get_codec(DEFAULT_CODEC)
+
+        raw_size = raw_size or self.last_raw_size(database)
+        candidates = [c for c in available_codecs() if c.name in summary]
+        if not candidates:
+            return get_codec(DEFAULT_CODEC)
+
+        def estimated_seconds(codec: CompressionCodec) -> float:
+            return raw_size / summary[codec.name]['throughput']
+
+        fitting = [c for c in candidates if estimated_seconds(c) <= window_seconds]
+        if not fitting:
+            # Nada cabe na janela: usa o mais rápido medido
+            return min(candidates, key=estimated_seconds)
+
+        best = min(fitting, key=lambda c: summary[c.name]['ratio'])
+
+        if estimated_seconds(best) <= window_seconds / 2:
+            # Explora o próximo codec não medido (ordem do registro) que cabe
+            for codec in available_codecs():
+                if codec.name in summary:
+                    continue
+                throughput = min(
+                    summary[c.name]['throughput'] * codec.relative_speed / c.relative_speed
+                    for c in candidates
+                )
+                if raw_size / throughput <= window_seconds / 2:
+                    return codec
+
+        return best
@@ -0,0 +1,240 @@
+"""
+TopBackup - Escrita em Leque (Fan-out)
+Lê o artefato uma única vez e alimenta vários destinos em paralelo
+"""
+
+import hashlib
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from .file_utils import FileUtils
+
+FANOUT_CHUNK_SIZE = 1024 * 1024  # 1MB por leitura
+FANOUT_QUEUE_SIZE = 32           # Blocos pendentes por destino
+
+_END = object()    # Sentinela de fim de fluxo (origem lida até o fim)
+_ABORT = object()  # Sentinela de leitura interrompida: destinos descartam o que gravaram
+
+
+class FanoutSink:
+    """
+    Destino de um FanoutWriter
+
+    Cada destino roda em sua própria thread, consumindo blocos de uma
+    fila limitada. Destinos obrigatórios (required) que falham fazem o
+    fan-out inteiro falhar; os opcionais apenas registram o erro.
+    """
+
+    def __init__(self, name: str, required: bool = True):
+        self.name = name
+        self.required = required
+        self.error: Optional[str] = None
+        self.bytes_written = 0
+
+    def open(self):
+        """Prepara o destino (executado na thread do destino)"""
+
+    def write(self, data: bytes):
+        """Recebe um bloco de dados"""
+        raise NotImplementedError
+
+    def close(self):
+        """Finaliza o destino após o último bloco"""
+
+    def abort(self):
+        """Descarta o que foi escrito após uma falha"""
+
+    @property
+    def failed(self) -> bool:
+        return self.error is not None
+
+
+class FileSink(FanoutSink):
+    """
+    Grava os blocos em um arquivo
+
+    Escreve em um temporário ao lado do destino e, no close(), faz fsync
+    e rename atômico: o arquivo anterior (modos 'U' e 'S') só é
+    substituído quando o novo está completo. throttle (limite de banda)
+    é chamado com o tamanho de cada bloco antes de gravar.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        required: bool = True,
+        throttle: Optional[Callable[[int], None]] = None
+    ):
+        super().__init__(path, required)
+        self.path = path
+        self.temp_path = FileUtils.temp_path_for(path)
+        self.throttle = throttle
+        self._file = None
+
+    def open(self):
+        dest_dir = os.path.dirname(self.path)
+        if dest_dir:
+            os.makedirs(dest_dir, exist_ok=True)
+        self._file = open(self.temp_path, 'wb')
+
+    def write(self, data: bytes):
+        if self.throttle:
+            self.throttle(len(data))
+        self._file.write(data)
+
+    def close(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        FileUtils.commit_file(self.temp_path, self.path)
+
+    def abort(self):
+        if self._file:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+        FileUtils.safe_delete(self.temp_path)
+
+
+class HashSink(FanoutSink):
+    """Acumula o hash dos blocos (SHA-256 por padrão)"""
+
+    def __init__(self, algorithm: str = 'sha256'):
+        super().__init__(f"hash:{algorithm}", required=False)
+        self._hash = hashlib.new(algorithm)
+        self.hexdigest: Optional[str] = None
+
+    def write(self, data: bytes):
+        self._hash.update(data)
+
+    def close(self):
+        self.hexdigest = self._hash.hexdigest()
+
+
+@dataclass
+class FanoutResult:
+    """Resultado de uma execução do fan-out"""
+    success: bool
+    bytes_read: int = 0
+    seconds: float = 0
+    errors: Dict[str, str] = field(default_factory=dict)
+
+
+class FanoutWriter:
+    """
+    Lê um arquivo uma vez e escreve em vários destinos simultaneamente
+
+    O mesmo objeto bytes é entregue a todas as filas (sem cópia). Cada
+    fila é limitada, então um destino lento (ex: compartilhamento de
+    rede) segura a leitura só depois de acumular FANOUT_QUEUE_SIZE
+    blocos, sem travar os demais destinos a cada escrita.
+
+    Usage:
+        hash_sink = HashSink()
+        result = FanoutWriter([FileSink(d1), FileSink(d2, required=False), hash_sink]).run(origem)
+    """
+
+    def __init__(
+        self,
+        sinks: List[FanoutSink],
+        chunk_size: int = FANOUT_CHUNK_SIZE,
+        queue_size: int = FANOUT_QUEUE_SIZE
+    ):
+        self.sinks = sinks
+        self.chunk_size = chunk_size
+        self.queue_size = queue_size
+
+    def _sink_worker(self, sink: FanoutSink, sink_queue: "queue.Queue"):
+        """Consome a fila de um destino até o fim do fluxo"""
+        try:
+            sink.open()
+            while True:
+                data = sink_queue.get()
+                if data is _END:
+                    break
+                if data is _ABORT:
+                    # Origem incompleta: nada é confirmado (o arquivo anterior fica)
+                    sink.error = "Leitura da origem interrompida"
+                    sink.abort()
+                    return
+                sink.write(data)
+                sink.bytes_written += len(data)
+            sink.close()
+        except Exception as e:
+            sink.error = str(e)
+            sink.abort()
+            # Drena a fila para não bloquear o leitor
+            while sink_queue.get() not in (_END, _ABORT):
+                pass
+
+    def run(
+        self,
+        source_path: str,
+        progress: Optional[Callable[[int], None]] = None
+    ) -> FanoutResult:
+        """
+        Executa o fan-out a partir do arquivo de origem
+
+        Args:
+            source_path: Arquivo lido uma única vez
+            progress: Chamado com o tamanho de cada bloco lido
+
+        Returns:
+            FanoutResult com bytes lidos e erros por destino
+        """
+        inicio = time.monotonic()
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.sinks]
+        threads = [
+            threading.Thread(
+                target=self._sink_worker,
+                args=(sink, sink_queue),
+                name=f"fanout-{index}",
+                daemon=True
+            )
+            for index, (sink, sink_queue) in enumerate(zip(self.sinks, queues))
+        ]
+        for thread in threads:
+            thread.start()
+
+        bytes_read = 0
+        read_error: Optional[str] = None
+        completo = False
+        try:
+            with open(source_path, 'rb') as source:
+                for data in iter(lambda: source.read(self.chunk_size), b""):
+                    bytes_read += len(data)
+                    if progress:
+                        progress(len(data))
+                    for sink, sink_queue in zip(self.sinks, queues):
+                        if not sink.failed:
+                            sink_queue.put(data)
+            completo = True
+        except Exception as e:
+            read_error = str(e)
+        finally:
+            # Só o fim limpo da origem confirma os destinos; leitura
+            # interrompida faz cada um descartar o temporário (abort)
+            sentinel = _END if completo else _ABORT
+            for sink_queue in queues:
+                sink_queue.put(sentinel)
+            for thread in threads:
+                thread.join()
+
+        if read_error:
+            for sink in self.sinks:
+                sink.error = f"Falha na leitura da origem: {read_error}"
+
+        errors = {sink.name: sink.error for sink in self.sinks if sink.failed}
+        success = not any(sink.required and sink.failed for sink in self.sinks)
+
+        return FanoutResult(
+            success=success,
+            bytes_read=bytes_read,
+            seconds=time.monotonic() - inicio,
+            errors=errors
+        )
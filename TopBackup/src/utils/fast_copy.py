@@ -0,0 +1,213 @@
+"""
+TopBackup - Cópia Rápida de Arquivos
+Escolhe o método de cópia mais rápido disponível no sistema
+"""
+
+import errno
+import os
+import shutil
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+try:
+    import win32file
+except ImportError:  # pywin32 só existe no Windows
+    win32file = None
+
+# ioctl FICLONE (Linux): clona os extents do arquivo (btrfs, XFS, ...)
+FICLONE = 0x40049409
+
+COPY_CHUNK_SIZE = 64 * 1024 * 1024      # Bloco do copy_file_range/sendfile
+BUFFER_CHUNK_SIZE = 8 * 1024 * 1024     # Bloco da cópia em espaço de usuário
+THROTTLED_CHUNK_SIZE = 256 * 1024       # Bloco da cópia com limite de banda
+PREALLOCATE_MIN_SIZE = 64 * 1024 * 1024  # Pré-aloca destinos a partir deste tamanho
+
+# Métodos de cópia (na ordem de preferência)
+METHOD_HARDLINK = "hardlink"
+METHOD_REFLINK = "reflink"
+METHOD_COPYFILE = "copyfile"
+METHOD_COPY_FILE_RANGE = "copy_file_range"
+METHOD_SENDFILE = "sendfile"
+METHOD_BUFFERED = "buffered"
+
+# Erros que indicam "método não suportado aqui" (tenta o próximo)
+_UNSUPPORTED = {
+    errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP,
+    errno.ENOTTY, errno.EBADF, errno.EPERM
+}
+
+
+@dataclass
+class CopyResult:
+    """Resultado de uma cópia"""
+    method: str
+    bytes: int
+    seconds: float
+
+    @property
+    def throughput(self) -> float:
+        """Bytes por segundo"""
+        return self.bytes / self.seconds if self.seconds > 0 else 0.0
+
+
+def _try_reflink(source: str, destination: str) -> bool:
+    """Clona o arquivo via FICLONE (sem copiar dados)"""
+    if fcntl is None:
+        return False
+    try:
+        with open(source, 'rb') as src, open(destination, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        return True
+    except OSError as e:
+        if e.errno not in _UNSUPPORTED:
+            raise
+        _remove(destination)
+        return False
+
+
+def _try_copyfile(source: str, destination: str) -> bool:
+    """
+    CopyFile do Windows
+
+    Copia no kernel e usa block clone no ReFS e cópia no servidor
+    (offload) entre compartilhamentos SMB.
+    """
+    if win32file is None:
+        return False
+    win32file.CopyFile(source, destination, False)
+    return True
+
+
+def _preallocate(fd: int, size: int):
+    """Reserva o espaço do destino de uma vez (menos fragmentação)"""
+    if size < PREALLOCATE_MIN_SIZE:
+        return
+    try:
+        if hasattr(os, 'posix_fallocate'):
+            os.posix_fallocate(fd, 0, size)
+        else:
+            # NTFS aloca os clusters ao definir o fim do arquivo
+            os.ftruncate(fd, size)
+    except OSError:
+        pass
+
+
+def _copy_kernel(source: str, destination: str, size: int, chunk_size: int) -> str:
+    """copy_file_range, sendfile ou cópia com buffer grande"""
+    with open(source, 'rb') as src, open(destination, 'wb') as dst:
+        src_fd, dst_fd = src.fileno(), dst.fileno()
+        _preallocate(dst_fd, size)
+
+        for method, func in (
+            (METHOD_COPY_FILE_RANGE, getattr(os, 'copy_file_range', None)),
+            (METHOD_SENDFILE, getattr(os, 'sendfile', None)),
+        ):
+            if func is None:
+                continue
+            offset = 0
+            try:
+                while offset < size:
+                    if method == METHOD_COPY_FILE_RANGE:
+                        sent = func(src_fd, dst_fd, min(chunk_size, size - offset), offset, offset)
+                    else:
+                        os.lseek(dst_fd, offset, os.SEEK_SET)
+                        sent = func(dst_fd, src_fd, offset, min(chunk_size, size - offset))
+                    if sent == 0:
+                        break
+                    offset += sent
+            except OSError as e:
+                # Sem suporte só é aceitável antes do primeiro byte
+                if e.errno not in _UNSUPPORTED or offset:
+                    raise
+                continue
+            os.ftruncate(dst_fd, offset)
+            return method
+
+        os.lseek(dst_fd, 0, os.SEEK_SET)
+        shutil.copyfileobj(src, dst, BUFFER_CHUNK_SIZE)
+        dst.truncate()
+        return METHOD_BUFFERED
+
+
+def _copy_throttled(source: str, destination: str, throttle: Callable[[int], None]):
+    """Cópia com buffer passando cada bloco pelo limite de banda"""
+    with open(source, 'rb') as src, open(destination, 'wb') as dst:
+        while True:
+            data = src.read(THROTTLED_CHUNK_SIZE)
+            if not data:
+                break
+            throttle(len(data))
+            dst.write(data)
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def fast_copy(
+    source: str,
+    destination: str,
+    allow_hardlink: bool = False,
+    chunk_size: int = COPY_CHUNK_SIZE,
+    throttle: Optional[Callable[[int], None]] = None
+) -> CopyResult:
+    """
+    Copia um arquivo com o método mais rápido disponível
+
+    Ordem: hardlink (se permitido e no mesmo volume), reflink/clone,
+    CopyFile do Windows, copy_file_range, sendfile e, por fim, cópia
+    com buffer. Metadados (datas) são preservados como no copy2. O
+    destino não pode existir. Com throttle (limite de banda) a cópia é
+    sempre com buffer, já que as cópias no kernel não passam pelo limite.
+
+    Args:
+        source: Arquivo de origem
+        destination: Arquivo de destino
+        allow_hardlink: Aceita hardlink (destino compartilha o conteúdo)
+        chunk_size: Bloco das chamadas de cópia no kernel
+        throttle: Chamado com os bytes de cada bloco antes de gravar
+
+    Returns:
+        CopyResult com método, bytes e tempo
+
+    Raises:
+        OSError: Falha na cópia (destino parcial é removido)
+    """
+    inicio = time.monotonic()
+    size = os.path.getsize(source)
+
+    method = None
+    if allow_hardlink:
+        try:
+            os.link(source, destination)
+            method = METHOD_HARDLINK
+        except OSError:
+            pass
+
+    try:
+        if method is None and throttle is not None:
+            _copy_throttled(source, destination, throttle)
+            method = METHOD_BUFFERED
+        if method is None and _try_reflink(source, destination):
+            method = METHOD_REFLINK
+        if method is None and _try_copyfile(source, destination):
+            method = METHOD_COPYFILE
+        if method is None:
+            method = _copy_kernel(source, destination, size, chunk_size)
+        if method != METHOD_HARDLINK:
+            shutil.copystat(source, destination)
+    except BaseException:
+        if method != METHOD_HARDLINK:
+            _remove(destination)
+        raise
+
+    return CopyResult(method=method, bytes=size, seconds=time.monotonic() - inicio)
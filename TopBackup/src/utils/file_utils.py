@@ -2,13 +2,20 @@
 TopBackup - Utilitários de Arquivo
 """
 
+import errno
 import os
 import shutil
-import zipfile
 import hashlib
 from pathlib import Path
 from datetime import datetime
-from typing import Optional, Tuple
+from typing import Callable, Iterable, Iterator, Optional, Tuple
+
+from .parallel_zip import DEFAULT_BLOCK_SIZE
+from .fast_copy import fast_copy, CopyResult, METHOD_HARDLINK
+from .compression_codecs import get_codec, build_archive_comment, DEFAULT_CODEC
+
+# Sistemas de arquivos de rede (Linux, /proc/mounts)
+NETWORK_FILESYSTEMS = {'cifs', 'smb3', 'smbfs', 'nfs', 'nfs4', 'davfs', '9p'}
 
 
 class FileUtils:
@@ -39,20 +46,87 @@ class FileUtils:
             return 0
 
     @staticmethod
-    def compress_to_zip(source_path: str, zip_path: str) -> Tuple[bool, str]:
+    def compress_to_zip(
+        source_path: str,
+        zip_path: str,
+        workers: int = 1,
+        block_size: int = DEFAULT_BLOCK_SIZE,
+        codec: str = DEFAULT_CODEC,
+        progress: Optional[Callable[[int], None]] = None
+    ) -> Tuple[bool, str]:
         """
         Compacta um arquivo para ZIP
 
+        Args:
+            source_path: Arquivo a compactar
+            zip_path: Caminho do arquivo ZIP
+            workers: Threads de compressão (1 = single-thread)
+            block_size: Tamanho do bloco para compressão paralela
+            codec: Nome do codec (ver compression_codecs.CODECS)
+            progress: Chamado com o tamanho de cada bloco lido
+
         Returns:
             Tuple[bool, str]: (sucesso, mensagem)
         """
         try:
-            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+            with open(source_path, 'rb') as source:
+                chunks = iter(lambda: source.read(block_size), b"")
+                if progress:
+                    chunks = FileUtils._counted(chunks, progress)
                 # Adiciona o arquivo com apenas o nome, sem o caminho completo
-                arcname = os.path.basename(source_path)
-                zipf.write(source_path, arcname)
+                return FileUtils.compress_stream_to_zip(
+                    chunks,
+                    zip_path,
+                    os.path.basename(source_path),
+                    workers=workers,
+                    block_size=block_size,
+                    codec=codec
+                )
+        except Exception as e:
+            return False, str(e)
+
+    @staticmethod
+    def _counted(chunks: Iterable[bytes], progress: Callable[[int], None]) -> Iterator[bytes]:
+        """Repassa os blocos informando o tamanho de cada um"""
+        for chunk in chunks:
+            progress(len(chunk))
+            yield chunk
+
+    @staticmethod
+    def compress_stream_to_zip(
+        chunks: Iterable[bytes],
+        zip_path: str,
+        arcname: str,
+        workers: int = 1,
+        block_size: int = DEFAULT_BLOCK_SIZE,
+        codec: str = DEFAULT_CODEC
+    ) -> Tuple[bool, str]:
+        """
+        Compacta um fluxo de bytes para ZIP sem arquivo intermediário
+
+        O codec usado fica registrado no comentário do ZIP (JSON).
+
+        Args:
+            chunks: Iterável de blocos de bytes (ex: stdout do gbak)
+            zip_path: Caminho do arquivo ZIP
+            arcname: Nome do arquivo dentro do ZIP
+            workers: Threads de compressão (1 = single-thread)
+            block_size: Tamanho do bloco para compressão paralela
+            codec: Nome do codec (ver compression_codecs.CODECS)
+
+        Returns:
+            Tuple[bool, str]: (sucesso, mensagem)
+        """
+        try:
+            codec_obj = get_codec(codec)
+            writer = codec_obj.open_writer(zip_path, arcname, workers, block_size)
+            writer.comment = build_archive_comment(codec_obj)
+
+            with writer:
+                for chunk in chunks:
+                    writer.write(chunk)
 
-            return True, "Compactação concluída"
+            return True, f"Compactação concluída ({codec_obj.name})"
         except Exception as e:
             return False, str(e)
 
@@ -61,6 +135,11 @@ class FileUtils:
         """
         Move arquivo de forma segura
 
+        O arquivo existente só é substituído depois que o novo está
+        completo e gravado em disco (rename atômico). No mesmo volume é
+        só um rename; entre volumes copia com fast_copy para um
+        temporário no destino e remove a origem.
+
         Returns:
             Tuple[bool, str]: (sucesso, mensagem)
         """
@@ -70,44 +149,175 @@ class FileUtils:
             if dest_dir:
                 os.makedirs(dest_dir, exist_ok=True)
 
-            # Remove arquivo existente se overwrite=True
-            if os.path.exists(destination):
-                if overwrite:
-                    os.remove(destination)
-                else:
-                    return False, "Arquivo de destino já existe"
+            if not overwrite and os.path.exists(destination):
+                return False, "Arquivo de destino já existe"
 
-            shutil.move(source, destination)
-            return True, "Arquivo movido com sucesso"
+            # Dados no disco antes do rename: uma queda de energia não
+            # deixa o destino apontando para um arquivo vazio
+            FileUtils.fsync_file(source)
+            try:
+                FileUtils.commit_file(source, destination)
+                return True, "Arquivo movido com sucesso"
+            except OSError as e:
+                # EXDEV / ERROR_NOT_SAME_DEVICE: outro volume
+                if e.errno != errno.EXDEV and getattr(e, 'winerror', None) != 17:
+                    raise
+
+            result = FileUtils.copy_file(source, destination)
+            os.remove(source)
+            return True, f"Arquivo movido com sucesso ({FileUtils.describe_copy(result)})"
         except Exception as e:
             return False, str(e)
 
     @staticmethod
-    def safe_copy(source: str, destination: str, overwrite: bool = True) -> Tuple[bool, str]:
+    def copy_file(
+        source: str,
+        destination: str,
+        overwrite: bool = True,
+        allow_hardlink: bool = False,
+        throttle: Optional[Callable[[int], None]] = None
+    ) -> CopyResult:
         """
-        Copia arquivo de forma segura
+        Copia arquivo com o método mais rápido disponível (ver fast_copy)
+
+        A cópia é feita em um temporário no diretório de destino e só
+        substitui o arquivo existente depois do fsync, então uma falha no
+        meio da cópia mantém o backup anterior.
 
         Returns:
-            Tuple[bool, str]: (sucesso, mensagem)
+            CopyResult com método, bytes e tempo da cópia
         """
+        # Cria diretório de destino se não existir
+        dest_dir = os.path.dirname(destination)
+        if dest_dir:
+            os.makedirs(dest_dir, exist_ok=True)
+
+        if not overwrite and os.path.exists(destination):
+            raise FileExistsError("Arquivo de destino já existe")
+
+        temp_path = FileUtils.temp_path_for(destination)
+        FileUtils.safe_delete(temp_path)  # Sobra de uma execução interrompida
         try:
-            # Cria diretório de destino se não existir
-            dest_dir = os.path.dirname(destination)
-            if dest_dir:
-                os.makedirs(dest_dir, exist_ok=True)
+            result = fast_copy(
+                source, temp_path, allow_hardlink=allow_hardlink, throttle=throttle
+            )
+            if result.method != METHOD_HARDLINK:
+                FileUtils.fsync_file(temp_path)
+            FileUtils.commit_file(temp_path, destination)
+        except BaseException:
+            FileUtils.safe_delete(temp_path)
+            raise
+        return result
 
-            # Remove arquivo existente se overwrite=True
-            if os.path.exists(destination):
-                if overwrite:
-                    os.remove(destination)
-                else:
-                    return False, "Arquivo de destino já existe"
+    @staticmethod
+    def temp_path_for(destination: str) -> str:
+        """Temporário no mesmo diretório (e volume) do arquivo final"""
+        return f"{destination}.tmp"
 
-            shutil.copy2(source, destination)
-            return True, "Arquivo copiado com sucesso"
+    @staticmethod
+    def fsync_file(path: str):
+        """Força a gravação em disco dos dados de um arquivo"""
+        # No Windows o fsync exige o arquivo aberto para escrita
+        fd = os.open(path, os.O_RDWR | getattr(os, 'O_BINARY', 0))
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def commit_file(temp_path: str, destination: str):
+        """
+        Substitui o destino pelo temporário já gravado (rename atômico)
+
+        Em nenhum momento o destino deixa de existir: ou é o arquivo
+        antigo ou o novo completo.
+        """
+        os.replace(temp_path, destination)
+        if os.name != 'nt':
+            # Persiste a entrada do diretório (no NTFS o rename já é registrado no journal)
+            try:
+                fd = os.open(os.path.dirname(destination) or '.', os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            except OSError:
+                pass
+
+    @staticmethod
+    def safe_copy(
+        source: str,
+        destination: str,
+        overwrite: bool = True,
+        allow_hardlink: bool = False,
+        throttle: Optional[Callable[[int], None]] = None
+    ) -> Tuple[bool, str]:
+        """
+        Copia arquivo de forma segura (throttle: limite de banda, ver fast_copy)
+
+        Returns:
+            Tuple[bool, str]: (sucesso, mensagem com método e throughput)
+        """
+        try:
+            result = FileUtils.copy_file(source, destination, overwrite, allow_hardlink, throttle)
+            return True, f"Arquivo copiado com sucesso ({FileUtils.describe_copy(result)})"
         except Exception as e:
             return False, str(e)
 
+    @staticmethod
+    def describe_copy(result: CopyResult) -> str:
+        """Método e throughput de uma cópia (para log)"""
+        if result.method == METHOD_HARDLINK or not result.seconds:
+            return result.method
+        return f"{result.method}, {FileUtils.format_size(int(result.throughput))}/s"
+
+    @staticmethod
+    def same_volume(path_a: str, path_b: str) -> bool:
+        """Verifica se dois caminhos existentes estão no mesmo volume"""
+        try:
+            return os.stat(path_a).st_dev == os.stat(path_b).st_dev
+        except OSError:
+            return False
+
+    @staticmethod
+    def is_network_path(path: str) -> bool:
+        """
+        Verifica se o caminho está em rede (compartilhamento ou unidade mapeada)
+
+        UNC (\\\\servidor\\pasta) é sempre rede; letras de unidade são
+        consultadas no GetDriveType e, fora do Windows, o tipo do sistema
+        de arquivos vem do /proc/mounts.
+        """
+        if not path:
+            return False
+        path = os.path.abspath(path)
+        if path.startswith(('\\\\', '//')):
+            return True
+
+        drive, _ = os.path.splitdrive(path)
+        if drive:
+            try:
+                import ctypes
+                # DRIVE_REMOTE = 4
+                return ctypes.windll.kernel32.GetDriveTypeW(drive + '\\') == 4
+            except (AttributeError, OSError):
+                return False
+
+        best, fs_type = "", ""
+        try:
+            with open('/proc/mounts', 'r', encoding='utf-8') as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) < 3:
+                        continue
+                    mount_point = parts[1].replace('\\040', ' ')
+                    inside = path == mount_point or path.startswith(mount_point.rstrip('/') + '/')
+                    if inside and len(mount_point) > len(best):
+                        best, fs_type = mount_point, parts[2]
+        except OSError:
+            return False
+        return fs_type in NETWORK_FILESYSTEMS or fs_type.startswith('fuse.sshfs')
+
     @staticmethod
     def safe_delete(file_path: str) -> Tuple[bool, str]:
         """
@@ -139,7 +349,8 @@ class FileUtils:
     def generate_backup_filename(
         cnpj: str,
         prefixo: str = 'V',
-        extensao: str = '.zip'
+        extensao: str = '.zip',
+        sufixo: str = ''
     ) -> str:
         """
         Gera nome do arquivo de backup baseado no prefixo
@@ -148,12 +359,13 @@ class FileUtils:
             cnpj: CNPJ da empresa (apenas números)
             prefixo: V (versionado), S (semanal), U (único)
             extensao: Extensão do arquivo
+            sufixo: Identificação do banco quando a empresa tem vários (ex: _VENDAS)
 
         Returns:
             Nome do arquivo formatado
         """
         # Remove caracteres especiais do CNPJ
-        cnpj_limpo = ''.join(filter(str.isdigit, cnpj))
+        cnpj_limpo = ''.join(filter(str.isdigit, cnpj)) + sufixo
 
         if prefixo == 'V':
             # Versionado: CNPJ_YYYYMMDD_HHMMSS.zip
@@ -191,6 +403,15 @@ class FileUtils:
             import tempfile
             return Path(tempfile.gettempdir()) / "topbackup_temp"
 
+    @staticmethod
+    def get_data_directory() -> Path:
+        """Retorna diretório de dados locais (histórico, filas, catálogo)"""
+        import sys
+        if getattr(sys, 'frozen', False):
+            return Path(r"C:\TOPBACKUP\data")
+        else:
+            return Path(__file__).parent.parent.parent / "data"
+
     @staticmethod
     def cleanup_temp_files(max_age_hours: int = 24):
         """Remove arquivos temporários antigos"""
@@ -0,0 +1,296 @@
+"""
+TopBackup - Compactação ZIP Paralela
+Deflate em blocos distribuídos entre threads (estilo pigz)
+"""
+
+import os
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from datetime import datetime
+from typing import BinaryIO, Deque, Optional, Tuple
+
+# Métodos de compressão ZIP (APPNOTE 4.4.5)
+ZIP_METHOD_STORED = 0
+ZIP_METHOD_DEFLATED = 8
+
+# Assinaturas e limites do formato ZIP
+_LOCAL_HEADER_SIG = b"PK\x03\x04"
+_CENTRAL_DIR_SIG = b"PK\x01\x02"
+_DATA_DESCRIPTOR_SIG = b"PK\x07\x08"
+_END_ARCHIVE_SIG = b"PK\x05\x06"
+_END_ARCHIVE64_SIG = b"PK\x06\x06"
+_END_ARCHIVE64_LOCATOR_SIG = b"PK\x06\x07"
+_ZIP64_LIMIT = 0xFFFFFFFF
+_ZIP64_VERSION = 45
+_FLAG_DATA_DESCRIPTOR = 0x08
+_FLAG_UTF8 = 0x800
+
+# Janela do deflate: o dicionário de cada bloco é o final do bloco anterior
+_DEFLATE_WINDOW = 32 * 1024
+
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+
+
+class ZipEntryWriter:
+    """
+    Escreve um ZIP de entrada única a partir de dados já comprimidos
+
+    O cabeçalho local usa data descriptor e extra ZIP64, então o tamanho
+    final não precisa ser conhecido antes de começar a escrever.
+    """
+
+    def __init__(
+        self,
+        fileobj: BinaryIO,
+        arcname: str,
+        method: int,
+        version_needed: int = _ZIP64_VERSION
+    ):
+        self._file = fileobj
+        self._method = method
+        self._version = max(version_needed, _ZIP64_VERSION)
+        self._name = arcname.replace(os.sep, "/").encode("utf-8")
+        self._flags = _FLAG_DATA_DESCRIPTOR
+        if not arcname.isascii():
+            self._flags |= _FLAG_UTF8
+
+        now = datetime.now()
+        self._dos_date = ((now.year - 1980) << 9) | (now.month << 5) | now.day
+        self._dos_time = (now.hour << 11) | (now.minute << 5) | (now.second // 2)
+
+        self._header_offset = self._file.tell()
+        self.compressed_size = 0
+        self._write_local_header()
+
+    def _write_local_header(self):
+        """Cabeçalho local com CRC/tamanhos zerados (vão no data descriptor)"""
+        extra = struct.pack("<HHQQ", 1, 16, 0, 0)
+        header = struct.pack(
+            "<4s2B4HL2L2H",
+            _LOCAL_HEADER_SIG, self._version, 0, self._flags, self._method,
+            self._dos_time, self._dos_date, 0, _ZIP64_LIMIT, _ZIP64_LIMIT,
+            len(self._name), len(extra)
+        )
+        self._file.write(header + self._name + extra)
+
+    def write_compressed(self, data: bytes):
+        """Escreve dados já comprimidos da entrada"""
+        self._file.write(data)
+        self.compressed_size += len(data)
+
+    def finish(self, crc: int, file_size: int, comment: bytes = b""):
+        """
+        Finaliza a entrada e escreve o diretório central
+
+        Args:
+            crc: CRC32 dos dados originais
+            file_size: Tamanho dos dados originais
+            comment: Comentário do arquivo ZIP (metadados)
+        """
+        self._file.write(struct.pack(
+            "<4sLQQ", _DATA_DESCRIPTOR_SIG, crc, self.compressed_size, file_size
+        ))
+
+        # Diretório central: campos que estouram 32 bits vão no extra ZIP64
+        zip64_fields = []
+        central_file_size = file_size
+        central_compressed = self.compressed_size
+        central_offset = self._header_offset
+        if file_size >= _ZIP64_LIMIT:
+            zip64_fields.append(file_size)
+            central_file_size = _ZIP64_LIMIT
+        if self.compressed_size >= _ZIP64_LIMIT:
+            zip64_fields.append(self.compressed_size)
+            central_compressed = _ZIP64_LIMIT
+        if self._header_offset >= _ZIP64_LIMIT:
+            zip64_fields.append(self._header_offset)
+            central_offset = _ZIP64_LIMIT
+
+        extra = b""
+        if zip64_fields:
+            extra = struct.pack(
+                f"<HH{len(zip64_fields)}Q", 1, 8 * len(zip64_fields), *zip64_fields
+            )
+
+        central_dir_offset = self._file.tell()
+        self._file.write(struct.pack(
+            "<4s4B4HL2L5H2L",
+            _CENTRAL_DIR_SIG, self._version, 0, self._version, 0,
+            self._flags, self._method, self._dos_time, self._dos_date,
+            crc, central_compressed, central_file_size,
+            len(self._name), len(extra), 0, 0, 0, 0, central_offset
+        ))
+        self._file.write(self._name + extra)
+        central_dir_size = self._file.tell() - central_dir_offset
+
+        comment = comment[:0xFFFF]
+        if central_dir_offset >= _ZIP64_LIMIT:
+            end64_offset = self._file.tell()
+            self._file.write(struct.pack(
+                "<4sQ2H2L4Q", _END_ARCHIVE64_SIG, 44, _ZIP64_VERSION,
+                _ZIP64_VERSION, 0, 0, 1, 1, central_dir_size, central_dir_offset
+            ))
+            self._file.write(struct.pack(
+                "<4sLQL", _END_ARCHIVE64_LOCATOR_SIG, 0, end64_offset, 1
+            ))
+            central_dir_offset = _ZIP64_LIMIT
+
+        self._file.write(struct.pack(
+            "<4s4H2LH", _END_ARCHIVE_SIG, 0, 0, 1, 1,
+            central_dir_size, central_dir_offset, len(comment)
+        ))
+        self._file.write(comment)
+
+
+def _deflate_block(data: bytes, level: int, zdict: bytes, final: bool) -> bytes:
+    """
+    Comprime um bloco como deflate bruto (executado no pool de threads)
+
+    Blocos intermediários terminam com Z_SYNC_FLUSH (alinhados em byte e
+    sem BFINAL), então a concatenação de todos forma um único stream
+    deflate válido. Apenas o último bloco usa Z_FINISH.
+    """
+    if zdict:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15, 8, zlib.Z_DEFAULT_STRATEGY, zdict)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    out = compressor.compress(data)
+    return out + compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class ParallelDeflateWriter:
+    """
+    Arquivo gravável que gera um ZIP com compressão DEFLATE paralela
+
+    Os dados recebidos são divididos em blocos de tamanho fixo e
+    comprimidos em um pool de threads (o zlib libera o GIL). Os blocos
+    são escritos na ordem original, formando um stream deflate padrão
+    que qualquer descompactador abre.
+
+    Usage:
+        with ParallelDeflateWriter("backup.zip", "backup.fbk", workers=4) as w:
+            w.write(dados)
+    """
+
+    def __init__(
+        self,
+        zip_path: str,
+        arcname: str,
+        level: int = 6,
+        workers: int = 0,
+        block_size: int = DEFAULT_BLOCK_SIZE
+    ):
+        self.level = level
+        self.workers = workers or os.cpu_count() or 1
+        self.block_size = max(block_size, _DEFLATE_WINDOW)
+        self.comment = b""
+
+        self._file = open(zip_path, "wb")
+        self._entry = ZipEntryWriter(self._file, arcname, ZIP_METHOD_DEFLATED)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.workers,
+            thread_name_prefix="deflate"
+        )
+        # Limita blocos em memória: no máximo 2 por worker aguardando escrita
+        self._pending: Deque[Future] = deque()
+        self._max_pending = self.workers * 2
+
+        self._buffer = bytearray()
+        self._zdict = b""
+        self._crc = 0
+        self.raw_size = 0
+        self._closed = False
+
+    def __enter__(self) -> "ParallelDeflateWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    @property
+    def compressed_size(self) -> int:
+        """Bytes comprimidos escritos até o momento"""
+        return self._entry.compressed_size
+
+    def write(self, data: bytes) -> int:
+        """Adiciona dados ao stream"""
+        if self._closed:
+            raise ValueError("Escrita em ParallelDeflateWriter fechado")
+
+        self._buffer += data
+        while len(self._buffer) >= self.block_size:
+            block = bytes(self._buffer[:self.block_size])
+            del self._buffer[:self.block_size]
+            self._submit(block, final=False)
+        return len(data)
+
+    def _submit(self, block: bytes, final: bool):
+        """Envia bloco para o pool respeitando o limite de pendentes"""
+        self._crc = zlib.crc32(block, self._crc)
+        self.raw_size += len(block)
+
+        future = self._executor.submit(_deflate_block, block, self.level, self._zdict, final)
+        self._pending.append(future)
+        self._zdict = block[-_DEFLATE_WINDOW:]
+
+        while len(self._pending) >= self._max_pending:
+            self._drain_one()
+
+    def _drain_one(self):
+        """Escreve o bloco mais antigo (mantém a ordem do stream)"""
+        future = self._pending.popleft()
+        self._entry.write_compressed(future.result())
+
+    def close(self):
+        """Comprime o restante e finaliza o ZIP"""
+        if self._closed:
+            return
+
+        try:
+            self._submit(bytes(self._buffer), final=True)
+            self._buffer = bytearray()
+            while self._pending:
+                self._drain_one()
+            self._entry.finish(self._crc, self.raw_size, self.comment)
+        finally:
+            self._closed = True
+            self._executor.shutdown(wait=True)
+            self._file.close()
+
+    def abort(self):
+        """Descarta o trabalho pendente sem finalizar o ZIP"""
+        if self._closed:
+            return
+        self._closed = True
+        for future in self._pending:
+            future.cancel()
+        self._pending.clear()
+        self._executor.shutdown(wait=True)
+        self._file.close()
+
+
+def compress_file_parallel(
+    source_path: str,
+    zip_path: str,
+    arcname: Optional[str] = None,
+    level: int = 6,
+    workers: int = 0,
+    block_size: int = DEFAULT_BLOCK_SIZE
+) -> Tuple[int, int]:
+    """
+    Compacta um arquivo para ZIP usando deflate paralelo
+
+    Returns:
+        Tuple[int, int]: (tamanho_original, tamanho_comprimido)
+    """
+    arcname = arcname or os.path.basename(source_path)
+    with ParallelDeflateWriter(zip_path, arcname, level, workers, block_size) as writer:
+        with open(source_path, "rb") as source:
+            for chunk in iter(lambda: source.read(block_size), b""):
+                writer.write(chunk)
+    return writer.raw_size, writer.compressed_size